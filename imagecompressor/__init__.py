@@ -0,0 +1 @@
+"""Image compression core shared by the GUI and batch workers"""
@@ -0,0 +1,288 @@
+import io
+import json
+import os
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+
+from .batch import VARIANTS_MANIFEST, _init_worker, count_result, default_worker_count, new_stats
+from .core import IMAGE_EXTENSIONS, atomic_output, compress, resolve_settings, write_output
+from .events import STARTED, FILE_DONE, FILE_FAILED, FILE_SKIPPED, FINISHED
+from .naming import NameCollision, OutputPlanner
+from .scan import _matches
+
+# Tar suffixes and the compression tarfile writes them with
+TAR_COMPRESSION = {
+    '.tar': '',
+    '.tar.gz': 'gz',
+    '.tgz': 'gz',
+    '.tar.bz2': 'bz2',
+    '.tbz2': 'bz2',
+    '.tar.xz': 'xz',
+    '.txz': 'xz'
+}
+
+ARCHIVE_SUFFIXES = ('.zip',) + tuple(TAR_COMPRESSION)
+
+# Member paths are planned as if they were below this folder, so the
+# 'mirror' layout keeps their folders; nothing is read or created there
+MEMBER_ROOT = os.path.abspath(os.sep)
+
+
+def is_archive(path):
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def member_path(name):
+    """Member name as a safe relative '/' path: no drive, leading '/', '.' or '..' parts"""
+    parts = name.replace('\\', '/').split('/')
+    return '/'.join(part for part in parts if part not in ('', '.', '..') and not part.endswith(':'))
+
+
+def _wanted(name, include, exclude):
+    if not name or os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+        return False
+    if include and not _matches(name, include):
+        return False
+    return not (exclude and _matches(name, exclude))
+
+
+def iter_members(path, include=None, exclude=None):
+    """Yield (name, data) for the image members of a zip or tar archive, in archive order.
+
+    Tar archives (plain, gzip, bzip2 or xz) are read as one forward stream,
+    so a compressed tarball is decompressed once and never seeks. Each
+    member's bytes are read into memory once and nothing is extracted to
+    disk. Names are made safe with member_path(); include / exclude globs
+    match them like scan.iter_images() matches relative paths.
+    """
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                name = member_path(info.filename)
+                if not info.is_dir() and _wanted(name, include, exclude):
+                    yield name, archive.read(info)
+        return
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            name = member_path(member.name)
+            if member.isfile() and _wanted(name, include, exclude):
+                yield name, archive.extractfile(member).read()
+
+
+@contextmanager
+def archive_writer(path):
+    """Create a zip or tar archive at path and yield write(name, data), which adds one member.
+
+    The archive is written under a temporary name and only moved to path
+    when the block ends without an error (see atomic_output). Zip members
+    are stored without deflate: the images are compressed already.
+    """
+    lower = path.lower()
+    with atomic_output(path) as temp_path:
+        if lower.endswith('.zip'):
+            with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_STORED) as archive:
+                def write(name, data):
+                    archive.writestr(zipfile.ZipInfo(name, time.localtime()[:6]), data)
+                yield write
+        else:
+            suffix = next(suffix for suffix in TAR_COMPRESSION if lower.endswith(suffix))
+            with tarfile.open(temp_path, 'w:' + TAR_COMPRESSION[suffix]) as archive:
+                def write(name, data):
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    info.mtime = time.time()
+                    info.mode = 0o644
+                    archive.addfile(info, io.BytesIO(data))
+                yield write
+
+
+def _compress_member(index, name, data, output_path, settings):
+    """Worker entry point: (result, [(path, data), ...]); never raises"""
+    outputs = []
+    try:
+        result = compress(io.BytesIO(data), output_path, settings,
+                          write=lambda path, encoded: outputs.append((path, encoded)), input_name=name)
+        result['index'] = index
+        result['error'] = None
+        return result, outputs
+    except Exception as e:
+        return {'index': index, 'input_path': name, 'error': str(e)}, []
+
+
+class ArchiveCompressor:
+    """Compresses in-memory inputs, such as archive members, into an archive or a folder.
+
+    run() takes (name, data) pairs, e.g. from iter_members(); name is a
+    relative '/' path that stands in for the input path. Inputs are read
+    and compressed one by one, with at most two per worker in flight, so
+    archives bigger than memory stream through. If output ends in an
+    archive suffix (see is_archive) the outputs become its members,
+    otherwise files under the output folder. Either way each encoded file
+    is written once, straight from the worker's bytes.
+
+    Output names follow the naming settings like a batch, with the folders
+    in the input names as the 'mirror' structure; results then carry the
+    member names (or file paths) as 'output_path'. Outputs are written by
+    the calling process as workers finish; with the 'overwrite' policy an
+    archive gets both members and extractors keep the later one. Events,
+    JobControl and progress_callback work as in BatchCompressor. There is
+    no manifest, journal or dedupe: inputs have no file on disk to compare
+    against.
+    """
+
+    def __init__(self, output, settings, workers=None, events=None, control=None):
+        self.output = output
+        self.to_archive = is_archive(output)
+        self.settings = resolve_settings(settings)
+        if self.to_archive:
+            self.planner = OutputPlanner(MEMBER_ROOT, self.settings, [MEMBER_ROOT], create_folders=False)
+        else:
+            self.planner = OutputPlanner(output, self.settings, [MEMBER_ROOT])
+        self.workers = max(1, int(workers or self.settings.get('workers') or default_worker_count()))
+        self.events = events
+        self.control = control
+
+    def run(self, sources, progress_callback=None):
+        """Compress every (name, data) of sources and return the results in input order"""
+        started = time.monotonic()
+        results = {}
+        stats = new_stats()
+        self._emit(STARTED, total=None, workers=self.workers)
+        if self.to_archive:
+            folder = os.path.dirname(os.path.abspath(self.output))
+            os.makedirs(folder, exist_ok=True)
+            with archive_writer(self.output) as write:
+                self._run(sources, self._finisher(results, stats, write, progress_callback))
+                self._write_variants(results, write)
+        else:
+            self._run(sources, self._finisher(results, stats, write_output, progress_callback))
+            self._write_variants(results, write_output)
+        cancelled = bool(self.control and self.control.cancelled)
+        self._emit(FINISHED, elapsed=time.monotonic() - started, cancelled=cancelled, **stats)
+        return [results[index] for index in sorted(results)]
+
+    def _write_variants(self, results, write):
+        """Write variants.json (input name -> its variants) next to the outputs"""
+        entries = {}
+        for result in results.values():
+            if result.get('variants'):
+                entries[result['input_path']] = [
+                    dict(variant, output_path=variant['output_path'] if self.to_archive
+                         else os.path.relpath(variant['output_path'], self.output))
+                    for variant in result['variants']
+                ]
+        if entries:
+            path = VARIANTS_MANIFEST if self.to_archive else os.path.join(self.output, VARIANTS_MANIFEST)
+            write(path, json.dumps(entries, indent=2, sort_keys=True).encode('utf-8'))
+
+    def _emit(self, kind, **data):
+        if self.events:
+            self.events.emit(kind, **data)
+
+    def _name(self, path):
+        """Archive member name for a planned path"""
+        return os.path.relpath(path, MEMBER_ROOT).replace(os.sep, '/') if self.to_archive else path
+
+    def _finisher(self, results, stats, write, progress_callback):
+        def finish(outcome):
+            result, outputs = outcome
+            try:
+                for path, data in outputs:
+                    write(self._name(path), data)
+            except Exception as e:
+                result = {'index': result['index'], 'input_path': result['input_path'], 'error': str(e)}
+            if not result['error']:
+                result['output_path'] = self._name(result['output_path'])
+                for variant in result.get('variants', []):
+                    variant['output_path'] = self._name(variant['output_path'])
+            results[result['index']] = result
+            stats['processed'] += 1
+            if result['error']:
+                stats['failed'] += 1
+                self._emit(FILE_FAILED, index=result['index'], processed=stats['processed'], total=None,
+                           input_path=result['input_path'], error=result['error'])
+            elif result.get('skipped'):
+                stats['skipped'] += 1
+                self._emit(FILE_SKIPPED, index=result['index'], processed=stats['processed'], total=None,
+                           input_path=result['input_path'], reason=result['skipped'])
+            else:
+                count_result(stats, result, True)
+                self._emit(FILE_DONE, index=result['index'], processed=stats['processed'], total=None,
+                           result=result)
+            if progress_callback:
+                progress_callback(stats['processed'], None, result)
+        return finish
+
+    def _plan(self, index, name):
+        """Output path for input name, or the result of a name collision"""
+        try:
+            output_path = self.planner.reserve(os.path.join(MEMBER_ROOT, *name.split('/')))
+            if not self.to_archive:
+                self.planner.check_existing(output_path)
+            return output_path, None
+        except NameCollision as e:
+            if self.planner.policy == 'skip':
+                return None, {'index': index, 'input_path': name, 'output_path': self._name(e.output_path),
+                              'error': None, 'skipped': str(e)}
+            return None, {'index': index, 'input_path': name, 'error': str(e)}
+
+    def _proceed(self, idle=None):
+        if not self.control:
+            return True
+        while not self.control.wait_while_paused(0.1):
+            if idle:
+                idle()
+        return not self.control.cancelled
+
+    def _run(self, sources, finish):
+        if self.workers == 1:
+            for index, (name, data) in enumerate(sources):
+                if not self._proceed():
+                    break
+                output_path, settled = self._plan(index, name)
+                finish((settled, []) if settled else _compress_member(index, name, data, output_path,
+                                                                      self.settings))
+            return
+
+        # Inputs are held in memory until their worker is done, so only
+        # a couple per worker are read ahead
+        max_in_flight = self.workers * 2
+        pending = {}
+
+        def collect(timeout=None):
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, name = pending.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    # A worker died (e.g. killed by the OOM killer)
+                    outcome = ({'index': index, 'input_path': name, 'error': str(e)}, [])
+                finish(outcome)
+
+        def idle():
+            if pending:
+                collect(timeout=0)
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as executor:
+            for index, (name, data) in enumerate(sources):
+                if not self._proceed(idle):
+                    break
+                output_path, settled = self._plan(index, name)
+                if settled:
+                    finish((settled, []))
+                    continue
+                if len(pending) >= max_in_flight:
+                    collect()
+                future = executor.submit(_compress_member, index, name, data, output_path, self.settings)
+                pending[future] = (index, name)
+
+            if self.control and self.control.cancelled:
+                for future in list(pending):
+                    if future.cancel():
+                        pending.pop(future)
+            while pending:
+                collect()
@@ -0,0 +1,450 @@
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from .core import (atomic_output, compress, estimate_file_memory, memory_budget_bytes, resolve_settings,
+                   variant_path)
+from .dedupe import find_duplicates, link_output
+from .events import STARTED, FILE_DONE, FILE_FAILED, FILE_SKIPPED, FINISHED, LOG
+from .naming import NameCollision, OutputPlanner
+
+
+# Written to the output directory when variants are enabled
+VARIANTS_MANIFEST = 'variants.json'
+
+
+def update_variants_manifest(output_dir, results):
+    """Merge the variants of results into output_dir/variants.json.
+
+    The file maps each input path to its variants ('output_path' relative to
+    output_dir, 'target_width', 'width', 'height', 'format',
+    'compressed_size'). Entries of
+    inputs not in results (e.g. cached ones) are kept from earlier runs.
+    """
+    path = os.path.join(output_dir, VARIANTS_MANIFEST)
+    try:
+        with open(path, 'r') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+    for result in results:
+        if result.get('variants'):
+            entries[os.path.abspath(result['input_path'])] = [
+                dict(variant, output_path=os.path.relpath(variant['output_path'], output_dir))
+                for variant in result['variants']
+            ]
+    with atomic_output(path) as temp_path:
+        with open(temp_path, 'w') as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+
+
+def default_worker_count():
+    return os.cpu_count() or 1
+
+
+def new_stats():
+    """Zeroed batch totals, as reported in the 'finished' event"""
+    return {'processed': 0, 'failed': 0, 'cached': 0, 'resumed': 0, 'skipped': 0,
+            'original_bytes': 0, 'compressed_bytes': 0, 'format_wins': {}, 'saved_vs_auto': 0,
+            'duplicates': 0, 'duplicate_bytes': 0, 'linked_bytes': 0, 'metadata_removed': 0,
+            'lossless_files': 0, 'lossless_saved': 0, 'lossless_copied': 0, 'lossless_no_jpegtran': 0,
+            'png_files': 0, 'png_palette': 0, 'png_strategies': {}}
+
+
+def count_result(stats, result, fresh):
+    """Add a successful result to stats; fresh is False for cached and resumed ones"""
+    stats['cached'] += 1 if result.get('cached') else 0
+    stats['resumed'] += 1 if result.get('resumed') else 0
+    stats['original_bytes'] += result['original_size']
+    stats['compressed_bytes'] += result['compressed_size']
+    if not fresh:
+        return
+    if 'candidates' in result:
+        # Format 'smallest': which format won, and by how much
+        stats['format_wins'][result['format']] = stats['format_wins'].get(result['format'], 0) + 1
+        stats['saved_vs_auto'] += result.get('saved_vs_auto', 0)
+    stats['metadata_removed'] += result.get('metadata_removed', 0)
+    if result.get('lossless'):
+        # Kept apart from the lossy savings, which trade quality for size
+        stats['lossless_files'] += 1
+        stats['lossless_saved'] += result['original_size'] - result['compressed_size']
+        stats['lossless_copied'] += result['lossless'] == 'copied'
+        stats['lossless_no_jpegtran'] += bool(result.get('jpegtran_missing'))
+    if result.get('png'):
+        strategy = result['png']['strategy']
+        stats['png_files'] += 1
+        stats['png_palette'] += result['png']['mode'] == 'P'
+        stats['png_strategies'][strategy] = stats['png_strategies'].get(strategy, 0) + 1
+
+
+def _init_worker():
+    # Ctrl+C is handled by the parent (it cancels the batch); workers just
+    # finish the file they are on
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _compress_task(index, input_path, output_path, settings):
+    """Worker entry point; never raises so errors travel back as data"""
+    try:
+        result = compress(input_path, output_path, settings)
+        result['index'] = index
+        result['error'] = None
+        return result
+    except Exception as e:
+        return {
+            'index': index,
+            'input_path': input_path,
+            'error': str(e)
+        }
+
+
+class MemoryBudget:
+    """Admits jobs while their estimated memory fits a shared byte budget.
+
+    A job bigger than the whole budget is still admitted once nothing else
+    is running, so it runs alone rather than never.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.running = 0
+
+    def fits(self, cost):
+        return self.running == 0 or self.used + cost <= self.limit
+
+    def acquire(self, cost):
+        self.used += cost
+        self.running += 1
+
+    def release(self, cost):
+        self.used -= cost
+        self.running -= 1
+
+
+class BatchCompressor:
+    """Runs compress over many files on a process pool.
+
+    Output paths are assigned by an OutputPlanner in the calling process
+    before any file is handed out (all at once when the input has a length,
+    otherwise as files arrive), so workers never write to the same path;
+    only that path and the plain settings dict are sent to the workers.
+    With the 'mirror' layout, roots are the scanned folders whose structure
+    is recreated under output_dir. Files left out by the collision policy
+    'skip' get result['skipped'] with the reason. Results are returned in
+    input order; progress_callback is called in the calling thread as each
+    file finishes.
+
+    With a Manifest, unchanged files are answered from it (result['cached']
+    is True) without being sent to a worker. With an EventBus, started /
+    file_done / file_failed / finished events are emitted as the batch runs.
+
+    With a JobControl the batch can be paused (no new files are started;
+    files already handed to workers finish) and cancelled. With an opened
+    Journal every finished file is appended to it, files finished by an
+    interrupted earlier run are skipped (result['resumed'] is True), and
+    the journal is removed once the batch completes without being cancelled.
+
+    With settings['memory_budget_mb'] set, each file's peak memory is
+    estimated from its header before it is handed out, and files are only
+    started while the estimates of everything in flight fit the budget.
+
+    With settings['dedupe'] ('exact' or 'near') the input is first grouped
+    into duplicates (see dedupe.find_duplicates); only one file per group
+    is compressed and the others get a hard link (or copy) of its output,
+    with result['duplicate_of'] naming the file that was compressed. This
+    needs the whole input up front, so a growing iterable is read to the
+    end before compression starts.
+    """
+
+    def __init__(self, output_dir, settings, workers=None, manifest=None, events=None,
+                 journal=None, control=None, roots=None):
+        self.output_dir = output_dir
+        self.settings = resolve_settings(settings)
+        self.planner = OutputPlanner(output_dir, self.settings, roots)
+        self.workers = max(1, int(workers or settings.get('workers') or default_worker_count()))
+        self.manifest = manifest
+        self.events = events
+        self.journal = journal
+        self.control = control
+
+    def run(self, input_files, progress_callback=None):
+        """Compress every file and return the results in input order.
+
+        input_files may be any iterable, including one that is still
+        growing (see FileList.iter_growing); None items are idle ticks that
+        only give finished results a chance to be reported. progress_callback
+        gets (processed, total, result) where total is None for iterables
+        without a length.
+        """
+        started = time.monotonic()
+        copies = {}
+        if self.settings.get('dedupe', 'off') != 'off':
+            input_files = [path for path in input_files if path is not None]
+            duplicates = find_duplicates(input_files, self.settings['dedupe'], self.settings['near_distance'])
+            for index, input_path in enumerate(input_files):
+                if input_path in duplicates:
+                    copies.setdefault(duplicates[input_path], []).append((index, input_path))
+            if duplicates:
+                self._emit(LOG, message=f"Found {len(duplicates)} duplicate(s) of {len(copies)} image(s); "
+                                        f"each is compressed once")
+
+        try:
+            total = len(input_files)
+        except TypeError:
+            total = None
+        results = {}
+        stats = new_stats()
+        self._emit(STARTED, total=total, workers=self.workers)
+
+        def finish(result):
+            fresh = not (result['error'] or result.get('cached') or result.get('resumed')
+                         or result.get('skipped'))
+            if self.manifest and fresh:
+                try:
+                    self.manifest.record(result)
+                except Exception:
+                    # The output is fine; it just gets recompressed next time
+                    pass
+            if self.journal and fresh:
+                try:
+                    self.journal.record(result)
+                except Exception as e:
+                    # The output is fine; it just isn't skipped if this run is resumed
+                    self._emit(LOG, message=f"Could not add {result['input_path']} to the resume journal: {e}")
+            results[result['index']] = result
+            stats['processed'] += 1
+            if result['error']:
+                stats['failed'] += 1
+                self._emit(FILE_FAILED, index=result['index'], processed=stats['processed'], total=total,
+                           input_path=result['input_path'], error=result['error'])
+            elif result.get('skipped'):
+                stats['skipped'] += 1
+                self._emit(FILE_SKIPPED, index=result['index'], processed=stats['processed'], total=total,
+                           input_path=result['input_path'], reason=result['skipped'])
+            else:
+                count_result(stats, result, fresh)
+                self._emit(FILE_DONE, index=result['index'], processed=stats['processed'], total=total,
+                           result=result)
+            if progress_callback:
+                progress_callback(stats['processed'], total, result)
+
+            for index, input_path in copies.pop(result['input_path'], []):
+                copy = self._duplicate_result(result, index, input_path, planned[index])
+                if not copy['error'] and not copy.get('skipped'):
+                    stats['duplicates'] += 1
+                    stats['duplicate_bytes'] += copy['original_size']
+                    if copy['linked'] == 'hardlink':
+                        stats['linked_bytes'] += copy['compressed_size']
+                finish(copy)
+
+        # Duplicates get their result when their original finishes
+        duplicate_indices = {index for group in copies.values() for index, _ in group}
+
+        # Output path (or the NameCollision) per input index
+        planned = {}
+
+        def plan(index, input_path):
+            try:
+                planned[index] = self.planner.reserve(input_path)
+            except NameCollision as e:
+                planned[index] = e
+
+        if total is not None:
+            for index, input_path in enumerate(path for path in input_files if path is not None):
+                plan(index, input_path)
+
+        def numbered():
+            index = 0
+            for input_path in input_files:
+                if input_path is None:
+                    yield None, None, None
+                    continue
+                if index not in planned:
+                    plan(index, input_path)
+                if index not in duplicate_indices:
+                    yield index, input_path, planned[index]
+                index += 1
+
+        if self.workers == 1 or (total is not None and total <= 1):
+            # No point paying for process start-up
+            self._run_inline(numbered(), finish)
+        else:
+            self._run_pool(numbered(), total, finish)
+
+        cancelled = bool(self.control and self.control.cancelled)
+        if self.journal and not cancelled:
+            self.journal.finish()
+        ordered = [results[index] for index in sorted(results)]
+        if self.settings.get('variant_widths'):
+            try:
+                update_variants_manifest(self.output_dir, ordered)
+            except Exception as e:
+                self._emit(LOG, message=f"Could not write {VARIANTS_MANIFEST}: {e}")
+        self._emit(FINISHED, elapsed=time.monotonic() - started, cancelled=cancelled, **stats)
+        return ordered
+
+    def _proceed(self, idle=None):
+        """Wait out a pause (calling idle() meanwhile); False once cancelled"""
+        if not self.control:
+            return True
+        while not self.control.wait_while_paused(0.1):
+            if idle:
+                idle()
+        return not self.control.cancelled
+
+    def _run_inline(self, inputs, finish):
+        for index, input_path, output_path in inputs:
+            if not self._proceed():
+                break
+            if input_path is None:
+                continue
+            settled = self._settle(index, input_path, output_path)
+            finish(settled or _compress_task(index, input_path, output_path, self.settings))
+
+    def _run_pool(self, inputs, total, finish):
+        # Keep a bounded number of tasks in flight so huge batches don't
+        # queue every argument tuple up front
+        max_in_flight = self.workers * 4
+        pending = {}
+        limit = memory_budget_bytes(self.settings)
+        budget = MemoryBudget(limit) if limit else None
+
+        def collect(timeout=None):
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, input_path, output_path, cost = pending.pop(future)
+                if budget:
+                    budget.release(cost)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # A worker died (e.g. killed by the OOM killer)
+                    result = {'index': index, 'input_path': input_path, 'error': str(e)}
+                finish(result)
+
+        def idle():
+            if pending:
+                collect(timeout=0)
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, total or self.workers),
+                                 initializer=_init_worker) as executor:
+            for index, input_path, output_path in inputs:
+                if not self._proceed(idle):
+                    break
+                if input_path is None:
+                    if pending:
+                        collect(timeout=0)
+                    continue
+                settled = self._settle(index, input_path, output_path)
+                if settled:
+                    finish(settled)
+                    continue
+                if len(pending) >= max_in_flight:
+                    collect()
+                # With the 'overwrite' policy two inputs can share an output;
+                # the later one waits so the writes can't interleave
+                while any(entry[2] == output_path for entry in pending.values()):
+                    collect()
+                cost = 0
+                if budget:
+                    # Queued files count too: they start as soon as a worker frees up
+                    cost = estimate_file_memory(input_path, self.settings)
+                    while not budget.fits(cost):
+                        collect()
+                    budget.acquire(cost)
+                future = executor.submit(_compress_task, index, input_path, output_path, self.settings)
+                pending[future] = (index, input_path, output_path, cost)
+
+            if self.control and self.control.cancelled:
+                # Drop files that were queued but never started
+                for future in list(pending):
+                    if future.cancel():
+                        cost = pending.pop(future)[3]
+                        if budget:
+                            budget.release(cost)
+            while pending:
+                collect()
+
+    def _duplicate_result(self, original, index, input_path, output_path):
+        """Result for a duplicate, sharing the output of the file it duplicates"""
+        if original['error'] or original.get('skipped'):
+            reason = original['error'] or 'was skipped'
+            return {'index': index, 'input_path': input_path,
+                    'error': f"Duplicate of {original['input_path']}, which failed: {reason}"}
+        if isinstance(output_path, NameCollision):
+            return self._collision_result(index, input_path, output_path)
+        try:
+            self.planner.check_existing(output_path)
+        except NameCollision as e:
+            return self._collision_result(index, input_path, e)
+        variants = None
+        try:
+            if original.get('variants'):
+                variants = [dict(variant, output_path=variant_path(output_path, variant['target_width'],
+                                                                   variant['format']))
+                            for variant in original['variants']]
+                for variant, source in zip(variants, original['variants']):
+                    method = link_output(source['output_path'], variant['output_path'])
+                output_path = variants[0]['output_path']
+            else:
+                # 'smallest' only settles the extension once the original is encoded
+                output_path = os.path.splitext(output_path)[0] + os.path.splitext(original['output_path'])[1]
+                method = link_output(original['output_path'], output_path)
+            original_size = os.path.getsize(input_path)
+        except Exception as e:
+            return {'index': index, 'input_path': input_path, 'error': str(e)}
+        result = {key: value for key, value in original.items()
+                  if key not in ('cached', 'resumed', 'timings', 'candidates', 'saved_vs_auto',
+                                 'metadata_removed')}
+        result.update({
+            'index': index,
+            'input_path': input_path,
+            'output_path': output_path,
+            'original_size': original_size,
+            'duplicate_of': original['input_path'],
+            'linked': method
+        })
+        if variants:
+            result['variants'] = variants
+        return result
+
+    def _emit(self, kind, **data):
+        if self.events:
+            self.events.emit(kind, **data)
+
+    def _collision_result(self, index, input_path, collision):
+        if self.planner.policy == 'skip':
+            return {'index': index, 'input_path': input_path, 'output_path': collision.output_path,
+                    'error': None, 'skipped': str(collision)}
+        return {'index': index, 'input_path': input_path, 'error': str(collision)}
+
+    def _settle(self, index, input_path, output_path):
+        """Result for a file that needs no compressing (cached, resumed or a name collision), else None"""
+        if isinstance(output_path, NameCollision):
+            return self._collision_result(index, input_path, output_path)
+        found = self._lookup(index, input_path)
+        # An output recorded under another name belongs to an earlier naming
+        if found and self.planner.claims(output_path, found['output_path']):
+            return found
+        try:
+            self.planner.check_existing(output_path)
+        except NameCollision as e:
+            return self._collision_result(index, input_path, e)
+        return None
+
+    def _lookup(self, index, input_path):
+        """Result from the manifest or the resume journal, if the file can be skipped"""
+        found = None
+        try:
+            if self.manifest:
+                found = self.manifest.lookup(input_path)
+            if not found and self.journal:
+                found = self.journal.lookup(input_path)
+        except Exception:
+            return None
+        if found:
+            found['index'] = index
+        return found
@@ -0,0 +1,231 @@
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from .core import compress, resolve_settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCHMARK_VERSION = 1
+
+# (kind, file name, size, format) of the synthetic corpus at scale 1.0
+CORPUS = [
+    ('photo', 'photo_1.jpg', (6000, 4000), 'JPEG'),
+    ('photo', 'photo_2.jpg', (4000, 3000), 'JPEG'),
+    ('screenshot', 'screenshot_1.png', (2560, 1440), 'PNG'),
+    ('screenshot', 'screenshot_2.png', (1920, 1080), 'PNG'),
+    ('alpha', 'alpha_1.png', (2048, 2048), 'PNG'),
+    ('huge', 'huge_1.tiff', (12000, 8000), 'TIFF'),
+]
+
+# Default settings matrix: the knobs whose cost we want to compare
+DEFAULT_MATRIX = {
+    'resample_method': ['LANCZOS', 'BILINEAR'],
+    'optimize': [True, False],
+    'progressive': [False, True],
+    'format': ['auto', 'WEBP'],
+}
+
+STAGES = ['decode', 'resize', 'encode', 'total']
+
+
+def _noise(rng, size, mode='L'):
+    bands = len(mode)
+    return Image.frombytes(mode, size, rng.randbytes(size[0] * size[1] * bands))
+
+
+def _photo(rng, size):
+    """Smooth multi-scale texture with grain, roughly like a camera photo"""
+    width, height = size
+    img = None
+    for divisor, weight in ((256, 0.5), (32, 0.3), (4, 0.2)):
+        layer = _noise(rng, (max(2, width // divisor), max(2, height // divisor)), 'RGB')
+        layer = layer.resize(size, Image.Resampling.BICUBIC)
+        img = layer if img is None else Image.blend(img, layer, weight)
+    grain = _noise(rng, size, 'RGB').filter(ImageFilter.GaussianBlur(0.6))
+    return Image.blend(img, grain, 0.08)
+
+
+def _screenshot(rng, size):
+    """Flat UI-like blocks and text on a light background"""
+    img = Image.new('RGB', size, (245, 245, 245))
+    draw = ImageDraw.Draw(img)
+    width, height = size
+    for i in range(width * height // 20000):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randrange(20, 400), rng.randrange(10, 80)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle([x, y, x + w, y + h], fill=color)
+        draw.text((x + 4, y + 2), f"Item {i} - lorem ipsum", fill=(20, 20, 20))
+    return img
+
+
+def _alpha(rng, size):
+    """RGBA image with a soft alpha mask"""
+    rgb = _photo(rng, size)
+    mask = Image.radial_gradient('L').resize(size, Image.Resampling.BICUBIC)
+    mask = Image.eval(mask, lambda value: 255 - value)
+    rgb.putalpha(mask)
+    return rgb
+
+
+GENERATORS = {'photo': _photo, 'screenshot': _screenshot, 'alpha': _alpha, 'huge': _photo}
+
+
+def generate_corpus(directory, seed=0, scale=1.0):
+    """Write the synthetic corpus to directory (skipping files that exist); returns the paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for number, (kind, name, size, fmt) in enumerate(CORPUS):
+        path = os.path.join(directory, name)
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+        scaled = (max(16, int(size[0] * scale)), max(16, int(size[1] * scale)))
+        # Each file gets its own stream so changing one doesn't shift the rest
+        rng = random.Random(f"{seed}:{number}:{name}")
+        img = GENERATORS[kind](rng, scaled)
+        save_kwargs = {'quality': 92} if fmt == 'JPEG' else {}
+        img.save(path, format=fmt, **save_kwargs)
+    return paths
+
+
+def expand_matrix(matrix):
+    """Cartesian product of a {setting: [values]} dict as a list of settings overrides"""
+    keys = list(matrix)
+    return [dict(zip(keys, values)) for values in itertools.product(*(matrix[key] for key in keys))]
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[position]
+
+
+def peak_rss_bytes():
+    """Peak resident memory of this process so far (it never goes down)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def time_pipeline(input_path, settings):
+    """Run compress() once with profiling, keeping the output in memory; returns stage seconds and bytes"""
+    result = compress(input_path, os.path.basename(input_path), dict(settings, profile=True),
+                      write=lambda path, data: None)
+    timings = {stage: result['timings'].get(stage, {}).get('wall', 0.0) for stage in STAGES}
+    return timings, result['compressed_size']
+
+
+def run_configuration(paths, settings, repeat):
+    """Time every path repeat times; returns (stage times, output bytes, seconds, peak RSS)"""
+    stage_times = {stage: [] for stage in STAGES}
+    output_bytes = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            timings, size = time_pipeline(path, settings)
+            for stage in STAGES:
+                stage_times[stage].append(timings[stage])
+            output_bytes += size
+    return stage_times, output_bytes, time.perf_counter() - started, peak_rss_bytes()
+
+
+def run_benchmark(paths, matrix=None, base_settings=None, repeat=1, progress=None):
+    """Time compress() for every settings combination; returns a JSON-ready dict.
+
+    Each combination runs in a fresh process, so its peak RSS is its own
+    rather than the highest of all combinations so far.
+    """
+    base_settings = resolve_settings(base_settings)
+    matrix = matrix or DEFAULT_MATRIX
+    input_bytes = sum(os.path.getsize(path) for path in paths)
+    runs = []
+
+    context = multiprocessing.get_context('spawn')
+    for overrides in expand_matrix(matrix):
+        settings = dict(base_settings, **overrides)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            stage_times, output_bytes, elapsed, peak_rss = executor.submit(
+                run_configuration, paths, settings, repeat).result()
+        images = len(paths) * repeat
+
+        run = {
+            'settings': overrides,
+            'images': images,
+            'seconds': elapsed,
+            'images_per_second': images / elapsed if elapsed else 0.0,
+            'mb_per_second': input_bytes * repeat / elapsed / (1024 * 1024) if elapsed else 0.0,
+            'output_bytes': output_bytes // repeat,
+            'stages': {
+                stage: {'p50': _percentile(times, 0.5), 'p95': _percentile(times, 0.95)}
+                for stage, times in stage_times.items()
+            },
+            'peak_rss_bytes': peak_rss
+        }
+        runs.append(run)
+        if progress:
+            progress(run)
+
+    return {
+        'version': BENCHMARK_VERSION,
+        'python': sys.version.split()[0],
+        'pillow': Image.__version__,
+        'platform': sys.platform,
+        'cpu_count': os.cpu_count(),
+        'input_files': [os.path.basename(path) for path in paths],
+        'input_bytes': input_bytes,
+        'base_settings': {key: value for key, value in base_settings.items() if key not in matrix},
+        'runs': runs
+    }
+
+
+def settings_key(settings):
+    return json.dumps(settings, sort_keys=True)
+
+
+def compare(report, baseline):
+    """Per-configuration ratios against a baseline report (current / baseline)"""
+    previous = {settings_key(run['settings']): run for run in baseline.get('runs', [])}
+    comparison = []
+    for run in report['runs']:
+        old = previous.get(settings_key(run['settings']))
+        if not old:
+            continue
+        comparison.append({
+            'settings': run['settings'],
+            'speed_ratio': run['images_per_second'] / old['images_per_second'] if old['images_per_second'] else None,
+            'size_ratio': run['output_bytes'] / old['output_bytes'] if old['output_bytes'] else None,
+        })
+    return comparison
+
+
+def format_run(run):
+    settings = ", ".join(f"{key}={value}" for key, value in run['settings'].items())
+    stages = "  ".join(
+        f"{stage} {run['stages'][stage]['p50'] * 1000:.0f}/{run['stages'][stage]['p95'] * 1000:.0f}ms"
+        for stage in STAGES
+    )
+    rss = run['peak_rss_bytes']
+    rss_text = f"  peak RSS {rss / (1024 * 1024):.0f} MB" if rss else ""
+    return (f"{settings}\n    {run['images_per_second']:.2f} img/s  {run['mb_per_second']:.1f} MB/s  "
+            f"out {run['output_bytes'] / 1024:.0f} KB{rss_text}\n    p50/p95: {stages}")
+
+
+def default_corpus_dir(seed, scale):
+    return os.path.join(tempfile.gettempdir(), f"imagecompressor-bench-v{BENCHMARK_VERSION}-{seed}-{scale:g}")
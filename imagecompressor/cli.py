@@ -0,0 +1,656 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+
+from .core import (DEFAULT_SETTINGS, RESAMPLE_METHODS, SETTINGS_FILE, check_variants, compress_single_image,
+                   describe_format_wins, describe_lossless, describe_png_search, format_size, resolve_settings)
+from .batch import BatchCompressor
+from .archive import ArchiveCompressor, is_archive, iter_members
+from .manifest import Manifest
+from .scan import iter_images
+from .events import EventBus, FINISHED, FILE_DONE, FILE_FAILED, FILE_SKIPPED, LOG
+from .dedupe import DEDUPE_MODES, describe_duplicates
+from .naming import COLLISION_POLICIES, OUTPUT_LAYOUTS, check_template
+from .job import JobControl, Journal
+from .profiling import ProfileReport, run_cprofile
+from . import benchmark
+from . import jobqueue
+from . import watch
+
+
+def add_bool_flag(parser, name, help_text):
+    """Add a --name / --no-name pair that defaults to None (= not given)"""
+    dest = name.replace('-', '_')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(f"--{name}", dest=dest, action='store_true', default=None, help=help_text)
+    group.add_argument(f"--no-{name}", dest=dest, action='store_false', default=None)
+
+
+def comma_list(item_type):
+    """argparse type for comma separated values, e.g. --variants 320,640"""
+    def parse(text):
+        try:
+            return [item_type(item.strip()) for item in text.split(',') if item.strip()]
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid list: {text!r}")
+    return parse
+
+
+def add_settings_arguments(parser):
+    """Options mirroring the keys of get_compression_settings()"""
+    parser.add_argument('--settings', metavar='FILE',
+                        help="Load settings from a JSON file (e.g. compression_settings.json)")
+    parser.add_argument('-q', '--quality', type=int, help="JPEG/WebP quality (1-100)")
+    parser.add_argument('--max-width', type=int, help="Maximum output width")
+    parser.add_argument('--max-height', type=int, help="Maximum output height")
+    parser.add_argument('--target-size', dest='target_size_kb', type=int, metavar='KB',
+                        help="Largest output size for JPEG/WebP; quality is searched down from --quality")
+    parser.add_argument('--resample', dest='resample_method', choices=list(RESAMPLE_METHODS),
+                        help="Resampling method")
+    parser.add_argument('-f', '--format', choices=['auto', 'smallest', 'JPEG', 'PNG', 'WEBP'],
+                        help="Output format ('auto' keeps the input format, 'smallest' encodes JPEG, "
+                             "WebP and PNG and keeps the smallest)")
+    parser.add_argument('--min-ssim', type=float, metavar='SCORE',
+                        help="Perceptual mode for JPEG/WebP: use the lowest quality (up to --quality) whose "
+                             "SSIM stays at or above SCORE, e.g. 0.95 (needs NumPy)")
+    parser.add_argument('--min-psnr', type=float, metavar='DB',
+                        help="With --format smallest, reject lossy candidates below this PSNR")
+    parser.add_argument('--dedupe', choices=DEDUPE_MODES,
+                        help="Compress duplicate inputs once and hard-link (or copy) the output for the "
+                             "others: 'exact' compares contents, 'near' also perceptual hashes")
+    parser.add_argument('--near-distance', type=int, metavar='BITS',
+                        help=f"With --dedupe near, the largest perceptual hash difference treated as the "
+                             f"same image (default: {DEFAULT_SETTINGS['near_distance']})")
+    parser.add_argument('--layout', dest='output_layout', choices=OUTPUT_LAYOUTS,
+                        help="'mirror' recreates the folder structure of directory inputs under the output "
+                             "directory (default: 'flat')")
+    parser.add_argument('--name-template', metavar='TEMPLATE',
+                        help="Output file name with {stem}, {ext}, {format}, {parent} and {quality} fields, "
+                             f"ending in {{ext}} (default: {DEFAULT_SETTINGS['name_template']})")
+    parser.add_argument('--on-collision', dest='collision', choices=COLLISION_POLICIES,
+                        help="When two inputs map to the same output name: number the later one ('suffix', "
+                             "default), let it replace the earlier one, or skip / fail it; 'skip' and "
+                             "'fail' also never replace existing files")
+    parser.add_argument('--variants', dest='variant_widths', type=comma_list(int), metavar='W1,W2,...',
+                        help="Write every image at each of these widths (e.g. 320,640,1280,1920) from one "
+                             "decode, as <name>-<width>w<ext>, plus variants.json; replaces the size limits")
+    parser.add_argument('--variant-formats', type=comma_list(str.upper), metavar='FMT,...',
+                        help="Formats of each variant, e.g. JPEG,WEBP (default: --format)")
+    add_bool_flag(parser, 'optimize', "Enable encoder optimizations")
+    add_bool_flag(parser, 'progressive', "Write progressive JPEGs")
+    add_bool_flag(parser, 'jpeg-lossless',
+                  "Rewrite JPEGs that need no resizing without re-encoding them: metadata is stripped and, "
+                  "with jpegtran installed, Huffman tables are optimized (default: off)")
+    add_bool_flag(parser, 'png-optimize',
+                  "Search palette / grayscale pixel formats and zlib settings for the smallest lossless "
+                  "PNG (default: on)")
+    parser.add_argument('--png-quantize', type=float, metavar='DB',
+                        help="Also allow PNGs a lossy palette of up to 256 colors that keeps at least this "
+                             "PSNR, e.g. 40 (default: off)")
+    add_bool_flag(parser, 'keep-exif', "Keep EXIF and XMP metadata")
+    add_bool_flag(parser, 'strip-exif-extras',
+                  "Drop embedded thumbnails and maker notes from kept EXIF (default: on)")
+    add_bool_flag(parser, 'keep-icc', "Keep the ICC color profile (default: on)")
+    add_bool_flag(parser, 'auto-orient',
+                  "Rotate pixels upright according to the EXIF orientation (default: on)")
+    add_bool_flag(parser, 'fast-decode',
+                  "Decode JPEGs at reduced scale when downsizing (disable for bit-exact output)")
+    parser.add_argument('--memory-budget', dest='memory_budget_mb', type=int, metavar='MB',
+                        help="Only run files in parallel while their estimated decoded size fits in MB; "
+                             "larger uncompressed TIFF/BMP inputs are resized in strips (default: no limit)")
+    parser.add_argument('--max-image-pixels', type=int, metavar='N',
+                        help=f"Refuse images with more pixels than this, 0 for no limit "
+                             f"(default: {DEFAULT_SETTINGS['max_image_pixels']})")
+    parser.add_argument('-j', '--jobs', dest='workers', type=int,
+                        help=f"Number of worker processes (default: {DEFAULT_SETTINGS['workers']})")
+    add_bool_flag(parser, 'incremental',
+                  "Skip files whose source and settings are unchanged since the last run")
+    add_bool_flag(parser, 'content-hash',
+                  "With --incremental, compare file contents when only the mtime changed")
+    add_bool_flag(parser, 'resume',
+                  "Continue an interrupted run into the same output directory (default: on)")
+    add_bool_flag(parser, 'profile',
+                  "Time every pipeline stage per file and print a summary to stderr at the end")
+
+
+def settings_from_args(args):
+    """Defaults, overlaid with --settings FILE, overlaid with explicit flags"""
+    settings = {}
+    if args.settings:
+        with open(args.settings, 'r') as f:
+            settings.update(json.load(f))
+    for key in DEFAULT_SETTINGS:
+        value = getattr(args, key, None)
+        if value is not None:
+            settings[key] = value
+    return resolve_settings(settings)
+
+
+def collect_input_files(patterns, include=None, exclude=None):
+    """Expand files, directories (recursively) and glob patterns, keeping order"""
+    files = []
+    seen = set()
+
+    def add(path):
+        if path not in seen:
+            seen.add(path)
+            files.append(path)
+
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                for path in iter_images(match, include, exclude):
+                    add(path)
+            else:
+                add(match)
+    return files
+
+
+def iter_sources(input_files, roots, include=None, exclude=None):
+    """(name, data) of every input for archive mode, read one at a time.
+
+    Archives contribute their image members; other files are named by
+    their path below the scanned folder they came from (or their file name).
+    """
+    roots = sorted((os.path.abspath(root) for root in roots), key=len, reverse=True)
+    for path in input_files:
+        if is_archive(path):
+            yield from iter_members(path, include, exclude)
+            continue
+        absolute = os.path.abspath(path)
+        name = os.path.basename(path)
+        for root in roots:
+            if absolute.startswith(root.rstrip(os.sep) + os.sep):
+                name = os.path.relpath(absolute, root).replace(os.sep, '/')
+                break
+        with open(path, 'rb') as f:
+            yield name, f.read()
+
+
+def input_roots(patterns):
+    """Directories among the inputs; their structure is kept by the 'mirror' layout"""
+    roots = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        roots.extend(match for match in matches if os.path.isdir(match))
+    return roots
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='imagecompressor',
+        description="Compress images without the GUI. Results are printed as JSON lines."
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help="Image files, zip / tar archives, directories or glob patterns")
+    parser.add_argument('-o', '--output', required=True,
+                        help="Output directory, or a .zip / .tar[.gz|.bz2|.xz] archive to write")
+    parser.add_argument('--include', action='append', metavar='GLOB',
+                        help="Only take files matching this pattern from directories (repeatable)")
+    parser.add_argument('--exclude', action='append', metavar='GLOB',
+                        help="Skip files and directories matching this pattern (repeatable)")
+    parser.add_argument('--events', action='store_true',
+                        help="Print every progress event (started, file_done, file_failed, finished) "
+                             "instead of only the per-file results")
+    parser.add_argument('--profile-json', metavar='FILE',
+                        help="Write per-file stage timings as JSON (implies --profile)")
+    parser.add_argument('--profile-csv', metavar='FILE',
+                        help="Write per-file stage timings as CSV (implies --profile)")
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help="Compress only the first input in-process under cProfile and "
+                             "dump the stats to FILE")
+    add_settings_arguments(parser)
+    return parser
+
+
+def write_record(record, stream):
+    stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+    stream.flush()
+
+
+def compress_main(argv=None, stream=None):
+    stream = stream or sys.stdout
+    args = build_parser().parse_args(argv)
+    settings = settings_from_args(args)
+    if args.profile_json or args.profile_csv:
+        settings['profile'] = True
+    try:
+        check_template(settings['name_template'])
+        check_variants(settings)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    input_files = collect_input_files(args.inputs, args.include, args.exclude)
+    if not input_files:
+        print("No input images found", file=sys.stderr)
+        return 2
+    # Archives in or out: members are streamed through memory, nothing is extracted
+    archive_mode = is_archive(args.output) or any(is_archive(path) for path in input_files)
+    if archive_mode and args.cprofile:
+        print("--cprofile needs image files, not archives", file=sys.stderr)
+        return 2
+    if not is_archive(args.output):
+        os.makedirs(args.output, exist_ok=True)
+
+    if args.cprofile:
+        result, top = run_cprofile(args.cprofile, compress_single_image, input_files[0], args.output, settings)
+        write_record(result, stream)
+        print(top, file=sys.stderr)
+        return 0
+
+    def write_result(processed, total, result):
+        write_record(result, stream)
+
+    events = EventBus()
+    if args.events:
+        events.subscribe(lambda event: write_record(event, stream))
+    on_progress = None if args.events else write_result
+    finished = {}
+    events.subscribe(lambda event: finished.update(event) if event['event'] == FINISHED else None)
+
+    # First Ctrl+C cancels gracefully (the run can be resumed), a second one aborts
+    control = JobControl()
+
+    def on_interrupt(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        print("Cancelling; press Ctrl+C again to abort", file=sys.stderr)
+        control.cancel()
+
+    # Signal handlers can only be installed from the main thread
+    in_main_thread = threading.current_thread() is threading.main_thread()
+    previous_handler = signal.signal(signal.SIGINT, on_interrupt) if in_main_thread else None
+
+    manifest = journal = None
+    if not archive_mode:
+        if settings['incremental']:
+            manifest = Manifest(args.output, settings, use_hash=settings['content_hash'])
+        journal = Journal(args.output, settings)
+        resumed = journal.open(resume=settings['resume'])
+        if resumed:
+            print(f"Resuming interrupted run: {resumed} file(s) already done", file=sys.stderr)
+    try:
+        if archive_mode:
+            engine = ArchiveCompressor(args.output, settings, workers=settings['workers'], events=events,
+                                       control=control)
+            sources = iter_sources(input_files, input_roots(args.inputs), args.include, args.exclude)
+            results = engine.run(sources, progress_callback=on_progress)
+        else:
+            engine = BatchCompressor(args.output, settings, workers=settings['workers'],
+                                     manifest=manifest, events=events, journal=journal, control=control,
+                                     roots=input_roots(args.inputs))
+            results = engine.run(input_files, progress_callback=on_progress)
+    finally:
+        if in_main_thread:
+            signal.signal(signal.SIGINT, previous_handler)
+        if journal:
+            journal.close()
+        if manifest:
+            manifest.close()
+    if finished.get('skipped'):
+        print(f"Skipped {finished['skipped']} file(s) whose output name was taken", file=sys.stderr)
+    if finished.get('metadata_removed'):
+        print(f"Metadata: {format_size(finished['metadata_removed'])} removed", file=sys.stderr)
+    if finished.get('lossless_files'):
+        print(describe_lossless(finished), file=sys.stderr)
+    if finished.get('png_files'):
+        print(describe_png_search(finished), file=sys.stderr)
+    if finished.get('duplicates'):
+        print(describe_duplicates(finished), file=sys.stderr)
+    if finished.get('format_wins'):
+        print(describe_format_wins(finished['format_wins'], finished['saved_vs_auto']), file=sys.stderr)
+    if settings['profile']:
+        report = ProfileReport().extend(results)
+        print("\n".join(report.summary_lines()), file=sys.stderr)
+        if args.profile_json:
+            report.write_json(args.profile_json)
+        if args.profile_csv:
+            report.write_csv(args.profile_csv)
+    if control.cancelled:
+        return 130
+    failed = sum(1 for result in results if result['error'])
+    return 1 if failed else 0
+
+
+def prune_main(argv=None, stream=None):
+    stream = stream or sys.stdout
+    parser = argparse.ArgumentParser(
+        prog='imagecompressor prune',
+        description="Delete outputs whose source images no longer exist (uses the --incremental manifest)"
+    )
+    parser.add_argument('output', help="Output directory containing the manifest")
+    parser.add_argument('-n', '--dry-run', action='store_true', help="Only list what would be removed")
+    args = parser.parse_args(argv)
+
+    manifest = Manifest(args.output)
+    try:
+        removed = manifest.prune(dry_run=args.dry_run)
+    finally:
+        manifest.close()
+    for output_path in removed:
+        write_record({'removed': output_path, 'dry_run': args.dry_run}, stream)
+    return 0
+
+
+def parse_matrix_value(text):
+    lowered = text.lower()
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    try:
+        return int(text)
+    except ValueError:
+        return text
+
+
+def bench_main(argv=None, stream=None):
+    stream = stream or sys.stdout
+    parser = argparse.ArgumentParser(
+        prog='imagecompressor bench',
+        description="Benchmark decode -> resize -> encode on a synthetic corpus across a settings matrix"
+    )
+    parser.add_argument('--corpus', metavar='DIR',
+                        help="Where to generate/reuse the corpus (default: a cached temp directory)")
+    parser.add_argument('--seed', type=int, default=0, help="Corpus seed")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Scale of the corpus image dimensions (1.0 includes a 96 MP TIFF)")
+    parser.add_argument('--matrix', action='append', metavar='KEY=V1,V2',
+                        help="Settings to vary (repeatable); replaces the default matrix")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help="Fixed setting for every run (repeatable)")
+    parser.add_argument('--repeat', type=int, default=1, help="Passes over the corpus per configuration")
+    parser.add_argument('--json', metavar='FILE', help="Write the full results as JSON")
+    parser.add_argument('--baseline', metavar='FILE', help="Compare against an earlier --json file")
+    args = parser.parse_args(argv)
+
+    matrix = None
+    if args.matrix:
+        matrix = {}
+        for item in args.matrix:
+            key, _, values = item.partition('=')
+            matrix[key] = [parse_matrix_value(value) for value in values.split(',')]
+    base_settings = {}
+    for item in args.set:
+        key, _, value = item.partition('=')
+        base_settings[key] = parse_matrix_value(value)
+
+    corpus_dir = args.corpus or benchmark.default_corpus_dir(args.seed, args.scale)
+    print(f"Corpus: {corpus_dir}", file=sys.stderr)
+    paths = benchmark.generate_corpus(corpus_dir, seed=args.seed, scale=args.scale)
+
+    report = benchmark.run_benchmark(
+        paths, matrix=matrix, base_settings=base_settings, repeat=args.repeat,
+        progress=lambda run: print(benchmark.format_run(run), file=stream, flush=True)
+    )
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            report['baseline'] = benchmark.compare(report, json.load(f))
+        for entry in report['baseline']:
+            settings = ", ".join(f"{key}={value}" for key, value in entry['settings'].items())
+            print(f"vs baseline: {settings}: speed x{entry['speed_ratio']:.2f}, size x{entry['size_ratio']:.3f}",
+                  file=stream)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def watch_main(argv=None, stream=None):
+    stream = stream or sys.stdout
+    parser = argparse.ArgumentParser(
+        prog='imagecompressor watch',
+        description="Keep compressing new and changed images in the given folders until stopped "
+                    "(Ctrl+C or SIGTERM). Results are printed as JSON lines."
+    )
+    parser.add_argument('folders', nargs='+', help="Folders to watch (recursively)")
+    parser.add_argument('-o', '--output', required=True, help="Output directory")
+    parser.add_argument('--include', action='append', metavar='GLOB',
+                        help="Only compress files matching this pattern (repeatable)")
+    parser.add_argument('--exclude', action='append', metavar='GLOB',
+                        help="Ignore files and directories matching this pattern (repeatable)")
+    parser.add_argument('--poll-interval', type=float, default=watch.POLL_INTERVAL, metavar='SECONDS',
+                        help=f"Seconds between folder scans when polling (default: {watch.POLL_INTERVAL})")
+    parser.add_argument('--settle', type=float, default=watch.SETTLE_SECONDS, metavar='SECONDS',
+                        help="Wait until a file's size and mtime have not changed for this long "
+                             f"(default: {watch.SETTLE_SECONDS})")
+    parser.add_argument('--queue-size', type=int, default=watch.QUEUE_SIZE, metavar='N',
+                        help=f"Files waiting for a worker before new ones are held back "
+                             f"(default: {watch.QUEUE_SIZE})")
+    parser.add_argument('--polling', action='store_true',
+                        help="Poll even if watchdog is installed for change notifications")
+    parser.add_argument('--status-file', metavar='FILE',
+                        help="Write queue depth, throughput and totals to FILE as JSON every second")
+    parser.add_argument('--status-port', type=int, metavar='PORT',
+                        help="Serve the same status as JSON on http://127.0.0.1:PORT/")
+    parser.add_argument('--events', action='store_true',
+                        help="Print every progress event instead of only the per-file results")
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.settings is None and os.path.exists(SETTINGS_FILE):
+        # The settings saved from the GUI
+        args.settings = SETTINGS_FILE
+    settings = settings_from_args(args)
+    try:
+        check_template(settings['name_template'])
+        check_variants(settings)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    missing = [folder for folder in args.folders if not os.path.isdir(folder)]
+    if missing:
+        print(f"Not a folder: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+
+    events = EventBus()
+    if args.events:
+        events.subscribe(lambda event: write_record(event, stream))
+    else:
+        def on_event(event):
+            if event['event'] == FILE_DONE:
+                write_record(event['result'], stream)
+            elif event['event'] == FILE_FAILED:
+                write_record({'input_path': event['input_path'], 'error': event['error']}, stream)
+            elif event['event'] == FILE_SKIPPED:
+                write_record({'input_path': event['input_path'], 'skipped': event['reason']}, stream)
+            elif event['event'] == LOG:
+                print(event['message'], file=sys.stderr)
+        events.subscribe(on_event)
+
+    service = watch.WatchService(args.folders, args.output, settings, workers=settings['workers'],
+                                 events=events, include=args.include, exclude=args.exclude,
+                                 poll_interval=args.poll_interval, settle=args.settle,
+                                 queue_size=args.queue_size, status_file=args.status_file,
+                                 use_polling=args.polling)
+
+    def on_signal(signum, frame):
+        print("Stopping after the files in progress", file=sys.stderr)
+        service.stop()
+
+    in_main_thread = threading.current_thread() is threading.main_thread()
+    previous = {}
+    if in_main_thread:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previous[signum] = signal.signal(signum, on_signal)
+    server = watch.serve_status(service, args.status_port) if args.status_port else None
+    try:
+        final = service.run()
+    finally:
+        if server:
+            server.shutdown()
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    skipped = f", {final['skipped']} skipped (name taken)" if final['skipped'] else ""
+    print(f"Stopped: {final['processed']} file(s) processed, {final['failed']} failed, "
+          f"{final['cached']} unchanged{skipped}", file=sys.stderr)
+    return 1 if final['failed'] else 0
+
+
+def _run_queue_worker(path, follow, stream=None):
+    """Run one QueueWorker until the queue is empty; SIGINT / SIGTERM finish the current batch first"""
+    stream = stream or sys.stdout
+    worker = jobqueue.QueueWorker(jobqueue.open_queue(path), follow=follow,
+                                  progress_callback=lambda record: write_record(record, stream))
+
+    def on_signal(signum, frame):
+        worker.stop()
+
+    in_main_thread = threading.current_thread() is threading.main_thread()
+    previous = {}
+    if in_main_thread:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previous[signum] = signal.signal(signum, on_signal)
+    try:
+        stats = worker.run()
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    lost = f", {stats['lost']} lease(s) lost" if stats['lost'] else ""
+    print(f"Worker {worker.worker_id}: {stats['processed']} file(s), {stats['failed']} failed{lost}",
+          file=sys.stderr)
+    return 1 if stats['failed'] else 0
+
+
+def _queue_worker_process(path, follow):
+    sys.exit(_run_queue_worker(path, follow))
+
+
+def describe_queue_status(status):
+    lines = [f"{status['total']} file(s): {status['queued']} queued, {status['leased']} leased, "
+             f"{status['done']} done, {status['failed']} failed"]
+    if status['original_bytes']:
+        saved = status['original_bytes'] - status['compressed_bytes']
+        lines.append(f"{format_size(status['original_bytes'])} -> {format_size(status['compressed_bytes'])} "
+                     f"({saved / status['original_bytes'] * 100:.1f}% saved)")
+    if status['files_per_minute']:
+        eta = f", about {status['eta_seconds'] / 60:.1f} min left" if status['eta_seconds'] else ""
+        lines.append(f"Throughput: {status['files_per_minute']:.1f} files/min{eta}")
+    for name, node in sorted(status['nodes'].items()):
+        lines.append(f"  {name}: {node['files']} file(s), {node['failed']} failed, {node['workers']} worker(s), "
+                     f"{node['files_per_minute']:.1f} files/min, {node['busy_seconds']:.1f}s busy")
+    return "\n".join(lines)
+
+
+def queue_main(argv=None, stream=None):
+    stream = stream or sys.stdout
+    parser = argparse.ArgumentParser(
+        prog='imagecompressor queue',
+        description="Spread a batch over several machines: 'submit' adds images to a shared queue, 'work' "
+                    "compresses leased batches of them (run it on every machine), 'status' shows progress. "
+                    f"QUEUE is a directory on a shared filesystem, or an SQLite file "
+                    f"({', '.join(jobqueue.SQLITE_SUFFIXES)}) for workers on one machine."
+    )
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    submit_parser = actions.add_parser('submit', help="Plan the outputs of images and add them to the queue")
+    submit_parser.add_argument('queue', help="Queue directory or SQLite file (created if missing)")
+    submit_parser.add_argument('inputs', nargs='+', help="Image files, directories or glob patterns")
+    submit_parser.add_argument('-o', '--output', required=True,
+                               help="Output directory; must be the same path on every worker machine")
+    submit_parser.add_argument('--include', action='append', metavar='GLOB',
+                               help="Only take files matching this pattern from directories (repeatable)")
+    submit_parser.add_argument('--exclude', action='append', metavar='GLOB',
+                               help="Skip files and directories matching this pattern (repeatable)")
+    submit_parser.add_argument('--batch-size', type=int, default=jobqueue.BATCH_SIZE, metavar='N',
+                               help=f"Files per lease (default: {jobqueue.BATCH_SIZE})")
+    submit_parser.add_argument('--lease-ttl', type=float, default=jobqueue.LEASE_TTL, metavar='SECONDS',
+                               help="Seconds without a heartbeat before a batch is given to another worker "
+                                    f"(default: {jobqueue.LEASE_TTL:g})")
+    add_settings_arguments(submit_parser)
+
+    work_parser = actions.add_parser('work', help="Compress files from the queue until it is empty")
+    work_parser.add_argument('queue', help="Queue directory or SQLite file")
+    work_parser.add_argument('-j', '--jobs', type=int, default=1,
+                             help="Worker processes on this machine (default: 1)")
+    work_parser.add_argument('--follow', action='store_true',
+                             help="Keep waiting for new submissions instead of exiting when the queue is empty")
+
+    status_parser = actions.add_parser('status', help="Show counts, throughput and per-node stats")
+    status_parser.add_argument('queue', help="Queue directory or SQLite file")
+    status_parser.add_argument('--json', action='store_true', help="Print the status as JSON")
+    args = parser.parse_args(argv)
+
+    queue = jobqueue.open_queue(args.queue)
+    if args.action == 'submit':
+        settings = settings_from_args(args)
+        input_files = collect_input_files(args.inputs, args.include, args.exclude)
+        if not input_files:
+            print("No input images found", file=sys.stderr)
+            return 2
+        if any(is_archive(path) for path in input_files):
+            print("Archives can't be queued; extract them first", file=sys.stderr)
+            return 2
+        try:
+            added, settled = jobqueue.submit(queue, input_files, args.output, settings,
+                                             roots=input_roots(args.inputs), batch_size=args.batch_size,
+                                             lease_ttl=args.lease_ttl)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        for result in settled:
+            write_record(result, stream)
+        print(f"Queued {added} file(s) in {args.queue}", file=sys.stderr)
+        return 1 if any(result['error'] for result in settled) else 0
+
+    try:
+        meta = queue.meta()
+        jobqueue.check_meta(meta)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.action == 'status':
+        status = jobqueue.queue_status(queue)
+        if args.json:
+            write_record(status, stream)
+        else:
+            print(describe_queue_status(status), file=stream)
+        return 0
+
+    if args.jobs <= 1:
+        return _run_queue_worker(args.queue, args.follow, stream)
+    processes = [multiprocessing.Process(target=_queue_worker_process, args=(args.queue, args.follow))
+                 for _ in range(args.jobs)]
+    for process in processes:
+        process.start()
+
+    def on_signal(signum, frame):
+        # The workers finish their current batch and exit
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    in_main_thread = threading.current_thread() is threading.main_thread()
+    previous = {}
+    if in_main_thread:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previous[signum] = signal.signal(signum, on_signal)
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    return 1 if any(process.exitcode for process in processes) else 0
+
+
+# Sub-commands; anything else is treated as the arguments of 'compress'
+COMMANDS = {
+    'compress': compress_main,
+    'prune': prune_main,
+    'bench': bench_main,
+    'watch': watch_main,
+    'queue': queue_main
+}
+
+
+def main(argv=None, stream=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:], stream)
+    return compress_main(argv, stream)
@@ -0,0 +1,1142 @@
+import io
+import os
+import math
+import json
+import hashlib
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from PIL import Image, ImageFile, UnidentifiedImageError
+
+from .profiling import StageTimer, NULL_TIMER
+from .perceptual import SSIMScorer, psnr
+from .metadata import (SWAPPED_ORIENTATIONS, apply_orientation, metadata_save_kwargs, orientation_exif,
+                       oriented_settings, read_metadata)
+from .jpeg import jpegtran_missing, optimize_losslessly
+from .png import optimize_png
+
+# Pillow refuses images above twice its MAX_IMAGE_PIXELS (89478485); the
+# max_image_pixels setting keeps that as its default
+DEFAULT_MAX_IMAGE_PIXELS = 2 * 89478485
+
+# Pillow's limit is process-wide; held while open_image() lifts it
+_PIXEL_LIMIT_LOCK = threading.Lock()
+
+# Default compression settings, shared by the GUI and the batch workers
+DEFAULT_SETTINGS = {
+    'quality': 85,
+    'max_width': 1920,
+    'max_height': 1080,
+    'resample_method': 'LANCZOS',
+    'optimize': True,
+    'progressive': False,
+    # JPEG inputs that need no resizing are rewritten without re-encoding
+    'jpeg_lossless': False,
+    # PNG outputs search pixel formats (palette, gray) and zlib settings for
+    # the smallest lossless file; png_quantize > 0 also allows a lossy
+    # palette that keeps at least that PSNR (dB)
+    'png_optimize': True,
+    'png_quantize': 0,
+    'keep_exif': True,
+    'strip_exif_extras': True,
+    'keep_icc': True,
+    'auto_orient': True,
+    'format': 'auto',
+    'workers': os.cpu_count() or 1,
+    'fast_decode': True,
+    'incremental': False,
+    'content_hash': False,
+    'target_size_kb': 0,
+    'resume': True,
+    'profile': False,
+    'memory_budget_mb': 0,
+    'max_image_pixels': DEFAULT_MAX_IMAGE_PIXELS,
+    'min_psnr': 0,
+    'min_ssim': 0,
+    'dedupe': 'off',
+    'near_distance': 4,
+    'output_layout': 'flat',
+    'name_template': '{stem}_compressed{ext}',
+    'collision': 'suffix',
+    # Responsive variants: widths to write every image at (empty = one output
+    # sized by max_width / max_height) and their formats (empty = 'format')
+    'variant_widths': [],
+    'variant_formats': [],
+    # GUI only: keep preview thumbnails on disk between sessions
+    'thumbnail_cache': False
+}
+
+# Saved by the GUI's "Save Settings"; also the default settings of the watch service
+SETTINGS_FILE = 'compression_settings.json'
+
+# Settings that control how a batch runs but not what gets written; they
+# are left out of the settings fingerprint
+RUNTIME_KEYS = {'workers', 'incremental', 'content_hash', 'resume', 'profile',
+                'memory_budget_mb', 'max_image_pixels', 'thumbnail_cache'}
+
+# How optimize_losslessly() produced a file, as shown in describe_result()
+LOSSLESS_METHODS = {
+    'jpegtran': 'Huffman tables optimized',
+    'markers': 'metadata segments rewritten',
+    'copied': 'already optimal, copied'
+}
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
+
+RESAMPLE_METHODS = {
+    'NEAREST': Image.Resampling.NEAREST,
+    'BILINEAR': Image.Resampling.BILINEAR,
+    'BICUBIC': Image.Resampling.BICUBIC,
+    'LANCZOS': Image.Resampling.LANCZOS,
+    'BOX': Image.Resampling.BOX,
+    'HAMMING': Image.Resampling.HAMMING
+}
+
+# reduce() stops at this multiple of the target size so the final
+# resample still has enough pixels to work with (same as Image.thumbnail)
+REDUCING_GAP = 2.0
+
+# Formats whose size is controlled by the quality setting
+QUALITY_FORMATS = {'JPEG', 'WEBP'}
+
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+
+# Formats tried by the 'smallest' format mode
+SMALLEST_CANDIDATES = ['JPEG', 'WEBP', 'PNG']
+
+# Upper bound on encodes per image in the SSIM search
+MAX_QUALITY_PROBES = 7
+
+# The SSIM search stops once the remaining quality interval is this narrow;
+# neighbouring qualities differ by less than the metric's noise
+SSIM_QUALITY_TOLERANCE = 3
+
+# How far (in source pixels per output pixel) each resample filter reaches;
+# strip-wise resizing decodes this many extra rows around every band
+FILTER_SUPPORT = {
+    'NEAREST': 1.0,
+    'BOX': 0.5,
+    'BILINEAR': 1.0,
+    'HAMMING': 1.0,
+    'BICUBIC': 2.0,
+    'LANCZOS': 3.0
+}
+
+# Fraction of the memory budget one decoded band may use in strip mode
+STRIP_BUDGET_FRACTION = 0.25
+
+
+def resolve_settings(settings=None):
+    """Fill in any missing keys of a (possibly partial) settings dict"""
+    resolved = dict(DEFAULT_SETTINGS)
+    if settings:
+        resolved.update(settings)
+    return resolved
+
+
+def settings_fingerprint(settings):
+    """Stable hash of every setting that affects the output bytes"""
+    settings = resolve_settings(settings)
+    relevant = {key: value for key, value in settings.items() if key not in RUNTIME_KEYS}
+    encoded = json.dumps(relevant, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()[:16]
+
+
+def format_size(size_bytes):
+    if size_bytes == 0:
+        return "0B"
+    size_names = ["B", "KB", "MB", "GB"]
+    i = int(math.floor(math.log(size_bytes, 1024)))
+    p = math.pow(1024, i)
+    s = round(size_bytes / p, 2)
+    return f"{s} {size_names[i]}"
+
+
+def determine_output_format(input_path, format_setting):
+    if format_setting == 'auto':
+        # Keep original format
+        ext = Path(input_path).suffix.lower()
+        if ext in ['.jpg', '.jpeg']:
+            return 'JPEG'
+        elif ext == '.png':
+            return 'PNG'
+        elif ext == '.webp':
+            return 'WEBP'
+        else:
+            return 'JPEG'  # Default
+    else:
+        return format_setting
+
+
+def check_variants(settings):
+    """Raise ValueError unless the variant settings can be used"""
+    widths = settings.get('variant_widths') or []
+    if any(not isinstance(width, int) or width < 1 for width in widths):
+        raise ValueError("Variant widths must be positive integers")
+    formats = settings.get('variant_formats') or []
+    unknown = [fmt for fmt in formats if fmt not in FORMAT_EXTENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown variant format(s): {', '.join(map(str, unknown))} "
+                         f"(available: {', '.join(FORMAT_EXTENSIONS)})")
+    if widths and not formats and settings.get('format') == 'smallest':
+        raise ValueError("Variants need explicit formats with format 'smallest'")
+
+
+def variant_plan(input_path, settings):
+    """(widths, formats) of the variants to write for input_path, or None if variants are off.
+
+    Widths are sorted largest first, the order the resize pyramid is built in.
+    """
+    widths = sorted(set(settings.get('variant_widths') or []), reverse=True)
+    if not widths:
+        return None
+    formats = list(settings.get('variant_formats') or [determine_output_format(input_path, settings['format'])])
+    return widths, formats
+
+
+def variant_path(output_path, width, output_format):
+    """Path of one variant: the output stem plus -<width>w and the format's extension"""
+    return f"{os.path.splitext(output_path)[0]}-{width}w{FORMAT_EXTENSIONS.get(output_format, '.jpg')}"
+
+
+def get_target_size(size, settings):
+    """Size the image will be resized to, or None if it already fits"""
+    width, height = size
+    max_width = settings['max_width']
+    max_height = settings['max_height']
+
+    if width <= max_width and height <= max_height:
+        return None  # No resize needed
+
+    # Calculate aspect ratio
+    ratio = min(max_width / width, max_height / height)
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+
+def apply_draft(img, settings):
+    """Let the JPEG decoder scale down (1/2, 1/4, 1/8) while decoding.
+
+    Must be called before the pixel data is loaded. Returns the original
+    size, which resize_image() needs to compute the exact target size.
+    """
+    original_size = img.size
+    if not settings.get('fast_decode', True) or img.format != 'JPEG':
+        return original_size
+
+    # The DCT scaling picks the smallest scale that is still at least the
+    # requested size, so the final resample only ever shrinks
+    target = get_target_size(original_size, settings)
+    if target:
+        img.draft(img.mode, target)
+    return original_size
+
+
+def resize_image(img, settings, original_size=None):
+    # Calculate new dimensions from the undrafted size so draft decoding
+    # doesn't change the output dimensions
+    target = get_target_size(original_size or img.size, settings)
+    if target is None or target == img.size:
+        return img  # No resize needed
+
+    # Get resample method
+    resample = RESAMPLE_METHODS.get(settings['resample_method'], Image.Resampling.LANCZOS)
+
+    # reducing_gap makes Pillow reduce() by an integer factor first, which
+    # is much cheaper than resampling from full resolution
+    reducing_gap = REDUCING_GAP if settings.get('fast_decode', True) else None
+    return img.resize(target, resample, reducing_gap=reducing_gap)
+
+
+def build_pyramid(img, widths, settings):
+    """[(width, image)] for widths (largest first), each level resized from the one before.
+
+    Every step is a small reduction, so no level is resampled from the
+    full-resolution raster. Widths at or above the image width get the
+    image itself; it is never upscaled.
+    """
+    resample = RESAMPLE_METHODS.get(settings['resample_method'], Image.Resampling.LANCZOS)
+    reducing_gap = REDUCING_GAP if settings.get('fast_decode', True) else None
+    levels = []
+    current = img
+    for width in widths:
+        if width < current.width:
+            # Height from the top level, so rounding doesn't accumulate down the pyramid
+            height = max(1, int(img.height * width / img.width))
+            current = current.resize((width, height), resample, reducing_gap=reducing_gap)
+        levels.append((width, current))
+    return levels
+
+
+def encode_variants(levels, formats, output_path, settings, metadata=None, write=None):
+    """Encode every pyramid level in every format and write them next to output_path.
+
+    Encodes run on threads (the encoders release the GIL); each file goes
+    to write(path, data), write_output() by default. Returns one dict
+    per written file with 'output_path', 'target_width' (the requested
+    width in its name), 'width', 'height', 'format' and 'compressed_size',
+    largest first.
+    """
+    def encode(job):
+        width, level, output_format = job
+        source = prepare_for_format(level, output_format)
+        details = {}
+        if output_format == 'PNG':
+            data, details = encode_png(source, settings, metadata)
+        else:
+            save_kwargs = get_save_kwargs(output_format, settings, metadata, source.mode)
+            data = encode_image(source, output_format, save_kwargs)
+        path = variant_path(output_path, width, output_format)
+        (write or write_output)(path, data)
+        variant = {
+            'output_path': path,
+            'target_width': width,
+            'width': level.width,
+            'height': level.height,
+            'format': output_format,
+            'compressed_size': len(data)
+        }
+        if details:
+            variant['png'] = details
+        return variant
+
+    jobs = [(width, level, output_format) for width, level in levels for output_format in formats]
+    with ThreadPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+        return list(pool.map(encode, jobs))
+
+
+def pixel_bytes(mode):
+    """Bytes Pillow uses per pixel in memory (3-band images are stored padded to 4)"""
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+
+def memory_budget_bytes(settings):
+    return int((settings.get('memory_budget_mb') or 0) * 1024 * 1024)
+
+
+def draft_scale(size, target):
+    """DCT scale (1, 2, 4 or 8) that JPEG draft() will decode at for target"""
+    scale = min(size[0] // target[0], size[1] // target[1])
+    for factor in (8, 4, 2):
+        if scale >= factor:
+            return factor
+    return 1
+
+
+def estimate_memory(img, settings):
+    """Rough peak bytes compress() needs for an opened (not loaded) image.
+
+    Only the header is used. Counts the decoded raster (at draft scale for
+    JPEGs), the reduce()/premultiplied-alpha intermediate and the resized
+    copy; inputs that will be resized in strips count one band instead of
+    the full raster.
+    """
+    size = img.size
+    target = get_target_size(size, settings) or size
+    bytes_per_pixel = pixel_bytes(img.mode)
+    output = target[0] * target[1] * bytes_per_pixel
+
+    decoded = size
+    if target != size and settings.get('fast_decode', True) and img.format == 'JPEG':
+        scale = draft_scale(size, target)
+        decoded = (-(-size[0] // scale), -(-size[1] // scale))
+    source = decoded[0] * decoded[1] * bytes_per_pixel
+
+    intermediate = 0
+    if target != size:
+        if img.mode in ('RGBA', 'LA'):
+            # resize() premultiplies alpha into a full-size copy first
+            intermediate = source
+        elif settings.get('fast_decode', True):
+            intermediate = source // 4
+
+    full = source + intermediate + output
+    budget = memory_budget_bytes(settings)
+    if budget and full > budget and target != size and band_tiles(img, 0, 1) is not None:
+        band = int(budget * STRIP_BUDGET_FRACTION)
+        return band * (2 if img.mode in ('RGBA', 'LA') else 1) + output
+    return full
+
+
+def estimate_file_memory(input_path, settings):
+    """estimate_memory() for a file path; 0 if the header can't be read"""
+    try:
+        with Image.open(input_path) as img:
+            return estimate_memory(img, settings)
+    except Exception:
+        # Let the worker report the real error
+        return 0
+
+
+def _make_tile(*fields):
+    # Pillow 11.1+ describes tiles with a namedtuple, older versions with tuples
+    tile_type = getattr(ImageFile, '_Tile', None)
+    return tile_type(*fields) if tile_type else fields
+
+
+def _raw_stride(args, width):
+    rawmode, stride = args[0], args[1]
+    if stride:
+        return stride
+    # Only 8-bit-per-channel raw modes can be strided without the unpacker
+    if rawmode.isalpha() and rawmode.isupper() and not set(rawmode) & {'I', 'F'}:
+        return width * len(rawmode)
+    return None
+
+
+def band_tiles(img, top, bottom):
+    """Tiles that decode rows top..bottom of an unloaded image on their own.
+
+    Returns (band_top, band_bottom, tiles) with the tiles shifted so the band
+    starts at row 0 (band_top <= top and band_bottom >= bottom, as whole
+    strips are decoded), or None if the image can't be decoded in bands.
+    Only uncompressed ('raw') data qualifies: striped/tiled TIFFs, BMP and
+    similar. PNG and compressed TIFF are one zlib/libtiff stream and have to
+    be decoded whole.
+    """
+    # Tiles are (decoder, (x0, y0, x1, y1), offset, args)
+    tiles = [tuple(tile) for tile in img.tile]
+    if not tiles or any(tile[0] != 'raw' or isinstance(tile[3], str) for tile in tiles):
+        return None
+    width, height = img.size
+
+    if len(tiles) == 1:
+        # One contiguous raster: address the rows directly
+        _, extents, offset, args = tiles[0]
+        orientation = args[2] if len(args) > 2 else 1
+        stride = _raw_stride(args, width)
+        if tuple(extents) != (0, 0, width, height) or stride is None or orientation not in (1, -1):
+            return None
+        # Bottom-up files (BMP) store the last row first
+        first_row = top if orientation == 1 else height - bottom
+        band = _make_tile('raw', (0, 0, width, bottom - top), offset + first_row * stride,
+                          (args[0], stride, orientation))
+        return top, bottom, [band]
+
+    selected = [tile for tile in tiles if tile[1][1] < bottom and tile[1][3] > top]
+    if not selected:
+        return None
+    band_top = min(tile[1][1] for tile in selected)
+    band_bottom = max(tile[1][3] for tile in selected)
+    shifted = [_make_tile(name, (x0, y0 - band_top, x1, y1 - band_top), offset, args)
+               for name, (x0, y0, x1, y1), offset, args in selected]
+    return band_top, band_bottom, shifted
+
+
+def _load_band(input_path, top, bottom):
+    """Decode only rows top..bottom of input_path; returns (band_top, image)"""
+    img = open_image(input_path)
+    band_top, band_bottom, tiles = band_tiles(img, top, bottom)
+    # Pillow decodes whatever the tile list describes into an image of
+    # img.size, so shrink both to the band
+    img._size = (img.width, band_bottom - band_top)
+    if hasattr(img, '_tile_size'):
+        # TIFF allocates its raster from this instead of size
+        img._tile_size = img._size
+    img.tile = tiles
+    try:
+        img.load()
+        return band_top, img
+    except Exception:
+        img.close()
+        raise
+
+
+def resize_in_strips(input_path, img, settings, band_bytes):
+    """Resize an unloaded image band by band, never holding the full raster.
+
+    Each band of output rows is resampled from just the source rows it
+    needs (plus the filter support on either side) using resize(box=...),
+    so the result matches a full-image resize up to float rounding.
+    """
+    width, height = img.size
+    target = get_target_size(img.size, settings)
+    method = settings['resample_method'] if settings['resample_method'] in RESAMPLE_METHODS else 'LANCZOS'
+    resample = RESAMPLE_METHODS[method]
+    scale_y = height / target[1]
+    margin = math.ceil(FILTER_SUPPORT[method] * max(scale_y, 1.0)) + 1
+
+    source_rows = max(1, band_bytes // (width * pixel_bytes(img.mode)))
+    rows_per_band = max(1, int((source_rows - 2 * margin) / scale_y))
+
+    output = None
+    for out_top in range(0, target[1], rows_per_band):
+        out_bottom = min(target[1], out_top + rows_per_band)
+        source_top = out_top * scale_y
+        source_bottom = out_bottom * scale_y
+        top = max(0, int(source_top) - margin)
+        bottom = min(height, math.ceil(source_bottom) + margin)
+        band_top, band = _load_band(input_path, top, bottom)
+        with band:
+            piece = band.resize((target[0], out_bottom - out_top), resample,
+                                box=(0, source_top - band_top, width, source_bottom - band_top))
+        if output is None:
+            output = Image.new(piece.mode, target)
+            if piece.mode == 'P':
+                output.putpalette(piece.getpalette())
+        output.paste(piece, (0, out_top))
+    output.info = dict(img.info)
+    return output
+
+
+def use_strips(img, settings):
+    """True if img should be resized in bands to stay inside the memory budget"""
+    budget = memory_budget_bytes(settings)
+    if not budget or get_target_size(img.size, settings) is None:
+        return False
+    if band_tiles(img, 0, 1) is None:
+        return False
+    # estimate_memory() already reports the strip cost for these, so
+    # compare against the full cost here
+    full = dict(settings, memory_budget_mb=0)
+    return estimate_memory(img, full) > budget
+
+
+def use_lossless_jpeg(img, output_format, settings):
+    """True if img can be written by optimize_losslessly instead of being re-encoded.
+
+    That needs a JPEG written as JPEG at its own size, with no quality
+    search; the quality setting does not apply to these files.
+    """
+    return bool(settings.get('jpeg_lossless') and not settings.get('variant_widths')
+                and img.format == 'JPEG' and output_format == 'JPEG'
+                and get_target_size(img.size, settings) is None
+                and not settings.get('target_size_kb') and not settings.get('min_ssim'))
+
+
+def lossless_metadata(img, metadata, settings):
+    """Metadata to write into a lossless JPEG rewrite of img.
+
+    The pixels stay as stored, so the Orientation tag is kept rather than
+    reset, and a minimal EXIF block carries it when EXIF is not kept.
+    """
+    kept = read_metadata(img, dict(settings, auto_orient=False))
+    if metadata['orientation'] != 1 and not kept['exif']:
+        kept['exif'] = orientation_exif(metadata['orientation'])
+    return kept
+
+
+def open_image(source, settings=None):
+    """Image.open(source) with settings['max_image_pixels'] in place of Pillow's pixel limit.
+
+    The image is opened with Pillow's limit and its header size checked
+    against the setting. Only when Pillow refuses an image the setting
+    allows is its process-wide limit lifted for a second open, under a lock
+    so that overlapping calls always restore the real value. Without
+    settings the size is not checked (e.g. when it already was).
+    """
+    limit = (settings or {}).get('max_image_pixels') or 0
+    try:
+        img = Image.open(source)
+    except Image.DecompressionBombError:
+        if limit and limit <= 2 * Image.MAX_IMAGE_PIXELS:
+            # Pillow refuses above twice its limit, so this is above ours too
+            raise ValueError(f"Image has more than the {limit} pixels allowed by max_image_pixels") from None
+        if is_file_object(source):
+            source.seek(0)
+        with _PIXEL_LIMIT_LOCK:
+            previous = Image.MAX_IMAGE_PIXELS
+            Image.MAX_IMAGE_PIXELS = None
+            try:
+                img = Image.open(source)
+            finally:
+                Image.MAX_IMAGE_PIXELS = previous
+    if limit:
+        try:
+            check_pixel_limit(img, settings)
+        except ValueError:
+            img.close()
+            raise
+    return img
+
+
+def check_pixel_limit(img, settings):
+    """Refuse img if it has more pixels than settings['max_image_pixels'] (0 = no limit)"""
+    limit = settings.get('max_image_pixels') or 0
+    if limit and img.width * img.height > limit:
+        raise ValueError(f"Image has {img.width * img.height} pixels, more than the "
+                         f"{limit} allowed by max_image_pixels")
+
+
+def is_file_object(source):
+    return hasattr(source, 'read')
+
+
+def source_size(source):
+    """Size in bytes of an input path or seekable binary file object"""
+    if not is_file_object(source):
+        return os.path.getsize(source)
+    source.seek(0, os.SEEK_END)
+    return source.tell()
+
+
+def read_source(source):
+    """All bytes of an input path or seekable binary file object"""
+    if not is_file_object(source):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'getvalue'):
+        # BytesIO shares its buffer instead of copying it
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def unidentified_message(input_name):
+    if input_name:
+        return f"cannot identify image file {input_name!r}"
+    return "cannot identify image data"
+
+
+def stream_name(img):
+    """Stand-in input name for an image opened from a file object, e.g. 'image.png'"""
+    return 'image' + FORMAT_EXTENSIONS.get(img.format, '')
+
+
+def get_output_path(input_path, output_format, output_dir):
+    filename = Path(input_path).stem
+    extension = FORMAT_EXTENSIONS.get(output_format, '.jpg')
+    return os.path.join(output_dir, f"{filename}_compressed{extension}")
+
+
+def with_format_extension(output_path, output_format):
+    """output_path with its extension replaced by the one for output_format"""
+    return os.path.splitext(output_path)[0] + FORMAT_EXTENSIONS[output_format]
+
+
+def get_save_kwargs(output_format, settings, metadata=None, mode=None):
+    """Encoder options for output_format; with metadata (see read_metadata) it is written too"""
+    kwargs = {}
+
+    if output_format == 'JPEG':
+        kwargs.update({
+            'quality': settings['quality'],
+            'optimize': settings['optimize'],
+            'progressive': settings['progressive']
+        })
+    elif output_format == 'PNG':
+        kwargs.update({
+            'optimize': settings['optimize']
+        })
+    elif output_format == 'WEBP':
+        kwargs.update({
+            'quality': settings['quality'],
+            'method': 6 if settings['optimize'] else 4
+        })
+
+    if metadata:
+        kwargs.update(metadata_save_kwargs(output_format, metadata, mode))
+    return kwargs
+
+
+@contextmanager
+def atomic_output(output_path):
+    """Yield a temporary path next to output_path and move it into place on success.
+
+    The final path only ever holds a complete file: if writing fails (or the
+    process dies) the temporary file is removed or left behind under a
+    hidden .tmp name, never at output_path.
+    """
+    directory, name = os.path.split(os.path.abspath(output_path))
+    # Not mkstemp: that creates 0600 files, and outputs should get the
+    # normal umask permissions
+    temp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:12]}.tmp")
+    try:
+        yield temp_path
+        os.replace(temp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def encode_image(img, output_format, save_kwargs):
+    """Encode img in memory and return the bytes"""
+    buffer = io.BytesIO()
+    img.save(buffer, format=output_format, **save_kwargs)
+    return buffer.getvalue()
+
+
+def encode_png(img, settings, metadata=None):
+    """Encode img as PNG per the settings and return (data, details).
+
+    With png_optimize the smallest encoding from optimize_png() is kept and
+    details describes it; otherwise it is a plain encode and details is
+    empty. Gray images are only stored as gray when no color profile has
+    to be kept.
+    """
+    save_kwargs = get_save_kwargs('PNG', settings, metadata, img.mode)
+    if not settings.get('png_optimize'):
+        return encode_image(img, 'PNG', save_kwargs), {}
+    return optimize_png(img, save_kwargs, gray=not save_kwargs.get('icc_profile'),
+                        min_psnr=settings.get('png_quantize') or 0)
+
+
+def write_output(output_path, data):
+    with atomic_output(output_path) as temp_path:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+
+
+def quality_probes(high):
+    """Encodes search_quality_for_size() needs for qualities 1..high: high itself, then a full bisection"""
+    return 1 + math.ceil(math.log2(high))
+
+
+def search_quality_for_size(img, output_format, settings, max_bytes, max_probes=None, metadata=None):
+    """Bisect the quality setting for the largest encoding that fits max_bytes.
+
+    settings['quality'] is the upper bound. Returns (data, quality, probes,
+    fits); when nothing fits the smallest encoding tried is returned with
+    fits=False. By default enough probes are allowed to always find the
+    highest fitting quality (8 for quality 100); a lower max_probes may stop
+    at a fitting quality below it.
+    """
+    low, high = 1, max(1, int(settings['quality']))
+    if max_probes is None:
+        max_probes = quality_probes(high)
+    best = None
+    smallest = None
+    probes = 0
+
+    while low <= high and probes < max_probes:
+        # Try the requested quality first; most images already fit
+        quality = high if probes == 0 else (low + high) // 2
+        save_kwargs = get_save_kwargs(output_format, dict(settings, quality=quality), metadata, img.mode)
+        data = encode_image(img, output_format, save_kwargs)
+        probes += 1
+
+        if len(data) <= max_bytes:
+            best = (data, quality)
+            low = quality + 1
+        else:
+            if smallest is None or len(data) < len(smallest[0]):
+                smallest = (data, quality)
+            high = quality - 1
+
+    if best:
+        return best[0], best[1], probes, True
+    return smallest[0], smallest[1], probes, False
+
+
+def has_alpha(img):
+    return img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+
+
+def prepare_for_format(img, output_format):
+    """img, converted if needed to a mode output_format can store"""
+    if output_format == 'JPEG' and img.mode not in ('RGB', 'L', 'CMYK'):
+        return img.convert('RGB')
+    if output_format == 'WEBP' and img.mode not in ('RGB', 'RGBA'):
+        return img.convert('RGBA' if has_alpha(img) else 'RGB')
+    return img
+
+
+def measure_psnr(reference, data):
+    """PSNR in dB of the encoded data against reference (an RGB or RGBA image)"""
+    with Image.open(io.BytesIO(data)) as decoded:
+        return psnr(reference, decoded)
+
+
+def encode_smallest(img, settings, metadata=None):
+    """Encode img as JPEG, WebP and PNG in parallel and keep the smallest.
+
+    JPEG is skipped for images with transparency. With settings['min_psnr']
+    lossy candidates below that PSNR are rejected (PNG qualifies unless
+    png_quantize gave it a lossy palette); in target-size mode lossy candidates use the quality
+    search and ones that meet the target are preferred, and with
+    settings['min_ssim'] they use the SSIM-guided search. The encoders release
+    the GIL, so the threads share the one decoded image. Returns
+    (format, data, details) where details holds 'candidates' (bytes per
+    format) plus quality-search, PSNR and PNG search ('png') information.
+    """
+    alpha = has_alpha(img)
+    formats = [fmt for fmt in SMALLEST_CANDIDATES if not (alpha and fmt == 'JPEG')]
+    min_psnr = settings.get('min_psnr') or 0
+    min_ssim = settings.get('min_ssim') or 0
+    max_bytes = int((settings.get('target_size_kb') or 0) * 1024)
+    reference = img.convert('RGBA' if alpha else 'RGB') if min_psnr else None
+
+    def encode(output_format):
+        try:
+            source = prepare_for_format(img, output_format)
+            details = {}
+            if max_bytes and output_format in QUALITY_FORMATS:
+                data, quality, probes, fits = search_quality_for_size(source, output_format, settings, max_bytes,
+                                                                      metadata=metadata)
+                details = {'quality': quality, 'probes': probes, 'target_met': fits}
+            elif min_ssim and output_format in QUALITY_FORMATS:
+                data, quality, probes, score = search_quality_for_ssim(source, output_format, settings, min_ssim,
+                                                                       metadata=metadata)
+                details = {'quality': quality, 'probes': probes, 'ssim': score}
+            elif output_format == 'PNG':
+                data, png_details = encode_png(source, settings, metadata)
+                if png_details:
+                    details['png'] = png_details
+                if 'psnr' in png_details:
+                    # A quantized palette is lossy and has to meet min_psnr too
+                    details['psnr'] = png_details['psnr']
+            else:
+                save_kwargs = get_save_kwargs(output_format, settings, metadata, source.mode)
+                data = encode_image(source, output_format, save_kwargs)
+            if reference is not None and output_format in QUALITY_FORMATS:
+                details['psnr'] = measure_psnr(reference, data)
+            return output_format, data, details
+        except Exception:
+            # A format that can't store this image just drops out
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(formats)) as pool:
+        encoded = [outcome for outcome in pool.map(encode, formats) if outcome]
+    if not encoded:
+        raise ValueError("No candidate format could encode this image")
+
+    eligible = [outcome for outcome in encoded if outcome[2].get('psnr', float('inf')) >= min_psnr]
+    output_format, data, details = min(
+        eligible or encoded,
+        key=lambda outcome: (outcome[2].get('target_met') is False, len(outcome[1]))
+    )
+    details = dict(details, candidates={fmt: len(candidate) for fmt, candidate, _ in encoded})
+    return output_format, data, details
+
+
+def search_quality_for_ssim(img, output_format, settings, min_ssim, max_probes=MAX_QUALITY_PROBES,
+                            metadata=None):
+    """Bisect for the lowest quality whose decoded output keeps SSIM >= min_ssim.
+
+    settings['quality'] is the upper bound and is tried first: if it misses
+    the threshold nothing lower can pass, so the search ends there. Returns
+    (data, quality, probes, score) for the chosen encoding.
+    """
+    scorer = SSIMScorer(img)
+    low, high = 1, max(1, int(settings['quality']))
+    best = None
+    probes = 0
+
+    # Optimized Huffman tables and progressive scans don't change the
+    # decoded pixels, only the size, so JPEG probes skip them
+    probe_settings = dict(settings)
+    if output_format == 'JPEG':
+        probe_settings.update(optimize=False, progressive=False)
+
+    while low <= high and probes < max_probes:
+        quality = high if probes == 0 else (low + high) // 2
+        save_kwargs = get_save_kwargs(output_format, dict(probe_settings, quality=quality), metadata, img.mode)
+        data = encode_image(img, output_format, save_kwargs)
+        score = scorer.score(data)
+        probes += 1
+
+        if score >= min_ssim:
+            best = (data, quality, score)
+            high = quality - 1
+        elif best is None:
+            # Even the highest allowed quality misses the threshold
+            best = (data, quality, score)
+            break
+        else:
+            low = quality + 1
+        if high - low < SSIM_QUALITY_TOLERANCE:
+            break
+
+    data, quality, score = best
+    if probe_settings != settings:
+        save_kwargs = get_save_kwargs(output_format, dict(settings, quality=quality), metadata, img.mode)
+        data = encode_image(img, output_format, save_kwargs)
+    return data, quality, probes, score
+
+
+def compress(input_path, output_path, settings=None, write=None, input_name=None):
+    """Compress input_path into output_path and return a result dict.
+
+    The output format follows settings['format'] ('auto' keeps the input
+    format). With 'smallest' the candidates of encode_smallest() are tried
+    and the extension of output_path is replaced to match the winner.
+    Works without Tk and can be called from any process.
+
+    input_path may also be a seekable binary file object (e.g. io.BytesIO);
+    input_name then stands in for its path, for the 'auto' format and in
+    the result. Every output file is encoded in memory and passed to
+    write(path, data), which defaults to write_output() (an atomic write to
+    disk); a different write can collect the bytes or stream them into an
+    archive instead.
+    """
+    settings = resolve_settings(settings)
+    write = write or write_output
+    timer = StageTimer() if settings.get('profile') else NULL_TIMER
+    with timer.stage('decode'):
+        try:
+            img = open_image(input_path, settings)
+        except UnidentifiedImageError:
+            if not is_file_object(input_path):
+                raise
+            # Pillow's message would show the file object's repr
+            raise UnidentifiedImageError(unidentified_message(input_name)) from None
+    with img:
+        if input_name is None:
+            input_name = input_path if not is_file_object(input_path) else stream_name(img)
+        metadata = read_metadata(img, settings)
+        plan = variant_plan(input_name, settings)
+        # Size limits as they apply to the stored raster; the EXIF
+        # orientation is applied after resizing, on output-sized pixels.
+        # Variants decode and resize once, for the widest one.
+        limits = dict(settings, max_width=plan[0][0], max_height=math.inf) if plan else settings
+        sizing = oriented_settings(limits, metadata['orientation'])
+
+        # Get original size
+        with timer.stage('stat'):
+            original_size = source_size(input_path)
+
+        # Determine output format
+        output_format = determine_output_format(input_name, settings['format'])
+
+        if use_lossless_jpeg(img, output_format, sizing):
+            kept = lossless_metadata(img, metadata, settings)
+            with timer.stage('decode'):
+                original = read_source(input_path)
+            with timer.stage('encode'):
+                data, method = optimize_losslessly(original, kept, settings)
+                write(output_path, data)
+            width, height = img.size
+            if metadata['orientation'] in SWAPPED_ORIENTATIONS:
+                width, height = height, width
+            result = {
+                'input_path': input_name,
+                'output_path': output_path,
+                'format': output_format,
+                'width': width,
+                'height': height,
+                'original_size': original_size,
+                'compressed_size': len(data),
+                'lossless': method
+            }
+            if kept['removed']:
+                result['metadata_removed'] = kept['removed']
+            if jpegtran_missing(original, settings):
+                # Only the metadata could be rewritten; say why so little was saved
+                result['jpegtran_missing'] = True
+            if timer is not NULL_TIMER:
+                result['timings'] = timer.timings()
+                result['pixels'] = img.width * img.height
+            return result
+
+        if use_strips(img, sizing):
+            # Too big to hold decoded: decode and resample band by band
+            original_dimensions = img.size
+            with timer.stage('resize'):
+                band_bytes = int(memory_budget_bytes(settings) * STRIP_BUDGET_FRACTION)
+                img_resized = resize_in_strips(input_path, img, sizing, band_bytes)
+        else:
+            with timer.stage('decode'):
+                # Decode JPEGs at reduced scale when we are going to shrink anyway
+                original_dimensions = apply_draft(img, sizing)
+                img.load()
+
+            # Resize if needed
+            with timer.stage('resize'):
+                img_resized = resize_image(img, sizing, original_dimensions)
+
+        with timer.stage('resize'):
+            img_resized = apply_orientation(img_resized, metadata['orientation'])
+
+        if img_resized is not img:
+            # Free the full-size raster before encoding
+            img.close()
+
+        result = {
+            'input_path': input_name,
+            'output_path': output_path,
+            'format': output_format,
+            'width': img_resized.width,
+            'height': img_resized.height,
+            'original_size': original_size
+        }
+        if metadata['removed']:
+            result['metadata_removed'] = metadata['removed']
+
+        target_size_kb = settings.get('target_size_kb') or 0
+        if plan:
+            widths, formats = plan
+            with timer.stage('resize'):
+                levels = build_pyramid(img_resized, widths, settings)
+            with timer.stage('encode'):
+                variants = encode_variants(levels, formats, output_path, settings, metadata, write)
+            result.update({
+                'output_path': variants[0]['output_path'],
+                'format': variants[0]['format'],
+                'compressed_size': sum(variant['compressed_size'] for variant in variants),
+                'variants': variants
+            })
+        elif output_format == 'smallest':
+            with timer.stage('encode'):
+                output_format, data, details = encode_smallest(img_resized, settings, metadata)
+                output_path = with_format_extension(output_path, output_format)
+                write(output_path, data)
+            result.update(details)
+            result.update({
+                'output_path': output_path,
+                'format': output_format,
+                'compressed_size': len(data)
+            })
+            # Bytes saved compared with what 'auto' would have written
+            auto_format = determine_output_format(input_name, 'auto')
+            if auto_format in details['candidates']:
+                result['saved_vs_auto'] = details['candidates'][auto_format] - len(data)
+        elif target_size_kb > 0 and output_format in QUALITY_FORMATS:
+            # Target-size mode: pick the quality in memory, write once
+            with timer.stage('encode'):
+                data, quality, probes, fits = search_quality_for_size(
+                    img_resized, output_format, settings, int(target_size_kb * 1024), metadata=metadata)
+                write(output_path, data)
+            result.update({
+                'compressed_size': len(data),
+                'quality': quality,
+                'probes': probes,
+                'target_met': fits
+            })
+        elif settings.get('min_ssim') and output_format in QUALITY_FORMATS:
+            # Perceptual mode: lowest quality that keeps SSIM above the threshold
+            with timer.stage('encode'):
+                data, quality, probes, score = search_quality_for_ssim(
+                    img_resized, output_format, settings, settings['min_ssim'], metadata=metadata)
+                write(output_path, data)
+            result.update({
+                'compressed_size': len(data),
+                'quality': quality,
+                'probes': probes,
+                'ssim': score
+            })
+        elif output_format == 'PNG':
+            with timer.stage('encode'):
+                data, details = encode_png(img_resized, settings, metadata)
+                write(output_path, data)
+            result['compressed_size'] = len(data)
+            if details:
+                result['png'] = details
+        else:
+            # Save with compression
+            save_kwargs = get_save_kwargs(output_format, settings, metadata, img_resized.mode)
+            with timer.stage('encode'):
+                data = encode_image(img_resized, output_format, save_kwargs)
+                write(output_path, data)
+            result['compressed_size'] = len(data)
+
+        if timer is not NULL_TIMER:
+            result['timings'] = timer.timings()
+            result['pixels'] = original_dimensions[0] * original_dimensions[1]
+        return result
+
+
+def compress_single_image(input_path, output_dir, settings):
+    """Compress one image into output_dir using the standard naming"""
+    settings = resolve_settings(settings)
+    output_format = determine_output_format(input_path, settings['format'])
+    output_path = get_output_path(input_path, output_format, output_dir)
+    return compress(input_path, output_path, settings)
+
+
+def compress_bytes(data, settings=None, input_name=None, output_name=None):
+    """Compress encoded image bytes in memory and return (output bytes, result).
+
+    Nothing touches the disk: the input is decoded from an io.BytesIO over
+    data and the output is kept as encoded. input_name (e.g. the original
+    file name) picks the 'auto' format; without it the decoded format is
+    used. result['output_path'] is output_name, or the standard name for
+    input_name, with the extension of the format that was written.
+    Variants write several files and aren't supported here.
+    """
+    settings = resolve_settings(settings)
+    if settings.get('variant_widths'):
+        raise ValueError("compress_bytes() returns one output; variants need compress() with a write function")
+    source = io.BytesIO(data)
+    if input_name is None:
+        try:
+            # Only the header is read
+            with Image.open(source) as img:
+                input_name = stream_name(img)
+        except UnidentifiedImageError:
+            raise UnidentifiedImageError(unidentified_message(None)) from None
+    if output_name is None:
+        output_format = determine_output_format(input_name, settings['format'])
+        output_name = os.path.basename(get_output_path(input_name, output_format, ''))
+    outputs = []
+    result = compress(source, output_name, settings, write=lambda path, encoded: outputs.append(encoded),
+                      input_name=input_name)
+    return outputs[0], result
+
+
+def describe_result(result):
+    """Human readable summary of a compress_single_image result"""
+    original_size = result['original_size']
+    compressed_size = result['compressed_size']
+    compression_ratio = ((original_size - compressed_size) / original_size) * 100 if original_size else 0.0
+    summary = f"{format_size(original_size)} → {format_size(compressed_size)} ({compression_ratio:.1f}% reduction)"
+    if 'ssim' in result:
+        summary += f" [quality {result['quality']}, SSIM {result['ssim']:.4f}, {result['probes']} probe(s)]"
+    elif result.get('probes'):
+        summary += f" [quality {result['quality']}, {result['probes']} probe(s)"
+        summary += "]" if result['target_met'] else ", target not met]"
+    if result.get('candidates'):
+        tried = ", ".join(f"{fmt} {format_size(size)}" for fmt, size in sorted(result['candidates'].items()))
+        summary += f" [{result['format']} chosen from {tried}]"
+    if result.get('variants'):
+        sizes = sorted({(variant['width'], variant['height']) for variant in result['variants']}, reverse=True)
+        formats = sorted({variant['format'] for variant in result['variants']})
+        summary += (f" [{len(result['variants'])} variants: {', '.join(f'{w}x{h}' for w, h in sizes)} "
+                    f"as {', '.join(formats)}]")
+    if result.get('png'):
+        summary += f" [PNG: {describe_png(result['png'])}]"
+    if result.get('lossless'):
+        method = LOSSLESS_METHODS[result['lossless']]
+        if result.get('jpegtran_missing'):
+            # Not 'already optimal': jpegtran could have shrunk it
+            method = 'copied' if result['lossless'] == 'copied' else method
+            method += "; jpegtran not found, Huffman tables not optimized"
+        summary += f" [lossless: {method}]"
+    if result.get('metadata_removed'):
+        summary += f" [{format_size(result['metadata_removed'])} of metadata removed]"
+    return summary
+
+
+def describe_png(details):
+    """Short description of the encoding optimize_png() picked"""
+    if details['mode'] == 'P':
+        stored = f"palette of {details['colors']} colors"
+        if 'psnr' in details:
+            stored += f" (lossy, PSNR {details['psnr']:.1f} dB)"
+    else:
+        stored = details['mode']
+    optimized = " optimized" if details['optimize'] else ""
+    return (f"{stored}, zlib level {details['level']} {details['strategy']}{optimized}, "
+            f"{details['trials']} trial(s)")
+
+
+def describe_lossless(event):
+    """One line summary of the lossless JPEG results in a 'finished' event"""
+    summary = (f"Lossless JPEG: {event['lossless_files']} file(s), {format_size(event['lossless_saved'])} saved "
+               f"without re-encoding ({event['lossless_copied']} copied unchanged)")
+    if event.get('lossless_no_jpegtran'):
+        summary += (f"; {event['lossless_no_jpegtran']} could shrink further with jpegtran (libjpeg-turbo) "
+                    f"installed")
+    return summary
+
+
+def describe_png_search(event):
+    """One line summary of the PNG search results in a 'finished' event"""
+    strategies = ", ".join(f"{name} {count}" for name, count in sorted(event['png_strategies'].items()))
+    return (f"PNG search: {event['png_files']} file(s), {event['png_palette']} stored with a palette; "
+            f"winning zlib strategies: {strategies}")
+
+
+def describe_format_wins(format_wins, saved_vs_auto):
+    """One line summary of the 'smallest' format choices of a batch"""
+    wins = ", ".join(f"{fmt} {count}" for fmt, count in sorted(format_wins.items()))
+    if saved_vs_auto >= 0:
+        return f"Smallest format: {wins}; {format_size(saved_vs_auto)} smaller than 'auto'"
+    return f"Smallest format: {wins}; {format_size(-saved_vs_auto)} larger than 'auto'"
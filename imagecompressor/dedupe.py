@@ -0,0 +1,157 @@
+import os
+import shutil
+from collections import defaultdict
+
+from PIL import Image
+
+from .core import atomic_output, format_size
+from .manifest import file_digest
+
+try:
+    import numpy as np
+except ImportError:  # optional: speeds up the near-duplicate search
+    np = None
+
+DEDUPE_MODES = ['off', 'exact', 'near']
+
+# dHash grid: 8x8 comparisons of horizontally adjacent pixels = 64 bits
+HASH_SIZE = 8
+
+
+def difference_hash(img):
+    """64-bit dHash of an opened image; similar images get hashes a few bits apart"""
+    # A DCT-scaled JPEG decode is plenty for a 9x8 thumbnail
+    img.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+    small = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _exact_groups(paths):
+    """Lists of paths with identical contents; only same-size files are hashed"""
+    by_size = defaultdict(list)
+    for path in paths:
+        try:
+            by_size[os.path.getsize(path)].append(path)
+        except OSError:
+            continue
+    groups = []
+    for same_size in by_size.values():
+        if len(same_size) < 2:
+            continue
+        by_digest = defaultdict(list)
+        for path in same_size:
+            try:
+                by_digest[file_digest(path)].append(path)
+            except OSError:
+                continue
+        groups.extend(group for group in by_digest.values() if len(group) > 1)
+    return groups
+
+
+def _hamming_distances(hashes, index):
+    """Bit distance from hashes[index] to every hash (a uint64 array or a list of ints)"""
+    if np is not None:
+        xor = (hashes ^ hashes[index]).view(np.uint8).reshape(-1, 8)
+        return np.unpackbits(xor, axis=1).sum(axis=1)
+    return [bin(value ^ hashes[index]).count('1') for value in hashes]
+
+
+def _near_groups(paths, max_distance):
+    """Greedy clusters of images whose dHash is within max_distance bits of a representative.
+
+    Candidates are visited largest first, so each cluster is represented by
+    its highest resolution member. Clusters are not chained: every member is
+    close to the representative itself, not just to another member.
+    """
+    entries = []
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                pixels = img.width * img.height
+                value = difference_hash(img)
+            entries.append((pixels, os.path.getsize(path), path, value))
+        except Exception:
+            # Unreadable files are left to the compressor to report
+            continue
+    entries.sort(key=lambda entry: (-entry[0], -entry[1], entry[2]))
+    hashes = [entry[3] for entry in entries]
+    if np is not None:
+        hashes = np.array(hashes, dtype=np.uint64)
+
+    assigned = [False] * len(entries)
+    groups = []
+    for index, entry in enumerate(entries):
+        if assigned[index]:
+            continue
+        assigned[index] = True
+        distances = _hamming_distances(hashes, index)
+        members = [entry[2]]
+        for other in range(index + 1, len(entries)):
+            if not assigned[other] and distances[other] <= max_distance:
+                assigned[other] = True
+                members.append(entries[other][2])
+        if len(members) > 1:
+            groups.append(members)
+    return groups
+
+
+def find_duplicates(paths, mode='exact', max_distance=4):
+    """Map each duplicate path to the path of the copy that will be compressed.
+
+    'exact' groups files with identical contents (first listed copy wins);
+    'near' additionally groups images whose perceptual hashes are within
+    max_distance bits, represented by the largest image of each group.
+    """
+    duplicates = {}
+    if mode == 'off':
+        return duplicates
+    for group in _exact_groups(paths):
+        for path in group[1:]:
+            duplicates[path] = group[0]
+    if mode == 'near':
+        remaining = [path for path in paths if path not in duplicates]
+        for group in _near_groups(remaining, max_distance):
+            for path in group[1:]:
+                duplicates[path] = group[0]
+        # Exact copies follow their original into its near group
+        for path, original in duplicates.items():
+            while original in duplicates:
+                original = duplicates[original]
+            duplicates[path] = original
+    return duplicates
+
+
+def describe_duplicates(event):
+    """One line summary of the duplicate handling in a 'finished' event"""
+    return (f"Duplicates: {event['duplicates']} file(s) not compressed again "
+            f"({format_size(event['duplicate_bytes'])} of input skipped), "
+            f"{format_size(event['linked_bytes'])} of output shared by hard links")
+
+
+def link_output(source_path, output_path):
+    """Make output_path a hard link to (or else a copy of) source_path.
+
+    Returns 'hardlink', 'copy' or 'same'. The link is created under a
+    temporary name and renamed into place, and outputs are always replaced
+    rather than rewritten, so linked files never change underneath each other.
+    """
+    if os.path.exists(output_path) and os.path.samefile(source_path, output_path):
+        # Same path, or already linked by an earlier duplicate (renaming a
+        # link over its own inode would be a no-op that leaves the temp file)
+        return 'same'
+    with atomic_output(output_path) as temp_path:
+        try:
+            os.link(source_path, temp_path)
+            method = 'hardlink'
+        except OSError:
+            # Different filesystem, or links not supported
+            shutil.copyfile(source_path, temp_path)
+            method = 'copy'
+    return method
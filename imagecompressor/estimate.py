@@ -0,0 +1,265 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from .core import (REDUCING_GAP, RESAMPLE_METHODS, QUALITY_FORMATS, SMALLEST_CANDIDATES, determine_output_format,
+                   encode_image, get_save_kwargs, get_target_size, has_alpha, open_image, prepare_for_format,
+                   lossless_metadata, resolve_settings, settings_fingerprint, use_lossless_jpeg)
+from .jpeg import optimize_losslessly
+from .metadata import SWAPPED_ORIENTATIONS, oriented_settings, read_metadata
+from .png import encode_trial, search_png
+
+# Sampled tiles are this many output pixels on a side
+TILE_SIZE = 128
+
+# Tiles per axis; 4x4 = 16 tiles spread evenly over the image
+TILE_GRID = 4
+
+# Extra relative error allowed for effects that tiles can't see (entropy
+# coder tables shared across the whole image, tile edges, ...)
+MODEL_ERROR = 0.08
+
+# Bounded memo caches; keys include the file's mtime so edits invalidate them
+MAX_CACHED_ESTIMATES = 512
+MAX_CACHED_SAMPLES = 16
+MAX_CACHED_PNG_SEARCHES = 16
+
+_lock = threading.Lock()
+_estimates = OrderedDict()
+_samples = OrderedDict()
+_png_searches = OrderedDict()
+
+
+def _cache_get(cache, key):
+    with _lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    return None
+
+
+def _cache_put(cache, key, value, limit):
+    with _lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+
+def _tile_boxes(width, height, tile):
+    """Evenly spread, non-overlapping tile boxes in output coordinates.
+
+    Origins are snapped to the 16 pixel JPEG macroblock grid so the tiles
+    see the same block boundaries as the full-image encode.
+    """
+    tile_w = min(tile, width)
+    tile_h = min(tile, height)
+
+    def origins(extent, size):
+        return sorted({int((extent - size) * (i + 0.5) / TILE_GRID) // 16 * 16 for i in range(TILE_GRID)})
+
+    xs = origins(width, tile_w)
+    ys = origins(height, tile_h)
+    return [(x, y, x + tile_w, y + tile_h) for y in ys for x in xs]
+
+
+def _sample_key(input_path, settings):
+    stat = os.stat(input_path)
+    return (os.path.abspath(input_path), stat.st_mtime_ns, stat.st_size, settings['max_width'],
+            settings['max_height'], settings['resample_method'], settings.get('fast_decode', True))
+
+
+def sample_tiles(input_path, settings):
+    """Decode the image at reduced scale and cut out tiles at output resolution.
+
+    The image is opened like compress() opens it (max_image_pixels
+    applies) and decoded at the same reduced scale: with fast_decode, JPEGs
+    are DCT-scaled to the smallest scale at or above the output size and
+    other formats are resampled with the same reduce() step.
+
+    Returns (tiles, output_size, original_size). Only depends on geometry
+    settings, so it is cached separately from the encoder settings and a
+    quality change only costs the tile encodes. Sizes are those of the
+    stored raster, before any EXIF orientation is applied.
+    """
+    key = _sample_key(input_path, settings)
+    cached = _cache_get(_samples, key)
+    if cached:
+        return cached
+
+    fast_decode = settings.get('fast_decode', True)
+    with open_image(input_path, settings) as img:
+        original_size = img.size
+        output_size = get_target_size(original_size, settings) or original_size
+        if img.format == 'JPEG' and fast_decode and output_size != original_size:
+            img.draft(img.mode, output_size)
+        img.load()
+
+        resample = RESAMPLE_METHODS.get(settings['resample_method'], Image.Resampling.LANCZOS)
+        reducing_gap = REDUCING_GAP if fast_decode else None
+        scale_x = img.width / output_size[0]
+        scale_y = img.height / output_size[1]
+        tiles = []
+        for box in _tile_boxes(output_size[0], output_size[1], TILE_SIZE):
+            tile_size = (box[2] - box[0], box[3] - box[1])
+            source_box = (box[0] * scale_x, box[1] * scale_y, box[2] * scale_x, box[3] * scale_y)
+            if scale_x == 1 and scale_y == 1:
+                tiles.append(img.crop(box))
+            else:
+                tiles.append(img.resize(tile_size, resample, box=source_box, reducing_gap=reducing_gap))
+
+    sample = (tiles, output_size, original_size)
+    _cache_put(_samples, key, sample, MAX_CACHED_SAMPLES)
+    return sample
+
+
+def estimate_compressed_size(input_path, settings=None, proxy=None):
+    """Estimate the compressed size by encoding sampled tiles with the real settings.
+
+    Returns a dict with 'size' (bytes), 'error' (relative error bound, e.g.
+    0.12 for +/-12%), 'width' and 'height' of the output, and 'format'.
+    For format 'smallest' every candidate is estimated and the smallest
+    one is returned. proxy is an optional output-size image of input_path
+    made with the same settings by preview.make_proxy(); the tiles are then
+    cut from it instead of decoding the file again.
+    """
+    settings = resolve_settings(settings)
+    stat = os.stat(input_path)
+    key = (os.path.abspath(input_path), stat.st_mtime_ns, stat.st_size, settings_fingerprint(settings))
+    cached = _cache_get(_estimates, key)
+    if cached:
+        return cached
+
+    with open_image(input_path, settings) as img:
+        metadata = read_metadata(img, settings)
+        sizing = oriented_settings(settings, metadata['orientation'])
+        if use_lossless_jpeg(img, determine_output_format(input_path, settings['format']), sizing):
+            estimate = _estimate_lossless(input_path, img, metadata, settings)
+            _cache_put(_estimates, key, estimate, MAX_CACHED_ESTIMATES)
+            return estimate
+    if proxy is not None:
+        # Already oriented, so its size is the output size as shown
+        tiles = [proxy.crop(box) for box in _tile_boxes(proxy.width, proxy.height, TILE_SIZE)]
+        output_size = proxy.size
+    else:
+        # Tiles are cut from the stored raster; rotation doesn't change the bytes per pixel
+        tiles, output_size, _ = sample_tiles(input_path, sizing)
+    sample_key = _sample_key(input_path, sizing)
+    output_format = determine_output_format(input_path, settings['format'])
+    if output_format == 'smallest':
+        formats = [fmt for fmt in SMALLEST_CANDIDATES if not (fmt == 'JPEG' and has_alpha(tiles[0]))]
+    else:
+        formats = [output_format]
+
+    estimate = None
+    for output_format in formats:
+        candidate = _estimate_format(tiles, output_size, output_format, settings, metadata, sample_key)
+        if estimate is None or candidate['size'] < estimate['size']:
+            estimate = candidate
+    if proxy is None and metadata['orientation'] in SWAPPED_ORIENTATIONS:
+        estimate = dict(estimate, width=estimate['height'], height=estimate['width'])
+    _cache_put(_estimates, key, estimate, MAX_CACHED_ESTIMATES)
+    return estimate
+
+
+def _estimate_lossless(input_path, img, metadata, settings):
+    """Exact size of a lossless JPEG rewrite; it never decodes, so just run it"""
+    kept = lossless_metadata(img, metadata, settings)
+    with open(input_path, 'rb') as f:
+        data, _ = optimize_losslessly(f.read(), kept, settings)
+    width, height = img.size
+    if metadata['orientation'] in SWAPPED_ORIENTATIONS:
+        width, height = height, width
+    return {'size': len(data), 'error': 0.0, 'width': width, 'height': height, 'format': 'JPEG'}
+
+
+def _mosaic(tiles):
+    """The tiles side by side in one image, and the box of each"""
+    width, height = tiles[0].size
+    columns = math.ceil(math.sqrt(len(tiles)))
+    rows = math.ceil(len(tiles) / columns)
+    mosaic = Image.new(tiles[0].mode, (width * columns, height * rows))
+    if tiles[0].mode == 'P':
+        mosaic.putpalette(tiles[0].getpalette())
+        mosaic.info = dict(tiles[0].info)
+    boxes = []
+    for index, tile in enumerate(tiles):
+        x, y = index % columns * width, index // columns * height
+        mosaic.paste(tile, (x, y))
+        boxes.append((x, y, x + width, y + height))
+    return mosaic, boxes
+
+
+def _png_encoder(tiles, save_kwargs, settings, sample_key=None):
+    """Tiles and an encode function with the PNG engine's choices for the whole sample.
+
+    The pixel format (palette, gray, alpha) and zlib settings depend on the
+    whole image, so they are searched once on a mosaic of all tiles, as
+    encode_png() would, and the tiles are cut back out of the reduced image.
+    The search doesn't depend on the quality, so it is cached per sample
+    and a slider move only re-encodes the tiles.
+    """
+    gray = not save_kwargs.get('icc_profile')
+    min_psnr = settings.get('png_quantize') or 0
+    key = None
+    if sample_key is not None:
+        key = (sample_key, settings['format'] == 'smallest', gray, min_psnr, save_kwargs.get('optimize'))
+    cached = _cache_get(_png_searches, key) if key else None
+    if cached is None:
+        mosaic, boxes = _mosaic(tiles)
+        _, reduced, setting, _ = search_png(mosaic, save_kwargs, gray=gray, min_psnr=min_psnr)
+        cached = ([reduced.crop(box) for box in boxes], setting)
+        if key:
+            _cache_put(_png_searches, key, cached, MAX_CACHED_PNG_SEARCHES)
+    reduced_tiles, setting = cached
+
+    def encode(img):
+        return encode_trial(img, save_kwargs, *setting)
+    return reduced_tiles, encode
+
+
+def _estimate_format(tiles, output_size, output_format, settings, metadata=None, sample_key=None):
+    if settings['format'] == 'smallest':
+        # Same conversions encode_smallest() applies
+        tiles = [prepare_for_format(tile, output_format) for tile in tiles]
+    save_kwargs = get_save_kwargs(output_format, settings, metadata, tiles[0].mode)
+    if output_format == 'PNG' and settings.get('png_optimize'):
+        tiles, encode = _png_encoder(tiles, save_kwargs, settings, sample_key)
+    else:
+        def encode(img):
+            return encode_image(img, output_format, save_kwargs)
+
+    # Fixed container overhead (headers, tables, metadata) measured on a 1x1 image
+    overhead = len(encode(tiles[0].resize((1, 1))))
+
+    densities = []
+    for tile in tiles:
+        data = encode(tile)
+        densities.append(max(0, len(data) - overhead) / (tile.width * tile.height))
+
+    mean = sum(densities) / len(densities)
+    size = int(mean * output_size[0] * output_size[1] + overhead)
+
+    # Relative standard error of the mean tile density (95% interval)
+    # plus a fixed allowance for what tiles can't capture
+    if len(densities) > 1 and mean > 0:
+        variance = sum((d - mean) ** 2 for d in densities) / (len(densities) - 1)
+        sampling_error = 1.96 * math.sqrt(variance / len(densities)) / mean
+    else:
+        sampling_error = 0.0
+    error = sampling_error + MODEL_ERROR
+
+    target_size_kb = settings.get('target_size_kb') or 0
+    if target_size_kb > 0 and output_format in QUALITY_FORMATS:
+        size = min(size, int(target_size_kb * 1024))
+
+    return {
+        'size': size,
+        'error': error,
+        'width': output_size[0],
+        'height': output_size[1],
+        'format': output_format
+    }
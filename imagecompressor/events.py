@@ -0,0 +1,71 @@
+import queue
+import threading
+import time
+
+# Event kinds. Every event is a plain dict with 'event' (one of these) and
+# 'time' (time.time() when it was emitted), plus kind-specific fields.
+STARTED = 'started'          # total, workers
+FILE_DONE = 'file_done'      # index, processed, total, result
+FILE_FAILED = 'file_failed'  # index, processed, total, input_path, error
+FILE_SKIPPED = 'file_skipped'  # index, processed, total, input_path, reason (collision policy 'skip')
+FINISHED = 'finished'        # processed, failed, cached, skipped, original_bytes, compressed_bytes, elapsed,
+                             # format_wins / saved_vs_auto (format 'smallest'),
+                             # duplicates, duplicate_bytes, linked_bytes (dedupe),
+                             # metadata_removed (bytes of EXIF/XMP/ICC not carried over),
+                             # lossless_files, lossless_saved, lossless_copied,
+                             # lossless_no_jpegtran (jpeg_lossless),
+                             # png_files, png_palette, png_strategies (png_optimize)
+LOG = 'log'                  # message
+ERROR = 'error'              # message; the batch as a whole failed
+
+
+class EventBus:
+    """Thread-safe publish/subscribe channel for batch progress.
+
+    Subscribers are called synchronously in the emitting thread, so they
+    must be cheap; GUI code subscribes an EventQueue and drains it on its
+    own thread instead of touching widgets from the worker thread.
+    """
+
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def emit(self, kind, **data):
+        event = {'event': kind, 'time': time.time()}
+        event.update(data)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            callback(event)
+        return event
+
+
+class EventQueue:
+    """Subscriber that buffers events until another thread drains them"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def __call__(self, event):
+        self.queue.put(event)
+
+    def drain(self):
+        """Return every buffered event without blocking"""
+        events = []
+        try:
+            while True:
+                events.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return events
@@ -0,0 +1,1040 @@
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox, scrolledtext
+import os
+import threading
+import queue
+from PIL import ImageTk
+import io
+from pathlib import Path
+import json
+from datetime import datetime
+import sys
+
+from .core import (DEFAULT_SETTINGS, SETTINGS_FILE, format_size, describe_result, describe_format_wins,
+                   describe_lossless, describe_png_search)
+from .batch import BatchCompressor
+from .manifest import Manifest
+from .scan import FolderScanner, FileList
+from .events import EventBus, EventQueue, STARTED, FILE_DONE, FILE_FAILED, FILE_SKIPPED, FINISHED, LOG, ERROR
+from .job import JobControl, Journal
+from .profiling import ProfileReport
+from .dedupe import DEDUPE_MODES, describe_duplicates
+from .naming import COLLISION_POLICIES, OUTPUT_LAYOUTS, check_template
+from .preview import (PREFETCH_NEIGHBOURS, PREVIEW_SIZE, ZOOM_LEVELS, LivePreview, PreviewCache,
+                      default_disk_cache_dir, split_view)
+
+# Fonts and icons live next to the package, at the repository root
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+
+# How often the Tk main loop applies queued progress events
+EVENT_POLL_MS = 100
+
+# How often a preview that is still being decoded is checked for
+PREVIEW_POLL_MS = 30
+
+class ImageCompressor:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Advanced Image Compressor")
+        self.root.geometry("1300x600")
+        self.root.configure(bg='#f5f5f5')
+        
+        # Set minimum window size to prevent UI from becoming too cramped
+        self.root.minsize(1300, 600)
+        
+        # Set application icon
+        self.set_application_icon()
+        
+        # Load custom fonts
+        try:
+            font_path = os.path.join(ASSETS_DIR, "fonts")
+            self.regular_font = ("fccTYPO-Regular", 11)
+            self.bold_font = ("fccTYPO-Bold", 11)
+        except Exception as e:
+            print(f"Warning: Could not load custom fonts: {e}")
+            self.regular_font = ("Arial", 11)
+            self.bold_font = ("Arial", 11)
+        
+        # Variables
+        self.input_files = FileList()
+        self.scanners = []
+        # Folders added with "Add Folder"; the 'mirror' layout keeps their structure
+        self.scan_roots = []
+        self.output_dir = ""
+        self.preview_file = None
+        # Thumbnails are decoded on a small thread pool and kept in an LRU
+        self.previews = PreviewCache()
+        self.preview_request = None
+        self.estimate_job = None
+        # Size estimates run on the live preview's thread, from its cached proxy
+        self.estimate_request = None
+        self.estimate_line = ""
+        # Before/after view: the selected file re-encoded on a background thread
+        self.live_preview = LivePreview()
+        self.live_request = None
+        self.live_result = None
+        self.preview_zoom = 1
+        self.preview_focus = (0.5, 0.5)
+        self.job_control = None
+        self.compression_settings = dict(DEFAULT_SETTINGS)
+        
+        # Worker threads report through the event bus; drain_events applies
+        # the events to the widgets from the Tk main loop
+        self.events = EventBus()
+        self.event_queue = self.events.subscribe(EventQueue())
+        
+        self.setup_ui()
+        self.load_settings()
+        self.root.after(EVENT_POLL_MS, self.drain_events)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Apply some styling
+        self.apply_styling()
+        
+    def set_application_icon(self):
+        """Set the application icon based on platform"""
+        try:
+            icon_path = os.path.join(ASSETS_DIR, "icons")
+            if sys.platform == "darwin":
+                icon_file = os.path.join(icon_path, "icon.png")
+                if os.path.exists(icon_file):
+                    icon = tk.PhotoImage(file=icon_file)
+                    self.root.iconphoto(True, icon)
+            elif sys.platform == "win32":
+                icon_file = os.path.join(icon_path, "icon.ico")
+                if os.path.exists(icon_file):
+                    self.root.iconbitmap(icon_file)
+            else:
+                icon_file = os.path.join(icon_path, "icon.png")
+                if os.path.exists(icon_file):
+                    icon = tk.PhotoImage(file=icon_file)
+                    self.root.iconphoto(True, icon)
+        except Exception as e:
+            print(f"Error loading application icon: {str(e)}")
+        
+    def setup_ui(self):
+        # Main frame
+        main_frame = ttk.Frame(self.root, padding="10")
+        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        # Configure grid weights
+        self.root.columnconfigure(0, weight=1)
+        self.root.rowconfigure(0, weight=1)
+        main_frame.columnconfigure(1, weight=1)
+        
+        # Title
+        title_label = ttk.Label(main_frame, text="Advanced Image Compressor", 
+                               font=self.bold_font)
+        title_label.grid(row=0, column=0, columnspan=3, pady=(0, 10))
+        
+        # Create main content area with two columns
+        content_frame = ttk.Frame(main_frame)
+        content_frame.grid(row=1, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        content_frame.columnconfigure(0, weight=1)
+        content_frame.columnconfigure(1, weight=1)
+        content_frame.rowconfigure(0, weight=1)
+        
+        # Left column: File selection and settings
+        left_column = ttk.Frame(content_frame)
+        left_column.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(0, 5))
+        
+        # Right column: Preview and controls
+        right_column = ttk.Frame(content_frame)
+        right_column.grid(row=0, column=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(5, 0))
+        
+        # File selection section
+        self.create_file_section(left_column)
+        
+        # Compression settings section
+        self.create_settings_section(left_column)
+        
+        # Preview section
+        self.create_preview_section(right_column)
+        
+        # Control buttons
+        self.create_control_buttons(right_column)
+        
+        # Progress and log section
+        self.create_progress_section(main_frame)
+        
+    def create_file_section(self, parent):
+        # File selection frame
+        file_frame = ttk.LabelFrame(parent, text="File Selection", padding="8")
+        file_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 8))
+        file_frame.columnconfigure(1, weight=1)
+        
+        # Input files
+        ttk.Label(file_frame, text="Input Files:", font=self.bold_font).grid(row=0, column=0, sticky=tk.W, pady=(0, 5))
+        
+        self.files_listbox = tk.Listbox(file_frame, height=3, selectmode=tk.EXTENDED, width=50, font=self.regular_font)
+        self.files_listbox.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 5))
+        
+        files_buttons_frame = ttk.Frame(file_frame)
+        files_buttons_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        
+        ttk.Button(files_buttons_frame, text="Add Files", 
+                  command=self.add_files).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(files_buttons_frame, text="Add Folder", 
+                  command=self.add_folder).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(files_buttons_frame, text="Clear All", 
+                  command=self.clear_files).pack(side=tk.LEFT)
+        
+        # Output directory
+        ttk.Label(file_frame, text="Output Directory:", font=self.bold_font).grid(row=3, column=0, sticky=tk.W, pady=(8, 5))
+        
+        output_frame = ttk.Frame(file_frame)
+        output_frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        output_frame.columnconfigure(0, weight=1)
+        
+        self.output_var = tk.StringVar()
+        self.output_entry = ttk.Entry(output_frame, textvariable=self.output_var)
+        self.output_entry.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 5))
+        
+        ttk.Button(output_frame, text="Browse", 
+                  command=self.select_output_dir).grid(row=0, column=1)
+        
+    def create_settings_section(self, parent):
+        # Settings frame
+        settings_frame = ttk.LabelFrame(parent, text="Compression Settings", padding="8")
+        settings_frame.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 8))
+        
+        # Create two columns for settings
+        left_settings = ttk.Frame(settings_frame)
+        left_settings.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 8))
+        
+        right_settings = ttk.Frame(settings_frame)
+        right_settings.grid(row=0, column=1, sticky=(tk.W, tk.E))
+        
+        # Left column settings - more compact layout
+        # Quality and dimensions in one row
+        quality_frame = ttk.Frame(left_settings)
+        quality_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=2)
+        quality_frame.columnconfigure(1, weight=1)
+        
+        ttk.Label(quality_frame, text="Quality:").grid(row=0, column=0, sticky=tk.W)
+        self.quality_var = tk.IntVar(value=self.compression_settings['quality'])
+        quality_scale = ttk.Scale(quality_frame, from_=1, to=100, 
+                                 variable=self.quality_var, orient=tk.HORIZONTAL)
+        quality_scale.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(5, 0))
+        self.quality_label = ttk.Label(quality_frame, text=str(self.quality_var.get()), width=3, font=self.regular_font)
+        self.quality_label.grid(row=0, column=2, padx=(5, 0))
+        quality_scale.configure(command=self.update_quality_label)
+        # Re-encode the preview as soon as the slider is let go
+        quality_scale.bind('<ButtonRelease-1>', lambda event: self.refresh_estimate())
+        
+        # Dimensions in one row
+        dim_frame = ttk.Frame(left_settings)
+        dim_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=2)
+        
+        ttk.Label(dim_frame, text="Max W:").grid(row=0, column=0, sticky=tk.W)
+        self.max_width_var = tk.IntVar(value=self.compression_settings['max_width'])
+        ttk.Entry(dim_frame, textvariable=self.max_width_var, width=8).grid(row=0, column=1, sticky=tk.W, padx=(5, 10))
+        
+        ttk.Label(dim_frame, text="Max H:").grid(row=0, column=2, sticky=tk.W)
+        self.max_height_var = tk.IntVar(value=self.compression_settings['max_height'])
+        ttk.Entry(dim_frame, textvariable=self.max_height_var, width=8).grid(row=0, column=3, sticky=tk.W, padx=(5, 0))
+        
+        # Resample method
+        ttk.Label(left_settings, text="Resample:").grid(row=2, column=0, sticky=tk.W, pady=2)
+        self.resample_var = tk.StringVar(value=self.compression_settings['resample_method'])
+        resample_combo = ttk.Combobox(left_settings, textvariable=self.resample_var, 
+                                     values=['LANCZOS', 'BICUBIC', 'BILINEAR', 'NEAREST', 'BOX', 'HAMMING'])
+        resample_combo.grid(row=2, column=1, sticky=(tk.W, tk.E), padx=(5, 0))
+        
+        # Target file size (0 = use the quality setting as is)
+        ttk.Label(left_settings, text="Target KB:").grid(row=3, column=0, sticky=tk.W, pady=2)
+        self.target_size_var = tk.IntVar(value=self.compression_settings['target_size_kb'])
+        ttk.Entry(left_settings, textvariable=self.target_size_var, 
+                  width=8).grid(row=3, column=1, sticky=tk.W, padx=(5, 0))
+        
+        # Worker processes for batch compression
+        ttk.Label(left_settings, text="Workers:").grid(row=4, column=0, sticky=tk.W, pady=2)
+        self.workers_var = tk.IntVar(value=self.compression_settings['workers'])
+        ttk.Spinbox(left_settings, from_=1, to=256, textvariable=self.workers_var, 
+                    width=6).grid(row=4, column=1, sticky=tk.W, padx=(5, 0))
+        
+        # Memory budget shared by all workers (0 = no limit)
+        ttk.Label(left_settings, text="Memory MB:").grid(row=5, column=0, sticky=tk.W, pady=2)
+        self.memory_budget_var = tk.IntVar(value=self.compression_settings['memory_budget_mb'])
+        ttk.Entry(left_settings, textvariable=self.memory_budget_var, 
+                  width=8).grid(row=5, column=1, sticky=tk.W, padx=(5, 0))
+        
+        # Perceptual mode: lowest quality that keeps SSIM above this (0 = off)
+        ttk.Label(left_settings, text="Min SSIM:").grid(row=6, column=0, sticky=tk.W, pady=2)
+        self.min_ssim_var = tk.DoubleVar(value=self.compression_settings['min_ssim'])
+        ttk.Entry(left_settings, textvariable=self.min_ssim_var, 
+                  width=8).grid(row=6, column=1, sticky=tk.W, padx=(5, 0))
+        
+        # Right column settings - more compact
+        # Format and checkboxes in one column
+        ttk.Label(right_settings, text="Format:").grid(row=0, column=0, sticky=tk.W, pady=2)
+        self.format_var = tk.StringVar(value=self.compression_settings['format'])
+        format_combo = ttk.Combobox(right_settings, textvariable=self.format_var, 
+                                   values=['auto', 'smallest', 'JPEG', 'PNG', 'WEBP'])
+        format_combo.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(5, 0))
+        
+        # Compress duplicate inputs once ('near' also matches resized/re-saved copies)
+        ttk.Label(right_settings, text="Duplicates:").grid(row=2, column=0, sticky=tk.W, pady=2)
+        self.dedupe_var = tk.StringVar(value=self.compression_settings['dedupe'])
+        ttk.Combobox(right_settings, textvariable=self.dedupe_var, values=DEDUPE_MODES,
+                     state='readonly').grid(row=2, column=1, sticky=(tk.W, tk.E), padx=(5, 0))
+        
+        # Output naming: folder layout, file name template and what to do on clashes
+        ttk.Label(right_settings, text="Layout:").grid(row=3, column=0, sticky=tk.W, pady=2)
+        self.layout_var = tk.StringVar(value=self.compression_settings['output_layout'])
+        ttk.Combobox(right_settings, textvariable=self.layout_var, values=OUTPUT_LAYOUTS,
+                     state='readonly').grid(row=3, column=1, sticky=(tk.W, tk.E), padx=(5, 0))
+        
+        ttk.Label(right_settings, text="File Name:").grid(row=4, column=0, sticky=tk.W, pady=2)
+        self.name_template_var = tk.StringVar(value=self.compression_settings['name_template'])
+        ttk.Entry(right_settings, textvariable=self.name_template_var).grid(row=4, column=1, sticky=(tk.W, tk.E),
+                                                                             padx=(5, 0))
+        
+        ttk.Label(right_settings, text="On Collision:").grid(row=5, column=0, sticky=tk.W, pady=2)
+        self.collision_var = tk.StringVar(value=self.compression_settings['collision'])
+        ttk.Combobox(right_settings, textvariable=self.collision_var, values=COLLISION_POLICIES,
+                     state='readonly').grid(row=5, column=1, sticky=(tk.W, tk.E), padx=(5, 0))
+        
+        # Checkboxes in a more compact layout
+        checkbox_frame = ttk.Frame(right_settings)
+        checkbox_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=2)
+        
+        self.optimize_var = tk.BooleanVar(value=self.compression_settings['optimize'])
+        ttk.Checkbutton(checkbox_frame, text="Optimize", 
+                       variable=self.optimize_var).pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.progressive_var = tk.BooleanVar(value=self.compression_settings['progressive'])
+        ttk.Checkbutton(checkbox_frame, text="Progressive", 
+                       variable=self.progressive_var).pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.keep_exif_var = tk.BooleanVar(value=self.compression_settings['keep_exif'])
+        ttk.Checkbutton(checkbox_frame, text="Keep EXIF", 
+                       variable=self.keep_exif_var).pack(side=tk.LEFT, padx=(0, 10))
+        
+        # Reduced-scale decoding; turn off when bit-exact output matters
+        self.fast_decode_var = tk.BooleanVar(value=self.compression_settings['fast_decode'])
+        ttk.Checkbutton(checkbox_frame, text="Fast Decode", 
+                       variable=self.fast_decode_var).pack(side=tk.LEFT, padx=(0, 10))
+        
+        # Skip files already compressed with the same settings
+        self.incremental_var = tk.BooleanVar(value=self.compression_settings['incremental'])
+        ttk.Checkbutton(checkbox_frame, text="Skip Unchanged", 
+                       variable=self.incremental_var).pack(side=tk.LEFT)
+        
+        # Configure column weights
+        left_settings.columnconfigure(1, weight=1)
+        right_settings.columnconfigure(1, weight=1)
+        settings_frame.columnconfigure(0, weight=1)
+        settings_frame.columnconfigure(1, weight=1)
+        
+    def create_preview_section(self, parent):
+        # Preview frame
+        preview_frame = ttk.LabelFrame(parent, text="Preview", padding="8")
+        preview_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 8))
+        preview_frame.columnconfigure(1, weight=1)
+        preview_frame.rowconfigure(0, weight=1)
+        
+        # Preview canvas
+        self.preview_canvas = tk.Canvas(preview_frame, width=PREVIEW_SIZE[0], height=PREVIEW_SIZE[1], bg='white')
+        self.preview_canvas.grid(row=0, column=0, padx=(0, 8))
+        # Before/after view: wheel zooms, click picks the spot to look at
+        self.preview_canvas.bind('<MouseWheel>', self.on_preview_wheel)
+        self.preview_canvas.bind('<Button-4>', self.on_preview_wheel)
+        self.preview_canvas.bind('<Button-5>', self.on_preview_wheel)
+        self.preview_canvas.bind('<Button-1>', self.on_preview_click)
+        self.live_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(preview_frame, text="Before / After", variable=self.live_var,
+                        command=self.toggle_live_preview).grid(row=1, column=0, sticky=tk.W)
+        
+        # File info
+        info_frame = ttk.Frame(preview_frame)
+        info_frame.grid(row=0, column=1, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        self.info_text = scrolledtext.ScrolledText(info_frame, width=45, height=7, font=self.regular_font)
+        self.info_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        # Configure weights
+        info_frame.columnconfigure(0, weight=1)
+        info_frame.rowconfigure(0, weight=1)
+        
+        # Bind file selection
+        self.files_listbox.bind('<<ListboxSelect>>', self.on_file_select)
+        
+    def create_control_buttons(self, parent):
+        # Control buttons frame
+        buttons_frame = ttk.Frame(parent)
+        buttons_frame.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=(0, 8))
+        
+        ttk.Button(buttons_frame, text="Compress Images", 
+                  command=self.start_compression).pack(side=tk.LEFT, padx=(0, 8))
+        self.pause_button = ttk.Button(buttons_frame, text="Pause", 
+                                       command=self.toggle_pause, state=tk.DISABLED)
+        self.pause_button.pack(side=tk.LEFT, padx=(0, 8))
+        self.cancel_button = ttk.Button(buttons_frame, text="Cancel", 
+                                        command=self.cancel_compression, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Button(buttons_frame, text="Save Settings", 
+                  command=self.save_settings).pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Button(buttons_frame, text="Reset Settings", 
+                  command=self.reset_settings).pack(side=tk.LEFT)
+        
+    def create_progress_section(self, parent):
+        # Progress frame
+        progress_frame = ttk.LabelFrame(parent, text="Progress & Log", padding="8")
+        progress_frame.grid(row=2, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        
+        # Progress bar
+        self.progress_var = tk.DoubleVar()
+        self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, 
+                                           maximum=100)
+        self.progress_bar.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=(0, 5))
+        
+        # Status label
+        self.status_var = tk.StringVar(value="Ready")
+        ttk.Label(progress_frame, textvariable=self.status_var, font=self.regular_font).grid(row=1, column=0, sticky=tk.W, pady=(0, 5))
+        
+        # Log text
+        self.log_text = scrolledtext.ScrolledText(progress_frame, height=4, font=self.regular_font)
+        self.log_text.grid(row=2, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        # Configure weights
+        parent.rowconfigure(2, weight=1)
+        progress_frame.columnconfigure(0, weight=1)
+        progress_frame.rowconfigure(2, weight=1)
+        
+    def update_quality_label(self, value):
+        self.quality_label.config(text=str(int(float(value))))
+        
+        # Debounce: re-estimate once the slider has been still for a moment
+        if self.estimate_job:
+            self.root.after_cancel(self.estimate_job)
+        self.estimate_job = self.root.after(150, self.refresh_estimate)
+        
+    def add_files(self):
+        files = filedialog.askopenfilenames(
+            title="Select Image Files",
+            filetypes=[
+                ("Image files", "*.jpg *.jpeg *.png *.bmp *.tiff *.webp"),
+                ("JPEG files", "*.jpg *.jpeg"),
+                ("PNG files", "*.png"),
+                ("All files", "*.*")
+            ]
+        )
+        self.add_paths(files)
+        self.update_file_count()
+        
+    def add_paths(self, paths):
+        added = self.input_files.extend(paths)
+        if added:
+            self.files_listbox.insert(tk.END, *[os.path.basename(path) for path in added])
+        
+    def add_folder(self):
+        folder = filedialog.askdirectory(title="Select Folder with Images")
+        if folder:
+            # Scan in the background; results are added in batches by poll_scanner
+            scanner = FolderScanner(folder)
+            self.scanners.append(scanner)
+            self.scan_roots.append(folder)
+            self.input_files.begin_scan()
+            scanner.start()
+            self.poll_scanner(scanner)
+        self.update_file_count()
+        
+    def poll_scanner(self, scanner):
+        finished = False
+        try:
+            while True:
+                batch = scanner.batches.get_nowait()
+                if batch is None:
+                    finished = True
+                    break
+                if scanner in self.scanners:
+                    self.add_paths(batch)
+        except queue.Empty:
+            pass
+            
+        if finished:
+            if scanner in self.scanners:
+                self.scanners.remove(scanner)
+                self.input_files.end_scan()
+        else:
+            self.root.after(100, self.poll_scanner, scanner)
+        self.update_file_count()
+        
+    def clear_files(self):
+        for scanner in self.scanners:
+            scanner.stop()
+            self.input_files.end_scan()
+        self.scanners = []
+        self.scan_roots = []
+        self.input_files.clear()
+        self.files_listbox.delete(0, tk.END)
+        self.preview_canvas.delete("all")
+        self.info_text.delete(1.0, tk.END)
+        self.preview_file = None
+        self.preview_request = None
+        self.estimate_request = None
+        self.live_request = None
+        self.live_result = None
+        self.update_file_count()
+        
+    def select_output_dir(self):
+        directory = filedialog.askdirectory(title="Select Output Directory")
+        if directory:
+            self.output_var.set(directory)
+            
+    def update_file_count(self):
+        count = len(self.input_files)
+        if self.scanners:
+            self.status_var.set(f"Scanning - {count} file(s) found so far")
+        else:
+            self.status_var.set(f"Ready - {count} file(s) selected")
+        
+    def on_file_select(self, event):
+        selection = self.files_listbox.curselection()
+        if selection:
+            position = selection[0]
+            self.show_preview(self.input_files[position])
+            # Decode the neighbours too, so stepping through the list doesn't wait
+            first = max(0, position - PREFETCH_NEIGHBOURS)
+            last = min(len(self.input_files), position + PREFETCH_NEIGHBOURS + 1)
+            self.previews.prefetch([self.input_files[i] for i in range(first, last) if i != position])
+            
+    def show_preview(self, file_path):
+        # Cached thumbnails show at once; others are polled for so the UI
+        # keeps responding while a large file decodes
+        self.preview_request = file_path
+        self.live_request = None
+        self.live_result = None
+        self.preview_focus = (0.5, 0.5)
+        future = self.previews.request(file_path)
+        if future.done():
+            self.display_preview(file_path, future)
+        else:
+            self.root.after(PREVIEW_POLL_MS, self.poll_preview, file_path, future)
+            
+    def poll_preview(self, file_path, future):
+        if self.preview_request != file_path:
+            # The selection moved on; the thumbnail still lands in the cache
+            return
+        if future.done():
+            self.display_preview(file_path, future)
+        else:
+            self.root.after(PREVIEW_POLL_MS, self.poll_preview, file_path, future)
+            
+    def display_preview(self, file_path, future):
+        try:
+            entry = future.result()
+            
+            info = f"File: {os.path.basename(file_path)}\n"
+            info += f"Original Size: {format_size(entry.original_size)}\n"
+            info += f"Dimensions: {entry.info['width']} x {entry.info['height']}\n"
+            info += f"Format: {entry.info['format']}\n"
+            info += f"Mode: {entry.info['mode']}\n"
+            
+            self.preview_file = (file_path, info, entry.original_size)
+            self.estimate_line = "Estimated Compressed: estimating..."
+            
+            # Convert to PhotoImage (Tk objects are only made on the main thread)
+            photo = ImageTk.PhotoImage(entry.thumbnail)
+            
+            # Update canvas
+            preview_width, preview_height = PREVIEW_SIZE
+            self.preview_canvas.delete("all")
+            self.preview_canvas.create_image(
+                preview_width//2, preview_height//2, 
+                image=photo, anchor=tk.CENTER
+            )
+            self.preview_canvas.image = photo  # Keep reference
+            
+            self.request_estimate()
+            self.request_live_preview()
+            
+        except Exception as e:
+            self.log_message(f"Error loading preview: {str(e)}")
+            
+    def estimate_text(self, future, original_size):
+        """Estimated size lines for the info pane from a finished estimate"""
+        try:
+            estimate = future.result()
+        except Exception as e:
+            return f"Estimated Compressed: n/a ({str(e)})"
+        estimated_size = estimate['size']
+        text = f"Estimated Compressed: {format_size(estimated_size)} (±{estimate['error'] * 100:.0f}%)\n"
+        text += f"Compression Ratio: {((original_size - estimated_size) / original_size * 100):.1f}%"
+        return text
+        
+    def refresh_estimate(self):
+        """Recompute the estimate for the previewed file after a settings change"""
+        if self.estimate_job:
+            self.root.after_cancel(self.estimate_job)
+        self.estimate_job = None
+        if not self.preview_file:
+            return
+        # Queued first: the estimate is quick once the proxy is cached
+        self.request_estimate()
+        self.request_live_preview()
+
+    def request_estimate(self):
+        """Estimate the previewed file's size with the current settings on the live preview's thread"""
+        if self.estimate_request:
+            self.estimate_request.cancel()
+        future = self.live_preview.estimate(self.preview_file[0], self.get_compression_settings(),
+                                           use_proxy=self.live_var.get())
+        self.estimate_request = future
+        # The previous estimate stays up until this one is ready
+        self.update_info()
+        self.root.after(PREVIEW_POLL_MS, self.poll_estimate, future)
+
+    def poll_estimate(self, future):
+        if future is not self.estimate_request:
+            # Superseded by a newer request or another file
+            return
+        if not future.done():
+            self.root.after(PREVIEW_POLL_MS, self.poll_estimate, future)
+            return
+        self.estimate_request = None
+        self.estimate_line = self.estimate_text(future, self.preview_file[2])
+        self.update_info()
+
+    def update_info(self):
+        """Info pane: file details, the size estimate and the live preview's encoded size"""
+        if not self.preview_file:
+            return
+        self.info_text.delete(1.0, tk.END)
+        self.info_text.insert(1.0, self.preview_file[1] + self.estimate_line + self.live_text())
+
+    def live_text(self):
+        """Info pane line with the true encoded size of the before/after preview"""
+        result = self.live_result
+        if not result or not self.preview_file or result.path != self.preview_file[0]:
+            return ""
+        original_size = self.preview_file[2]
+        ratio = (original_size - result.size) / original_size * 100 if original_size else 0.0
+        return (f"\nEncoded ({result.format}): {format_size(result.size)}, {ratio:.1f}% smaller "
+                f"[{result.elapsed * 1000:.0f} ms]")
+
+    def request_live_preview(self):
+        """Re-encode the previewed file with the current settings on the background worker"""
+        if not self.live_var.get() or not self.preview_file:
+            return
+        future = self.live_preview.request(self.preview_file[0], self.get_compression_settings())
+        self.live_request = future
+        self.root.after(PREVIEW_POLL_MS, self.poll_live_preview, future)
+
+    def poll_live_preview(self, future):
+        if future is not self.live_request:
+            # Superseded by a newer request
+            return
+        if not future.done():
+            self.root.after(PREVIEW_POLL_MS, self.poll_live_preview, future)
+            return
+        self.live_request = None
+        if future.cancelled():
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            self.log_message(f"Error encoding preview: {str(e)}")
+            return
+        if result is None or not self.preview_file or result.path != self.preview_file[0]:
+            return
+        self.live_result = result
+        self.draw_live_preview()
+        self.update_info()
+
+    def draw_live_preview(self):
+        result = self.live_result
+        if not result or not self.live_var.get():
+            return
+        zoom = ZOOM_LEVELS[self.preview_zoom]
+        view = split_view(result.before, result.after, PREVIEW_SIZE, zoom, self.preview_focus)
+        photo = ImageTk.PhotoImage(view)
+        preview_width, preview_height = PREVIEW_SIZE
+        self.preview_canvas.delete("all")
+        self.preview_canvas.create_image(preview_width//2, preview_height//2, image=photo, anchor=tk.CENTER)
+        self.preview_canvas.create_line(preview_width//2, 0, preview_width//2, preview_height, fill='white')
+        label = "fit" if not zoom else f"{zoom}:1"
+        self.preview_canvas.create_text(4, 4, text=f"Before ({label})", anchor=tk.NW, fill='white')
+        self.preview_canvas.create_text(preview_width - 4, 4, text="After", anchor=tk.NE, fill='white')
+        self.preview_canvas.image = photo  # Keep reference
+
+    def toggle_live_preview(self):
+        if self.live_var.get():
+            self.request_live_preview()
+        elif self.preview_request:
+            # Back to the plain thumbnail
+            self.live_result = None
+            self.show_preview(self.preview_request)
+
+    def on_preview_wheel(self, event):
+        if not self.live_result:
+            return
+        zoom_in = event.num == 4 or getattr(event, 'delta', 0) > 0
+        step = 1 if zoom_in else -1
+        self.preview_zoom = min(max(0, self.preview_zoom + step), len(ZOOM_LEVELS) - 1)
+        self.draw_live_preview()
+
+    def on_preview_click(self, event):
+        """Centre the zoomed view on the clicked spot"""
+        result = self.live_result
+        if not result:
+            return
+        preview_width, preview_height = PREVIEW_SIZE
+        zoom = ZOOM_LEVELS[self.preview_zoom]
+        if zoom:
+            # Move by the click's offset from the centre, in image pixels
+            focus_x = self.preview_focus[0] + (event.x - preview_width / 2) / zoom / result.before.width
+            focus_y = self.preview_focus[1] + (event.y - preview_height / 2) / zoom / result.before.height
+        else:
+            ratio = min(preview_width / result.before.width, preview_height / result.before.height)
+            focus_x = 0.5 + (event.x - preview_width / 2) / ratio / result.before.width
+            focus_y = 0.5 + (event.y - preview_height / 2) / ratio / result.before.height
+            self.preview_zoom = 1
+        self.preview_focus = (min(max(0.0, focus_x), 1.0), min(max(0.0, focus_y), 1.0))
+        self.draw_live_preview()
+        
+    def get_compression_settings(self):
+        return {
+            'quality': self.quality_var.get(),
+            'max_width': self.max_width_var.get(),
+            'max_height': self.max_height_var.get(),
+            'resample_method': self.resample_var.get(),
+            'optimize': self.optimize_var.get(),
+            'progressive': self.progressive_var.get(),
+            'keep_exif': self.keep_exif_var.get(),
+            'jpeg_lossless': self.compression_settings['jpeg_lossless'],
+            'png_optimize': self.compression_settings['png_optimize'],
+            'png_quantize': self.compression_settings['png_quantize'],
+            'variant_widths': self.compression_settings['variant_widths'],
+            'variant_formats': self.compression_settings['variant_formats'],
+            'strip_exif_extras': self.compression_settings['strip_exif_extras'],
+            'keep_icc': self.compression_settings['keep_icc'],
+            'auto_orient': self.compression_settings['auto_orient'],
+            'format': self.format_var.get(),
+            'workers': self.workers_var.get(),
+            'fast_decode': self.fast_decode_var.get(),
+            'incremental': self.incremental_var.get(),
+            'content_hash': self.compression_settings['content_hash'],
+            'resume': self.compression_settings['resume'],
+            'profile': self.compression_settings['profile'],
+            'memory_budget_mb': self.memory_budget_var.get(),
+            'min_ssim': self.min_ssim_var.get(),
+            'dedupe': self.dedupe_var.get(),
+            'near_distance': self.compression_settings['near_distance'],
+            'output_layout': self.layout_var.get(),
+            'name_template': self.name_template_var.get(),
+            'collision': self.collision_var.get(),
+            'min_psnr': self.compression_settings['min_psnr'],
+            'max_image_pixels': self.compression_settings['max_image_pixels'],
+            'thumbnail_cache': self.compression_settings['thumbnail_cache'],
+            'target_size_kb': self.target_size_var.get()
+        }
+        
+    def start_compression(self):
+        if not self.input_files and not self.scanners:
+            messagebox.showwarning("Warning", "Please select input files first!")
+            return
+            
+        if not self.output_var.get():
+            messagebox.showwarning("Warning", "Please select output directory!")
+            return
+            
+        if self.job_control:
+            messagebox.showwarning("Warning", "Compression is already running!")
+            return
+            
+        try:
+            check_template(self.name_template_var.get())
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            return
+            
+        # Read the Tk variables here, on the main thread
+        settings = self.get_compression_settings()
+        output_dir = self.output_var.get()
+        roots = list(self.scan_roots)
+        
+        self.job_control = JobControl()
+        self.pause_button.config(text="Pause", state=tk.NORMAL)
+        self.cancel_button.config(state=tk.NORMAL)
+        
+        # Start compression in separate thread
+        thread = threading.Thread(target=self.compress_images, 
+                                  args=(settings, output_dir, roots, self.job_control))
+        thread.daemon = True
+        thread.start()
+        
+    def toggle_pause(self):
+        if not self.job_control:
+            return
+        if self.job_control.paused:
+            self.job_control.resume()
+            self.pause_button.config(text="Pause")
+            self.log_message("Resumed")
+        else:
+            self.job_control.pause()
+            self.pause_button.config(text="Resume")
+            self.log_message("Paused - files already in progress will finish")
+            
+    def cancel_compression(self):
+        if self.job_control and not self.job_control.cancelled:
+            self.job_control.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.log_message("Cancelling - the run can be resumed by compressing again")
+            
+    def on_close(self):
+        # Stop handing out work; finished files are in the journal and
+        # outputs are written atomically, so the run can be resumed later
+        if self.job_control:
+            self.job_control.cancel()
+        self.previews.shutdown()
+        self.live_preview.shutdown()
+        self.root.destroy()
+        
+    def compress_images(self, settings, output_dir, roots, control):
+        # Runs on a worker thread: only talks to the UI through self.events
+        try:
+            # Start on what has been found so far if a scan is still running
+            if self.input_files.scanning:
+                input_files = self.input_files.iter_growing()
+            else:
+                input_files = list(self.input_files)
+            
+            manifest = None
+            if settings['incremental']:
+                manifest = Manifest(output_dir, settings, use_hash=settings['content_hash'])
+            journal = Journal(output_dir, settings)
+            resumed = journal.open(resume=settings['resume'])
+            if resumed:
+                self.log_message(f"Resuming interrupted run: {resumed} file(s) already done")
+            try:
+                engine = BatchCompressor(output_dir, settings, workers=settings['workers'],
+                                         manifest=manifest, events=self.events,
+                                         journal=journal, control=control, roots=roots)
+                results = engine.run(input_files)
+            finally:
+                journal.close()
+                if manifest:
+                    manifest.close()
+            if settings['profile']:
+                for line in ProfileReport().extend(results).summary_lines():
+                    self.log_message(line)
+            
+        except Exception as e:
+            self.events.emit(ERROR, message=f"Compression failed: {str(e)}")
+            
+    def drain_events(self):
+        """Apply queued events to the widgets; runs on the Tk main loop.
+        
+        Log lines are inserted in one batch and only the latest progress and
+        status of each drain are shown, so a fast batch can't flood the UI.
+        """
+        lines = []
+        progress = None
+        status = None
+        dialogs = []
+        
+        for event in self.event_queue.drain():
+            kind = event['event']
+            timestamp = datetime.fromtimestamp(event['time']).strftime("%H:%M:%S")
+            if kind == LOG:
+                lines.append(f"[{timestamp}] {event['message']}\n")
+            elif kind == STARTED:
+                lines.append(f"[{timestamp}] Starting compression with {event['workers']} worker(s)...\n")
+                progress = 0
+            elif kind in (FILE_DONE, FILE_FAILED, FILE_SKIPPED):
+                name = os.path.basename(event['result']['input_path'] if kind == FILE_DONE else event['input_path'])
+                if kind == FILE_FAILED:
+                    lines.append(f"[{timestamp}] ✗ {name} - Error: {event['error']}\n")
+                elif kind == FILE_SKIPPED:
+                    lines.append(f"[{timestamp}] – {name} - skipped: {event['reason']}\n")
+                elif event['result'].get('cached'):
+                    lines.append(f"[{timestamp}] ↺ {name} - cached\n")
+                elif event['result'].get('resumed'):
+                    lines.append(f"[{timestamp}] ↺ {name} - done in interrupted run\n")
+                else:
+                    lines.append(f"[{timestamp}] ✓ {name} - {describe_result(event['result'])}\n")
+                total = event['total'] or len(self.input_files)
+                status = f"Processed {event['processed']}/{total}: {name}"
+                progress = (event['processed'] / total) * 100 if total else 0
+            elif kind == FINISHED:
+                saved = event['original_bytes'] - event['compressed_bytes']
+                if event['cancelled']:
+                    lines.append(f"[{timestamp}] Compression cancelled after {event['processed']} file(s).\n")
+                    status = f"Cancelled - {event['processed']} files processed"
+                else:
+                    lines.append(f"[{timestamp}] Compression completed! {event['failed']} failed, "
+                                 f"{event['cached']} cached, {event['skipped']} skipped, "
+                                 f"{format_size(max(saved, 0))} saved.\n")
+                    if event['metadata_removed']:
+                        lines.append(f"[{timestamp}] Metadata: {format_size(event['metadata_removed'])} removed\n")
+                    if event['lossless_files']:
+                        lines.append(f"[{timestamp}] {describe_lossless(event)}\n")
+                    if event['png_files']:
+                        lines.append(f"[{timestamp}] {describe_png_search(event)}\n")
+                    if event['duplicates']:
+                        lines.append(f"[{timestamp}] {describe_duplicates(event)}\n")
+                    if event['format_wins']:
+                        lines.append(f"[{timestamp}] "
+                                     f"{describe_format_wins(event['format_wins'], event['saved_vs_auto'])}\n")
+                    status = f"Completed! {event['processed']} files processed"
+                    progress = 100
+                    dialogs.append((messagebox.showinfo, "Success",
+                                    f"Compression completed!\n{event['processed']} files processed."))
+                self.finish_job()
+            elif kind == ERROR:
+                lines.append(f"[{timestamp}] {event['message']}\n")
+                dialogs.append((messagebox.showerror, "Error", event['message']))
+                self.finish_job()
+        
+        if lines:
+            self.log_text.insert(tk.END, "".join(lines))
+            self.log_text.see(tk.END)
+        if progress is not None:
+            self.progress_var.set(progress)
+        if status is not None:
+            self.status_var.set(status)
+        
+        self.root.after(EVENT_POLL_MS, self.drain_events)
+        for show, title, message in dialogs:
+            show(title, message)
+            
+    def finish_job(self):
+        self.job_control = None
+        self.pause_button.config(text="Pause", state=tk.DISABLED)
+        self.cancel_button.config(state=tk.DISABLED)
+        
+    def log_message(self, message):
+        # Safe from any thread; shown on the next drain_events()
+        self.events.emit(LOG, message=message)
+        
+    def save_settings(self):
+        settings = self.get_compression_settings()
+        try:
+            with open(SETTINGS_FILE, 'w') as f:
+                json.dump(settings, f, indent=2)
+            self.log_message("Settings saved successfully!")
+        except Exception as e:
+            self.log_message(f"Error saving settings: {str(e)}")
+            
+    def load_settings(self):
+        try:
+            if os.path.exists(SETTINGS_FILE):
+                with open(SETTINGS_FILE, 'r') as f:
+                    settings = json.load(f)
+                    
+                # Update UI with loaded settings
+                self.quality_var.set(settings.get('quality', 85))
+                self.max_width_var.set(settings.get('max_width', 1920))
+                self.max_height_var.set(settings.get('max_height', 1080))
+                self.resample_var.set(settings.get('resample_method', 'LANCZOS'))
+                self.optimize_var.set(settings.get('optimize', True))
+                self.progressive_var.set(settings.get('progressive', False))
+                self.keep_exif_var.set(settings.get('keep_exif', True))
+                self.compression_settings['jpeg_lossless'] = settings.get('jpeg_lossless', False)
+                self.compression_settings['png_optimize'] = settings.get('png_optimize', True)
+                self.compression_settings['png_quantize'] = settings.get('png_quantize', 0)
+                self.compression_settings['variant_widths'] = settings.get('variant_widths', [])
+                self.compression_settings['variant_formats'] = settings.get('variant_formats', [])
+                self.compression_settings['strip_exif_extras'] = settings.get('strip_exif_extras', True)
+                self.compression_settings['keep_icc'] = settings.get('keep_icc', True)
+                self.compression_settings['auto_orient'] = settings.get('auto_orient', True)
+                self.format_var.set(settings.get('format', 'auto'))
+                self.workers_var.set(settings.get('workers', DEFAULT_SETTINGS['workers']))
+                self.fast_decode_var.set(settings.get('fast_decode', True))
+                self.incremental_var.set(settings.get('incremental', False))
+                self.target_size_var.set(settings.get('target_size_kb', 0))
+                self.compression_settings['content_hash'] = settings.get('content_hash', False)
+                self.compression_settings['resume'] = settings.get('resume', True)
+                self.compression_settings['profile'] = settings.get('profile', False)
+                self.memory_budget_var.set(settings.get('memory_budget_mb', 0))
+                self.min_ssim_var.set(settings.get('min_ssim', 0))
+                self.dedupe_var.set(settings.get('dedupe', 'off'))
+                self.compression_settings['near_distance'] = settings.get('near_distance', 4)
+                self.layout_var.set(settings.get('output_layout', 'flat'))
+                self.name_template_var.set(settings.get('name_template', DEFAULT_SETTINGS['name_template']))
+                self.collision_var.set(settings.get('collision', 'suffix'))
+                self.compression_settings['min_psnr'] = settings.get('min_psnr', 0)
+                self.compression_settings['max_image_pixels'] = settings.get(
+                    'max_image_pixels', DEFAULT_SETTINGS['max_image_pixels'])
+                self.compression_settings['thumbnail_cache'] = settings.get('thumbnail_cache', False)
+                if self.compression_settings['thumbnail_cache']:
+                    self.previews.use_disk(default_disk_cache_dir())
+                
+                self.log_message("Settings loaded successfully!")
+        except Exception as e:
+            self.log_message(f"Error loading settings: {str(e)}")
+            
+    def reset_settings(self):
+        # Reset to default values
+        self.quality_var.set(85)
+        self.max_width_var.set(1920)
+        self.max_height_var.set(1080)
+        self.resample_var.set('LANCZOS')
+        self.optimize_var.set(True)
+        self.progressive_var.set(False)
+        self.keep_exif_var.set(True)
+        self.compression_settings['jpeg_lossless'] = False
+        self.compression_settings['png_optimize'] = True
+        self.compression_settings['png_quantize'] = 0
+        self.compression_settings['variant_widths'] = []
+        self.compression_settings['variant_formats'] = []
+        self.compression_settings['strip_exif_extras'] = True
+        self.compression_settings['keep_icc'] = True
+        self.compression_settings['auto_orient'] = True
+        self.format_var.set('auto')
+        self.workers_var.set(DEFAULT_SETTINGS['workers'])
+        self.fast_decode_var.set(True)
+        self.incremental_var.set(False)
+        self.target_size_var.set(0)
+        self.compression_settings['content_hash'] = False
+        self.compression_settings['resume'] = True
+        self.compression_settings['profile'] = False
+        self.memory_budget_var.set(0)
+        self.min_ssim_var.set(0)
+        self.dedupe_var.set('off')
+        self.compression_settings['near_distance'] = 4
+        self.layout_var.set('flat')
+        self.name_template_var.set(DEFAULT_SETTINGS['name_template'])
+        self.collision_var.set('suffix')
+        self.compression_settings['min_psnr'] = 0
+        self.compression_settings['max_image_pixels'] = DEFAULT_SETTINGS['max_image_pixels']
+        self.compression_settings['thumbnail_cache'] = False
+        self.previews.use_disk(None)
+        
+        self.log_message("Settings reset to defaults!")
+        
+    def apply_styling(self):
+        """Apply modern styling to the UI"""
+        try:
+            # Configure ttk styles for a more modern look
+            style = ttk.Style()
+            
+            # Configure frame styles
+            style.configure('TLabelframe', borderwidth=1, relief='solid')
+            style.configure('TLabelframe.Label', font=self.bold_font)
+            
+            # Configure button styles
+            style.configure('TButton', padding=6, font=self.bold_font)
+            
+            # Configure entry styles
+            style.configure('TEntry', padding=4, font=self.regular_font)
+            
+            # Configure combobox styles
+            style.configure('TCombobox', padding=4, font=self.regular_font)
+            
+            # Configure scale styles
+            style.configure('Horizontal.TScale', sliderlength=20)
+            
+            # Configure label styles
+            style.configure('TLabel', font=self.regular_font)
+            
+        except Exception as e:
+            # If styling fails, continue without it
+            pass
+
+def run():
+    root = tk.Tk()
+    app = ImageCompressor(root)
+    root.mainloop()
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+
+from .core import settings_fingerprint
+
+JOURNAL_NAME = ".imagecompressor-journal.jsonl"
+
+# fsync the journal after this many records; lines in between are flushed
+# to the OS, so only a power loss (not a crash) can drop them
+SYNC_INTERVAL = 50
+
+
+class JobControl:
+    """Pause / resume / cancel switches shared between the UI and a running batch"""
+
+    def __init__(self):
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Wake up a paused batch so it can notice the cancel
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def wait_while_paused(self, timeout=None):
+        """Block until resumed or cancelled (or timeout); True if no longer paused"""
+        return self._running.wait(timeout)
+
+
+class Journal:
+    """Append-only record of finished files, used to resume interrupted batches.
+
+    The first line identifies the settings fingerprint; every later line is
+    a successful result. A journal left behind by a cancelled or crashed run
+    with the same fingerprint is resumed: its files are reported as
+    'resumed' instead of being compressed again. finish() deletes the
+    journal once a batch has run to completion.
+    """
+
+    def __init__(self, output_dir, settings):
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, JOURNAL_NAME)
+        self.fingerprint = settings_fingerprint(settings)
+        self.completed = {}
+        self.file = None
+        self.unsynced = 0
+
+    def open(self, resume=True):
+        """Load a matching previous journal (if resume) and start appending; returns files already done"""
+        previous = self._load() if resume else None
+        if previous is not None:
+            self.completed = previous
+            self.file = open(self.path, 'a', encoding='utf-8')
+            if not self._ends_with_newline():
+                # Terminate a torn last line so the next record stays parseable
+                self.file.write("\n")
+        else:
+            self.completed = {}
+            self.file = open(self.path, 'w', encoding='utf-8')
+            self._write({'fingerprint': self.fingerprint, 'started': time.time()})
+        return len(self.completed)
+
+    def _load(self):
+        """Completed results from an earlier run with the same settings, or None"""
+        completed = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                if header.get('fingerprint') != self.fingerprint:
+                    return None
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash
+                        continue
+                    completed[os.path.abspath(result['input_path'])] = result
+        except (OSError, ValueError):
+            return None
+        return completed
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def lookup(self, input_path):
+        """Result recorded by the interrupted run, if its output is still there"""
+        result = self.completed.get(os.path.abspath(input_path))
+        if result is None or not os.path.exists(result['output_path']):
+            return None
+        result = dict(result, input_path=input_path, resumed=True, error=None)
+        return result
+
+    def record(self, result):
+        self._write(result)
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= SYNC_INTERVAL:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    def close(self):
+        """Stop appending but keep the journal so the batch can be resumed"""
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def finish(self):
+        """The batch completed; the journal is no longer needed"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
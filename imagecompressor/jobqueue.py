@@ -0,0 +1,557 @@
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .batch import _compress_task
+from .core import atomic_output, resolve_settings, settings_fingerprint
+from .naming import NameCollision, OutputPlanner
+
+# Files handed to a worker per lease
+BATCH_SIZE = 16
+
+# A lease not renewed for this many seconds is given to another worker;
+# workers renew theirs every LEASE_TTL / 3 while compressing
+LEASE_TTL = 120.0
+
+# Leases of a file may expire this often (its worker was killed or hung,
+# e.g. by the OOM killer) before the file is reported as failed
+MAX_ATTEMPTS = 3
+
+# Seconds a worker waits before asking again when nothing is queued
+POLL_INTERVAL = 2.0
+
+# Queue paths with these suffixes use SQLite, anything else a directory
+SQLITE_SUFFIXES = ('.sqlite', '.sqlite3', '.db')
+
+
+def expired_error(attempts):
+    return f"Lease expired {attempts} times (the worker was killed or stalled)"
+
+
+def worker_identity():
+    """(worker id, node) of this process: 'host:pid' and the host name"""
+    node = socket.gethostname()
+    return f"{node}:{os.getpid()}", node
+
+
+def check_meta(meta, settings=None):
+    """Raise ValueError unless the queue's settings still hash to its fingerprint.
+
+    Workers run the settings stored in the queue; a worker whose version
+    computes a different fingerprint for them (new settings, changed
+    defaults) would write different outputs than the others. With settings,
+    also check that they are the ones the queue was created with.
+    """
+    if settings_fingerprint(meta['settings']) != meta['fingerprint']:
+        raise ValueError("The queue's settings fingerprint does not match this version of imagecompressor")
+    if settings is not None and settings_fingerprint(settings) != meta['fingerprint']:
+        raise ValueError("The queue was created with different settings; use a new queue for these")
+
+
+class SQLiteQueue:
+    """Job queue in one SQLite database, shared by workers on this machine.
+
+    Every operation is its own transaction, and leases take the write lock
+    (BEGIN IMMEDIATE), so any number of worker processes can use the file.
+    SQLite's locking is not reliable on network filesystems such as NFS:
+    for workers on several machines use a DirectoryQueue.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def _connect(self, write=False):
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if write:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            if write:
+                conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def create(self, meta):
+        """Initialize the queue with meta, or return the meta it already has"""
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        with self._connect(write=True) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY,
+                    input_path TEXT NOT NULL UNIQUE,
+                    output_path TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease TEXT,
+                    lease_until REAL,
+                    worker TEXT,
+                    node TEXT,
+                    started_at REAL,
+                    finished_at REAL,
+                    seconds REAL,
+                    original_size INTEGER,
+                    compressed_size INTEGER,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('meta', ?)", (json.dumps(meta),))
+            row = conn.execute("SELECT value FROM meta WHERE key = 'meta'").fetchone()
+        return json.loads(row[0])
+
+    def meta(self):
+        if not os.path.exists(self.path):
+            raise ValueError(f"No queue at {self.path}")
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'meta'").fetchone()
+        return json.loads(row[0])
+
+    def planned(self):
+        """(input_path, output_path) of every file submitted so far"""
+        with self._connect() as conn:
+            return conn.execute("SELECT input_path, output_path FROM tasks ORDER BY id").fetchall()
+
+    def submit(self, tasks):
+        with self._connect(write=True) as conn:
+            conn.executemany("INSERT OR IGNORE INTO tasks (input_path, output_path, state) VALUES (?, ?, 'queued')",
+                             tasks)
+
+    def lease(self, worker, node, limit, ttl):
+        """(lease, [task, ...]) for up to limit queued files, or None if nothing is queued.
+
+        Leases that expired are returned to the queue first (or failed after
+        MAX_ATTEMPTS). Tasks are dicts with 'input_path' and 'output_path'.
+        """
+        now = time.time()
+        with self._connect(write=True) as conn:
+            conn.execute("UPDATE tasks SET state = 'failed', lease = NULL, finished_at = ?, error = ? "
+                         "WHERE state = 'leased' AND lease_until < ? AND attempts + 1 >= ?",
+                         (now, expired_error(MAX_ATTEMPTS), now, MAX_ATTEMPTS))
+            conn.execute("UPDATE tasks SET state = 'queued', lease = NULL, attempts = attempts + 1 "
+                         "WHERE state = 'leased' AND lease_until < ?", (now,))
+            rows = conn.execute("SELECT id, input_path, output_path FROM tasks WHERE state = 'queued' "
+                                "ORDER BY id LIMIT ?", (limit,)).fetchall()
+            if not rows:
+                return None
+            lease = uuid.uuid4().hex
+            conn.executemany("UPDATE tasks SET state = 'leased', lease = ?, lease_until = ?, worker = ?, node = ? "
+                             "WHERE id = ?", [(lease, now + ttl, worker, node, row[0]) for row in rows])
+        return lease, [{'id': row[0], 'input_path': row[1], 'output_path': row[2]} for row in rows]
+
+    def heartbeat(self, lease, ttl):
+        """Extend a lease; False if it expired and was given away"""
+        with self._connect(write=True) as conn:
+            cursor = conn.execute("UPDATE tasks SET lease_until = ? WHERE lease = ? AND state = 'leased'",
+                                  (time.time() + ttl, lease))
+            return cursor.rowcount > 0
+
+    def complete(self, lease, records):
+        """Store the records of a lease's files; False (and nothing stored) if the lease was lost"""
+        with self._connect(write=True) as conn:
+            held = conn.execute("SELECT COUNT(*) FROM tasks WHERE lease = ? AND state = 'leased'",
+                                (lease,)).fetchone()[0]
+            if not held:
+                return False
+            conn.executemany(
+                "UPDATE tasks SET state = ?, lease = NULL, worker = ?, node = ?, started_at = ?, finished_at = ?, "
+                "seconds = ?, original_size = ?, compressed_size = ?, error = ? WHERE id = ? AND lease = ?",
+                [('failed' if record['error'] else 'done', record['worker'], record['node'], record['started_at'],
+                  record['finished_at'], record['seconds'], record.get('original_size'),
+                  record.get('compressed_size'), record['error'], record['id'], lease) for record in records]
+            )
+        return True
+
+    def counts(self):
+        """Files per state: 'queued', 'leased', 'done' and 'failed'"""
+        counts = dict.fromkeys(('queued', 'leased', 'done', 'failed'), 0)
+        with self._connect() as conn:
+            counts.update(conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+        return counts
+
+    def records(self):
+        """Yield the record of every finished file (see QueueWorker)"""
+        with self._connect() as conn:
+            cursor = conn.execute("SELECT input_path, output_path, worker, node, started_at, finished_at, seconds, "
+                                  "original_size, compressed_size, error FROM tasks "
+                                  "WHERE state IN ('done', 'failed')")
+            columns = [column[0] for column in cursor.description]
+            for row in cursor:
+                yield dict(zip(columns, row))
+
+
+class DirectoryQueue:
+    """Job queue as files in a directory, for workers on several machines sharing it (e.g. over NFS).
+
+    Files are submitted in chunks of meta['batch_size']; a chunk is the
+    unit of leasing. Every state change is a rename, which is atomic on
+    POSIX and NFS filesystems, so exactly one worker wins each chunk:
+
+        queued/<chunk>.<attempt>.json          waiting
+        leased/<chunk>.<attempt>.<lease>.json  taken; the mtime is the lease deadline
+        done/<chunk>.json                      the records of its files
+
+    Leasing and heartbeats set the mtime to now plus the holder's TTL; a
+    leased chunk whose mtime has passed goes back to queued/ with the next
+    attempt number (or to done/ as failed after MAX_ATTEMPTS). Expiry
+    compares file mtimes with the local clock, so
+    the machines' clocks must be kept in sync (e.g. NTP).
+    """
+
+    STATES = ('queued', 'leased', 'done')
+
+    def __init__(self, path):
+        self.path = path
+
+    def _folder(self, state):
+        return os.path.join(self.path, state)
+
+    def _write_json(self, path, data):
+        with atomic_output(path) as temp_path:
+            with open(temp_path, 'w') as f:
+                json.dump(data, f)
+
+    def _read_json(self, path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _list(self, state):
+        try:
+            return [name for name in os.listdir(self._folder(state)) if name.endswith('.json')]
+        except FileNotFoundError:
+            return []
+
+    def create(self, meta):
+        for state in self.STATES:
+            os.makedirs(self._folder(state), exist_ok=True)
+        path = os.path.join(self.path, 'meta.json')
+        if not os.path.exists(path):
+            self._write_json(path, meta)
+        return self._read_json(path)
+
+    def meta(self):
+        try:
+            return self._read_json(os.path.join(self.path, 'meta.json'))
+        except FileNotFoundError:
+            raise ValueError(f"No queue at {self.path}")
+
+    def _chunks(self, state):
+        """Yield the task lists of a state's chunks, skipping any that move away while reading"""
+        for name in self._list(state):
+            try:
+                yield self._read_json(os.path.join(self._folder(state), name))
+            except FileNotFoundError:
+                continue
+
+    def planned(self):
+        planned = []
+        for state in ('queued', 'leased'):
+            for chunk in self._chunks(state):
+                planned.extend((task['input_path'], task['output_path']) for task in chunk)
+        planned.extend((record['input_path'], record['output_path']) for record in self.records())
+        return planned
+
+    def submit(self, tasks):
+        batch_size = self.meta()['batch_size']
+        prefix = f"{time.time_ns():x}"
+        for start in range(0, len(tasks), batch_size):
+            chunk = [{'input_path': input_path, 'output_path': output_path}
+                     for input_path, output_path in tasks[start:start + batch_size]]
+            name = f"{prefix}-{start // batch_size:06d}.0.json"
+            self._write_json(os.path.join(self._folder('queued'), name), chunk)
+
+    def _expire(self):
+        now = time.time()
+        for name in self._list('leased'):
+            path = os.path.join(self._folder('leased'), name)
+            try:
+                if os.stat(path).st_mtime >= now:
+                    continue
+                chunk, attempt, _, _ = name.split('.')
+                attempt = int(attempt) + 1
+                if attempt < MAX_ATTEMPTS:
+                    os.rename(path, os.path.join(self._folder('queued'), f"{chunk}.{attempt}.json"))
+                    continue
+                target = os.path.join(self._folder('done'), f"{chunk}.json")
+                os.rename(path, target)
+                records = [dict(task, error=expired_error(attempt), worker=None, node=None, started_at=None,
+                                finished_at=now, seconds=None) for task in self._read_json(target)]
+                self._write_json(target, {'records': records})
+            except (FileNotFoundError, ValueError):
+                # Renewed, completed or expired by another worker meanwhile
+                continue
+
+    def lease(self, worker, node, limit, ttl):
+        """(lease, tasks) for one queued chunk, or None; limit is fixed by the chunk size"""
+        self._expire()
+        names = self._list('queued')
+        # Workers that list at the same time mostly try different chunks
+        random.shuffle(names)
+        for name in names:
+            chunk, attempt, _ = name.split('.')
+            lease = f"{chunk}.{attempt}.{uuid.uuid4().hex}"
+            path = os.path.join(self._folder('leased'), f"{lease}.json")
+            try:
+                os.rename(os.path.join(self._folder('queued'), name), path)
+            except FileNotFoundError:
+                continue
+            # The lease runs from now, not from the submit time
+            deadline = time.time() + ttl
+            os.utime(path, (deadline, deadline))
+            return lease, self._read_json(path)
+        return None
+
+    def heartbeat(self, lease, ttl):
+        try:
+            deadline = time.time() + ttl
+            os.utime(os.path.join(self._folder('leased'), f"{lease}.json"), (deadline, deadline))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, lease, records):
+        # The rename claims the chunk; it fails if the lease expired meanwhile
+        target = os.path.join(self._folder('done'), f"{lease.split('.')[0]}.json")
+        try:
+            os.rename(os.path.join(self._folder('leased'), f"{lease}.json"), target)
+        except FileNotFoundError:
+            return False
+        self._write_json(target, {'records': records})
+        return True
+
+    def counts(self):
+        counts = {'queued': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        for state in ('queued', 'leased'):
+            counts[state] = sum(len(chunk) for chunk in self._chunks(state))
+        for record in self.records():
+            counts['failed' if record['error'] else 'done'] += 1
+        return counts
+
+    def records(self):
+        for chunk in self._chunks('done'):
+            if isinstance(chunk, list):
+                # Claimed by a worker that has not written (or died before writing) its records
+                for task in chunk:
+                    yield dict(task, error="The worker stopped before recording the result", worker=None,
+                               node=None, started_at=None, finished_at=None, seconds=None)
+                continue
+            yield from chunk['records']
+
+
+def open_queue(path):
+    """The queue backend for path: SQLiteQueue for SQLITE_SUFFIXES, otherwise DirectoryQueue"""
+    if path.lower().endswith(SQLITE_SUFFIXES):
+        return SQLiteQueue(path)
+    return DirectoryQueue(path)
+
+
+def submit(queue, input_files, output_dir, settings, roots=None, batch_size=BATCH_SIZE, lease_ttl=LEASE_TTL):
+    """Plan output paths for input_files and add them to queue; returns (added, settled).
+
+    Creates the queue with settings on the first submit; later submits must
+    use the same settings and add only inputs it doesn't have yet. Output
+    paths are planned here, in input order, like a batch (naming settings,
+    collision policy, 'mirror' roots), so workers never race for a name.
+    output_dir must be the same path on every worker machine. settled holds
+    the results of inputs left out because of a name collision.
+    """
+    settings = resolve_settings(settings)
+    meta = queue.create({
+        'settings': settings,
+        'fingerprint': settings_fingerprint(settings),
+        'output_dir': os.path.abspath(output_dir),
+        'batch_size': max(1, int(batch_size)),
+        'lease_ttl': float(lease_ttl),
+        'created': time.time()
+    })
+    check_meta(meta, settings)
+    planner = OutputPlanner(meta['output_dir'], settings, roots)
+    known = set()
+    for input_path, output_path in queue.planned():
+        planner.hold(input_path, output_path)
+        known.add(input_path)
+
+    tasks = []
+    settled = []
+    for index, input_path in enumerate(input_files):
+        input_path = os.path.abspath(input_path)
+        if input_path in known:
+            continue
+        known.add(input_path)
+        try:
+            output_path = planner.reserve(input_path)
+            planner.check_existing(output_path)
+        except NameCollision as e:
+            if planner.policy == 'skip':
+                settled.append({'index': index, 'input_path': input_path, 'output_path': e.output_path,
+                                'error': None, 'skipped': str(e)})
+            else:
+                settled.append({'index': index, 'input_path': input_path, 'error': str(e)})
+            continue
+        tasks.append((input_path, output_path))
+    queue.submit(tasks)
+    return len(tasks), settled
+
+
+class QueueWorker:
+    """Compresses files leased from a queue until it is empty (or, with follow, until stop()).
+
+    Each lease is a batch of files; a heartbeat thread renews it every
+    third of the lease TTL while they are compressed one by one in this
+    process. Run one QueueWorker per core and per machine. stop() lets the
+    current batch finish. If a lease is lost anyway (e.g. the process was
+    suspended) its remaining files are left to the worker that got them.
+
+    progress_callback(record) is called for every file. A record has the
+    result's 'input_path', 'output_path', 'error', 'original_size' and
+    'compressed_size', plus 'worker', 'node', 'started_at', 'finished_at'
+    and 'seconds'.
+    """
+
+    def __init__(self, queue, worker_id=None, follow=False, poll_interval=POLL_INTERVAL, progress_callback=None):
+        self.queue = queue
+        self.meta = queue.meta()
+        check_meta(self.meta)
+        self.worker_id, self.node = worker_identity()
+        if worker_id:
+            self.worker_id = worker_id
+        self.follow = follow
+        self.poll_interval = poll_interval
+        self.progress_callback = progress_callback
+        self.stop_event = threading.Event()
+        self.stats = {'leases': 0, 'lost': 0, 'processed': 0, 'failed': 0}
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        """Work until there is nothing left (or stop()); returns this worker's stats"""
+        ttl = self.meta['lease_ttl']
+        while not self.stop_event.is_set():
+            leased = self.queue.lease(self.worker_id, self.node, self.meta['batch_size'], ttl)
+            if leased is None:
+                counts = self.queue.counts()
+                if not self.follow and not counts['queued'] and not counts['leased']:
+                    break
+                # Leases held by others may still expire and come back
+                self.stop_event.wait(self.poll_interval)
+                continue
+            self.stats['leases'] += 1
+            self._work(*leased, ttl)
+        return self.stats
+
+    def _work(self, lease, tasks, ttl):
+        lost = threading.Event()
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(ttl / 3):
+                if not self.queue.heartbeat(lease, ttl):
+                    lost.set()
+                    return
+
+        thread = threading.Thread(target=heartbeat, name='queue-heartbeat', daemon=True)
+        thread.start()
+        records = []
+        try:
+            for index, task in enumerate(tasks):
+                if lost.is_set():
+                    break
+                records.append(self._compress(index, task))
+        finally:
+            done.set()
+            thread.join()
+        if lost.is_set() or not self.queue.complete(lease, records):
+            self.stats['lost'] += 1
+            return
+        for record in records:
+            self.stats['processed'] += 1
+            self.stats['failed'] += 1 if record['error'] else 0
+            if self.progress_callback:
+                self.progress_callback(record)
+
+    def _compress(self, index, task):
+        started = time.time()
+        begin = time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(task['output_path']), exist_ok=True)
+        except OSError:
+            # Reported by compress() when it writes
+            pass
+        result = _compress_task(index, task['input_path'], task['output_path'], self.meta['settings'])
+        return dict(task, **{
+            'output_path': result.get('output_path', task['output_path']),
+            'error': result['error'],
+            'original_size': result.get('original_size'),
+            'compressed_size': result.get('compressed_size'),
+            'worker': self.worker_id,
+            'node': self.node,
+            'started_at': started,
+            'finished_at': time.time(),
+            'seconds': time.perf_counter() - begin
+        })
+
+
+def _rate(files, first, last):
+    return files * 60.0 / (last - first) if last and first is not None and last > first else 0.0
+
+
+def queue_status(queue):
+    """Progress of a queue: file counts per state, totals, throughput and per-node stats.
+
+    Throughput is files per minute between the first start and the last
+    finish, overall and per node; 'eta_seconds' extrapolates the overall
+    rate to the files still queued or leased.
+    """
+    counts = queue.counts()
+    nodes = {}
+    first = last = None
+    totals = {'original_bytes': 0, 'compressed_bytes': 0}
+    for record in queue.records():
+        node = nodes.setdefault(record['node'] or '(expired)', {
+            'files': 0, 'failed': 0, 'original_bytes': 0, 'compressed_bytes': 0, 'busy_seconds': 0.0,
+            'workers': set(), 'first': None, 'last': None
+        })
+        node['files'] += 1
+        if record['worker']:
+            node['workers'].add(record['worker'])
+        if record['error']:
+            node['failed'] += 1
+        else:
+            for stats in (node, totals):
+                stats['original_bytes'] += record['original_size']
+                stats['compressed_bytes'] += record['compressed_size']
+        node['busy_seconds'] += record['seconds'] or 0.0
+        if record['started_at'] is not None:
+            node['first'] = min(node['first'] or record['started_at'], record['started_at'])
+            first = min(first or record['started_at'], record['started_at'])
+        if record['finished_at'] is not None:
+            node['last'] = max(node['last'] or 0, record['finished_at'])
+            last = max(last or 0, record['finished_at'])
+
+    for node in nodes.values():
+        node['files_per_minute'] = _rate(node['files'], node.pop('first'), node.pop('last'))
+        node['workers'] = len(node['workers'])
+    finished = counts['done'] + counts['failed']
+    rate = _rate(finished, first, last)
+    remaining = counts['queued'] + counts['leased']
+    return dict(counts, **totals, **{
+        'total': finished + remaining,
+        'files_per_minute': rate,
+        'eta_seconds': remaining * 60.0 / rate if rate else None,
+        'nodes': nodes
+    })
@@ -0,0 +1,198 @@
+import shutil
+import struct
+import subprocess
+
+from .metadata import JPEG_MAX_EXIF, JPEG_MAX_XMP
+
+SOI = b'\xff\xd8'
+SOS = 0xDA
+DHT = 0xC4
+APP1 = 0xE1
+APP2 = 0xE2
+COM = 0xFE
+
+# Markers that have no length field
+STANDALONE_MARKERS = {0x01, 0xD8, 0xD9} | set(range(0xD0, 0xD8))
+
+# Start-of-frame markers (everything from C0 to CF except DHT, JPG and DAC)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+PROGRESSIVE_SOF = {0xC2, 0xC6, 0xCA, 0xCE}
+
+EXIF_PREFIX = b'Exif\x00\x00'
+XMP_PREFIX = b'http://ns.adobe.com/xap/1.0/\x00'
+XMP_EXTENSION_PREFIX = b'http://ns.adobe.com/xmp/extension/\x00'
+ICC_PREFIX = b'ICC_PROFILE\x00'
+ICC_CHUNK = 65519
+
+# Code length counts of the example Huffman tables in ITU T.81 Annex K,
+# which encoders use unless asked to optimize. A file that only has these
+# can usually be shrunk by a few percent without touching the pixels.
+STANDARD_TABLE_COUNTS = {
+    bytes([0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]),
+    bytes([0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0]),
+    bytes([0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7D]),
+    bytes([0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77]),
+}
+
+
+def jpegtran_path():
+    """Path of the jpegtran tool (libjpeg / libjpeg-turbo / mozjpeg), or None"""
+    return shutil.which('jpegtran')
+
+
+def split_segments(data):
+    """Split JPEG bytes into the header segments and the scan data.
+
+    Returns ([(marker, payload), ...], scan) where scan starts at the first
+    SOS marker and runs to the end of the file. Raises ValueError if data
+    isn't a JPEG.
+    """
+    if not data.startswith(SOI):
+        raise ValueError("Not a JPEG file")
+    segments = []
+    position = 2
+    while True:
+        if position >= len(data) or data[position] != 0xFF:
+            raise ValueError("Corrupt JPEG marker structure")
+        while position < len(data) and data[position] == 0xFF:
+            position += 1  # fill bytes
+        if position >= len(data):
+            raise ValueError("Corrupt JPEG marker structure")
+        marker = data[position]
+        if marker == SOS:
+            return segments, data[position - 1:]
+        if marker in STANDALONE_MARKERS:
+            segments.append((marker, b''))
+            position += 1
+            continue
+        if position + 3 > len(data):
+            raise ValueError("Truncated JPEG header")
+        length = struct.unpack_from('>H', data, position + 1)[0]
+        segments.append((marker, data[position + 3:position + 1 + length]))
+        position += 1 + length
+
+
+def _segment(marker, payload):
+    return bytes([0xFF, marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def _is_replaced(marker, payload, keep_other):
+    """True for segments that are rewritten from the metadata (or dropped)"""
+    if marker == APP1 and payload.startswith((EXIF_PREFIX, XMP_PREFIX, XMP_EXTENSION_PREFIX)):
+        return True
+    if marker == APP2 and payload.startswith(ICC_PREFIX):
+        return True
+    # JFIF (APP0) and Adobe (APP14) describe the pixel data and always stay
+    if not keep_other and (marker == COM or (0xE1 <= marker <= 0xEF and marker != 0xEE)):
+        return True
+    return False
+
+
+def metadata_segments(metadata):
+    """APP1 / APP2 segments writing the EXIF, XMP and ICC blocks of metadata"""
+    segments = []
+    exif = metadata.get('exif')
+    if exif and len(exif) <= JPEG_MAX_EXIF:
+        segments.append(_segment(APP1, exif))
+    xmp = metadata.get('xmp')
+    if xmp and len(xmp) <= JPEG_MAX_XMP:
+        segments.append(_segment(APP1, XMP_PREFIX + xmp))
+    icc_profile = metadata.get('icc_profile')
+    if icc_profile:
+        chunks = [icc_profile[i:i + ICC_CHUNK] for i in range(0, len(icc_profile), ICC_CHUNK)]
+        for number, chunk in enumerate(chunks, 1):
+            segments.append(_segment(APP2, ICC_PREFIX + bytes([number, len(chunks)]) + chunk))
+    return segments
+
+
+def rewrite_metadata(data, metadata, keep_other=True):
+    """JPEG bytes with their metadata segments replaced, entropy-coded data untouched"""
+    segments, scan = split_segments(data)
+    output = [SOI]
+    inserted = False
+    for marker, payload in segments:
+        if _is_replaced(marker, payload, keep_other):
+            continue
+        if not inserted and marker != 0xE0:
+            # New blocks go right after JFIF, before the tables
+            output.extend(metadata_segments(metadata))
+            inserted = True
+        output.append(_segment(marker, payload) if marker not in STANDALONE_MARKERS else bytes([0xFF, marker]))
+    if not inserted:
+        output.extend(metadata_segments(metadata))
+    output.append(scan)
+    return b''.join(output)
+
+
+def can_improve_entropy(data, progressive):
+    """Whether Huffman optimization / a progressive re-scan is likely to shrink data.
+
+    Files that already use optimized tables (and the requested scan mode)
+    are skipped without running jpegtran.
+    """
+    segments, _ = split_segments(data)
+    is_progressive = any(marker in PROGRESSIVE_SOF for marker, _ in segments)
+    if progressive and not is_progressive:
+        return True
+    if is_progressive:
+        # libjpeg always optimizes progressive scans
+        return False
+    for marker, payload in segments:
+        if marker != DHT:
+            continue
+        position = 0
+        while position + 17 <= len(payload):
+            counts = payload[position + 1:position + 17]
+            if counts in STANDARD_TABLE_COUNTS:
+                return True
+            position += 17 + sum(counts)
+    return False
+
+
+def run_jpegtran(data, progressive, tool=None):
+    """Huffman-optimized (and optionally progressive) copy of data, or None if jpegtran failed"""
+    tool = tool or jpegtran_path()
+    if not tool:
+        return None
+    command = [tool, '-copy', 'all', '-optimize']
+    if progressive:
+        command.append('-progressive')
+    try:
+        completed = subprocess.run(command, input=data, capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout if completed.stdout.startswith(SOI) else None
+
+
+def jpegtran_missing(data, settings):
+    """True if jpegtran would likely shrink data (see can_improve_entropy) but is not installed"""
+    return jpegtran_path() is None and can_improve_entropy(data, settings['progressive'])
+
+
+def optimize_losslessly(data, metadata, settings):
+    """Shrink JPEG bytes without decoding the pixels.
+
+    The metadata segments are rewritten from metadata (see read_metadata;
+    other APPn and COM segments are dropped when keep_exif is off), and if
+    jpegtran is installed and the entropy coding can improve, the DCT data
+    is re-coded with optimized Huffman tables (progressive if requested).
+    Returns (data, method) where method is 'jpegtran', 'markers' or
+    'copied' (nothing got smaller, so the original bytes are returned).
+    The original is only returned when no metadata had to be removed;
+    otherwise the rewrite is kept even if it is no smaller.
+    """
+    keep_other = settings['keep_exif']
+    best, method = rewrite_metadata(data, metadata, keep_other), 'markers'
+    if can_improve_entropy(data, settings['progressive']):
+        optimized = run_jpegtran(data, settings['progressive'])
+        if optimized:
+            try:
+                optimized = rewrite_metadata(optimized, metadata, keep_other)
+            except ValueError:
+                optimized = None
+        if optimized and len(optimized) < len(best):
+            best, method = optimized, 'jpegtran'
+    stripped = not keep_other or metadata.get('removed')
+    if len(best) >= len(data) and not stripped:
+        return data, 'copied'
+    return best, method
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from .core import settings_fingerprint
+
+MANIFEST_NAME = ".imagecompressor-manifest.sqlite"
+
+# Commit after this many records so a crash loses little work without
+# paying for an fsync per file
+COMMIT_INTERVAL = 100
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Streaming BLAKE2b digest of a file's contents"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Persistent record of what has already been compressed into output_dir.
+
+    Each source path maps to its size, mtime, optional content hash and the
+    settings fingerprint it was compressed with, plus the output it produced
+    (every file of it, for variants). A source is only skipped when all of
+    those still match and every output file is still there with the
+    recorded size.
+    """
+
+    def __init__(self, output_dir, settings=None, use_hash=False):
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.fingerprint = settings_fingerprint(settings)
+        self.use_hash = use_hash
+        self.pending = 0
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                source_path TEXT PRIMARY KEY,
+                source_size INTEGER NOT NULL,
+                source_mtime_ns INTEGER NOT NULL,
+                content_hash TEXT,
+                fingerprint TEXT NOT NULL,
+                output_path TEXT NOT NULL,
+                output_size INTEGER NOT NULL,
+                format TEXT,
+                width INTEGER,
+                height INTEGER,
+                updated_at REAL NOT NULL,
+                variants TEXT
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(entries)")]
+        if 'variants' not in columns:
+            # Manifests written before variants were recorded
+            self.conn.execute("ALTER TABLE entries ADD COLUMN variants TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_output ON entries (output_path)")
+        self.conn.commit()
+
+    def lookup(self, source_path):
+        """Return a cached result dict for source_path, or None if it must be recompressed"""
+        input_path = source_path
+        source_path = os.path.abspath(source_path)
+        row = self.conn.execute(
+            "SELECT source_size, source_mtime_ns, content_hash, fingerprint, output_path, "
+            "output_size, format, width, height, variants FROM entries WHERE source_path = ?",
+            (source_path,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        size, mtime_ns, content_hash, fingerprint, output_path, output_size, fmt, width, height, variants = row
+        if fingerprint != self.fingerprint:
+            return None
+        variants = json.loads(variants) if variants else None
+        files = [(variant['output_path'], variant['compressed_size']) for variant in variants or []]
+        try:
+            stat = os.stat(source_path)
+            for path, file_size in files or [(output_path, output_size)]:
+                if os.path.getsize(path) != file_size:
+                    return None
+        except OSError:
+            return None
+
+        if stat.st_size != size:
+            return None
+        if stat.st_mtime_ns != mtime_ns:
+            # Touched but possibly unchanged; only the content hash can tell
+            if not (self.use_hash and content_hash and file_digest(source_path) == content_hash):
+                return None
+            self.conn.execute("UPDATE entries SET source_mtime_ns = ? WHERE source_path = ?",
+                              (stat.st_mtime_ns, source_path))
+            self._maybe_commit()
+        elif self.use_hash and not content_hash:
+            # Recorded without hashing; backfill so later touches can be detected
+            self.conn.execute("UPDATE entries SET content_hash = ? WHERE source_path = ?",
+                              (file_digest(source_path), source_path))
+            self._maybe_commit()
+
+        result = {
+            'input_path': input_path,
+            'output_path': output_path,
+            'format': fmt,
+            'width': width,
+            'height': height,
+            'original_size': size,
+            'compressed_size': output_size,
+            'cached': True,
+            'error': None
+        }
+        if variants:
+            result['variants'] = variants
+        return result
+
+    def record(self, result):
+        """Remember a successful compress_single_image result.
+
+        For variants the recorded size is the total of all files, as in
+        result['compressed_size'], so a cached result reports what the fresh
+        one did.
+        """
+        source_path = os.path.abspath(result['input_path'])
+        stat = os.stat(source_path)
+        content_hash = file_digest(source_path) if self.use_hash else None
+
+        # An output written under a different name (e.g. after a format
+        # change) is superseded by this one
+        variants = result.get('variants')
+        kept = {variant['output_path'] for variant in variants or []} | {result['output_path']}
+        row = self.conn.execute("SELECT output_path, variants FROM entries WHERE source_path = ?",
+                                (source_path,)).fetchone()
+        if row and not self._is_shared(row[0], source_path):
+            for path in self._files(*row):
+                if path not in kept:
+                    self._remove_output(path)
+
+        if variants:
+            output_size = sum(variant['compressed_size'] for variant in variants)
+        else:
+            output_size = os.path.getsize(result['output_path'])
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (source_path, stat.st_size, stat.st_mtime_ns, content_hash, self.fingerprint,
+             result['output_path'], output_size, result.get('format'),
+             result.get('width'), result.get('height'), time.time(),
+             json.dumps(variants) if variants else None)
+        )
+        self._maybe_commit()
+
+    def outputs(self):
+        """(source_path, output_path) of every recorded source"""
+        return self.conn.execute("SELECT source_path, output_path FROM entries").fetchall()
+
+    def prune(self, dry_run=False):
+        """Delete outputs whose source file no longer exists; returns the removed output paths"""
+        removed = []
+        rows = self.conn.execute("SELECT source_path, output_path, variants FROM entries").fetchall()
+        for source_path, output_path, variants in rows:
+            if os.path.exists(source_path):
+                continue
+            if not self._is_shared(output_path, source_path):
+                for path in self._files(output_path, variants):
+                    removed.append(path)
+                    if not dry_run:
+                        self._remove_output(path)
+            if not dry_run:
+                self.conn.execute("DELETE FROM entries WHERE source_path = ?", (source_path,))
+        self.conn.commit()
+        return removed
+
+    def _is_shared(self, output_path, source_path):
+        """True if another source also maps to output_path"""
+        row = self.conn.execute(
+            "SELECT 1 FROM entries WHERE output_path = ? AND source_path != ? LIMIT 1",
+            (output_path, source_path)
+        ).fetchone()
+        return row is not None
+
+    def _files(self, output_path, variants):
+        """Every file written for an entry"""
+        if variants:
+            return [variant['output_path'] for variant in json.loads(variants)]
+        return [output_path]
+
+    def _remove_output(self, output_path):
+        try:
+            os.remove(output_path)
+        except FileNotFoundError:
+            pass
+
+    def _maybe_commit(self):
+        self.pending += 1
+        if self.pending >= COMMIT_INTERVAL:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
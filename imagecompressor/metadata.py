@@ -0,0 +1,217 @@
+import re
+import struct
+
+from PIL import ExifTags, Image, PngImagePlugin
+
+EXIF_HEADER = b'Exif\x00\x00'
+
+ORIENTATION = ExifTags.Base.Orientation
+
+# EXIF orientation -> transpose that makes the pixels upright (as in ImageOps.exif_transpose)
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# Orientations that swap width and height
+SWAPPED_ORIENTATIONS = {5, 6, 7, 8}
+
+XMP_ORIENTATION = [
+    re.compile(rb'(tiff:Orientation=")([0-9])(")'),
+    re.compile(rb'(<tiff:Orientation>)([0-9])(</tiff:Orientation>)'),
+]
+
+# Largest EXIF / XMP payload that fits in one JPEG APP1 segment
+JPEG_MAX_EXIF = 65533
+JPEG_MAX_XMP = 65504
+
+
+def _orientation_entry(exif):
+    """(byte order, offset) of the Orientation value in IFD0 of raw EXIF, or None.
+
+    Only the IFD0 entry table is read, so this is cheap enough to run on
+    every file and leaves the rest of the block untouched.
+    """
+    base = len(EXIF_HEADER) if exif.startswith(EXIF_HEADER) else 0
+    order = {b'II': '<', b'MM': '>'}.get(exif[base:base + 2])
+    if order is None:
+        return None
+    try:
+        ifd = base + struct.unpack_from(order + 'I', exif, base + 4)[0]
+        count = struct.unpack_from(order + 'H', exif, ifd)[0]
+        for entry in range(ifd + 2, ifd + 2 + 12 * count, 12):
+            tag, value_type = struct.unpack_from(order + 'HH', exif, entry)
+            if tag == ORIENTATION and value_type == 3 and entry + 10 <= len(exif):  # SHORT, stored inline
+                return order, entry + 8
+    except struct.error:
+        pass
+    return None
+
+
+def exif_orientation(exif):
+    """Orientation (1-8) stored in raw EXIF bytes; 1 if missing or invalid"""
+    found = _orientation_entry(exif)
+    if found is None:
+        return 1
+    value = struct.unpack_from(found[0] + 'H', exif, found[1])[0]
+    return value if value in ORIENTATION_TRANSPOSE else 1
+
+
+def reset_orientation(exif):
+    """Raw EXIF bytes with Orientation patched to 1 in place"""
+    found = _orientation_entry(exif)
+    if found is None:
+        return exif
+    data = bytearray(exif)
+    struct.pack_into(found[0] + 'H', data, found[1], 1)
+    return bytes(data)
+
+
+def orientation_exif(orientation):
+    """Minimal raw EXIF block holding only an Orientation tag"""
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    return exif.tobytes()
+
+
+def strip_exif_extras(exif, orientation_applied):
+    """EXIF without the embedded thumbnail (IFD1) and maker notes.
+
+    The block is re-serialized, which only writes IFD0 and its sub-IFDs.
+    If Pillow can't parse it, the original bytes are kept.
+    """
+    parsed = Image.Exif()
+    try:
+        parsed.load(exif)
+        parsed.get_ifd(ExifTags.IFD.Exif).pop(ExifTags.Base.MakerNote, None)
+        if orientation_applied and ORIENTATION in parsed:
+            parsed[ORIENTATION] = 1
+        stripped = parsed.tobytes()
+    except Exception:
+        return reset_orientation(exif) if orientation_applied else exif
+    if len(stripped) >= len(exif):
+        return reset_orientation(exif) if orientation_applied else exif
+    return stripped
+
+
+def reset_xmp_orientation(xmp):
+    for pattern in XMP_ORIENTATION:
+        xmp = pattern.sub(rb'\g<1>1\g<3>', xmp)
+    return xmp
+
+
+def color_space(mode):
+    """ICC color space signature matching an image mode"""
+    if mode == 'CMYK':
+        return b'CMYK'
+    if mode in ('1', 'L', 'LA', 'I', 'I;16', 'F'):
+        return b'GRAY'
+    return b'RGB '
+
+
+def read_metadata(img, settings):
+    """Metadata of an opened image to carry into its output, per the settings.
+
+    EXIF, XMP and ICC blocks are taken from img.info as raw bytes and only
+    touched where needed: the Orientation tag is reset when the rotation is
+    applied to the pixels, and with strip_exif_extras the embedded
+    thumbnail and maker notes are dropped. A JPEG comment goes with EXIF.
+    Returns a dict with 'orientation' (to apply, 1 = none), 'exif', 'xmp',
+    'icc_profile', 'comment' (bytes or None) and 'removed' (metadata bytes
+    of the input not carried over).
+    """
+    exif = img.info.get('exif') or None
+    if exif and not exif.startswith(EXIF_HEADER):
+        exif = EXIF_HEADER + exif
+    xmp = img.info.get('xmp') or img.info.get('XML:com.adobe.xmp') or None
+    if isinstance(xmp, str):
+        xmp = xmp.encode('utf-8')
+    icc_profile = img.info.get('icc_profile') or None
+    comment = img.info.get('comment') or None
+    if isinstance(comment, str):
+        comment = comment.encode('utf-8')
+    original_bytes = sum(len(block) for block in (exif, xmp, icc_profile, comment) if block)
+
+    orientation = 1
+    if settings.get('auto_orient', True):
+        if exif:
+            orientation = exif_orientation(exif)
+        elif img.format == 'TIFF':
+            orientation = img.getexif().get(ORIENTATION, 1)
+            orientation = orientation if orientation in ORIENTATION_TRANSPOSE else 1
+
+    if not settings.get('keep_exif', True):
+        exif = xmp = comment = None
+    elif exif and settings.get('strip_exif_extras', True):
+        exif = strip_exif_extras(exif, orientation != 1)
+    elif exif and orientation != 1:
+        exif = reset_orientation(exif)
+    if xmp and orientation != 1:
+        xmp = reset_xmp_orientation(xmp)
+    if not settings.get('keep_icc', True):
+        icc_profile = None
+
+    kept = sum(len(block) for block in (exif, xmp, icc_profile, comment) if block)
+    return {
+        'orientation': orientation,
+        'exif': exif,
+        'xmp': xmp,
+        'icc_profile': icc_profile,
+        'comment': comment,
+        'removed': max(0, original_bytes - kept)
+    }
+
+
+def oriented_settings(settings, orientation):
+    """settings for sizing the stored (unrotated) raster of an image with this orientation.
+
+    With the size limits swapped for 90 degree orientations, resizing the
+    stored raster and transposing the result gives exactly the output of
+    transposing first, but the transpose only touches output pixels.
+    """
+    if orientation in SWAPPED_ORIENTATIONS:
+        return dict(settings, max_width=settings['max_height'], max_height=settings['max_width'])
+    return settings
+
+
+def apply_orientation(img, orientation):
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    return img.transpose(method) if method is not None else img
+
+
+def metadata_save_kwargs(output_format, metadata, mode):
+    """Encoder keyword arguments that write the metadata into output_format"""
+    kwargs = {}
+    icc_profile = metadata.get('icc_profile')
+    # A profile for another color space (e.g. CMYK converted to RGB) would be wrong
+    if icc_profile and icc_profile[16:20] != color_space(mode):
+        icc_profile = None
+    exif = metadata.get('exif')
+    xmp = metadata.get('xmp')
+    if output_format == 'JPEG':
+        # Blocks too big for one APP1 segment are left out rather than failing the file
+        exif = exif if exif and len(exif) <= JPEG_MAX_EXIF else None
+        xmp = xmp if xmp and len(xmp) <= JPEG_MAX_XMP else None
+
+    if output_format == 'PNG':
+        # PNG picks up img.info['icc_profile'] by itself unless told otherwise
+        kwargs['icc_profile'] = icc_profile
+        if xmp:
+            text = PngImagePlugin.PngInfo()
+            text.add_itxt('XML:com.adobe.xmp', xmp.decode('utf-8', 'replace'))
+            kwargs['pnginfo'] = text
+    elif icc_profile:
+        kwargs['icc_profile'] = icc_profile
+    if exif:
+        kwargs['exif'] = exif
+    if xmp and output_format in ('JPEG', 'WEBP'):
+        kwargs['xmp'] = xmp
+    if output_format == 'JPEG':
+        # Pillow writes img.info['comment'] by itself unless told otherwise
+        kwargs['comment'] = metadata.get('comment') or b''
+    return kwargs
@@ -0,0 +1,162 @@
+import os
+import string
+from pathlib import Path
+
+from .core import (FORMAT_EXTENSIONS, SMALLEST_CANDIDATES, check_variants, determine_output_format, variant_path,
+                   variant_plan, with_format_extension)
+
+# 'flat' writes every output straight into the output directory; 'mirror'
+# recreates each input's folder relative to the folder it was scanned from
+OUTPUT_LAYOUTS = ['flat', 'mirror']
+
+# What happens when an output name is already taken:
+#   suffix    - append _1, _2, ... (decided in input order, so re-runs get the same names)
+#   overwrite - the later input replaces the earlier output (the old behaviour)
+#   skip      - leave the file out; also when the output already exists on disk
+#   fail      - report the file as failed; also when the output already exists on disk
+COLLISION_POLICIES = ['suffix', 'overwrite', 'skip', 'fail']
+
+TEMPLATE_FIELDS = {'stem', 'ext', 'format', 'parent', 'quality'}
+
+
+class NameCollision(Exception):
+    """The output name of a file is taken and the policy does not resolve it"""
+
+    def __init__(self, message, output_path):
+        super().__init__(message)
+        self.output_path = output_path
+
+
+def check_template(template):
+    """Raise ValueError unless template is a usable output file name template"""
+    try:
+        fields = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+    except ValueError as e:
+        raise ValueError(f"Invalid name template {template!r}: {e}")
+    unknown = fields - TEMPLATE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown field(s) in name template: {', '.join(sorted(unknown))} "
+                         f"(available: {', '.join(sorted(TEMPLATE_FIELDS))})")
+    if not template.endswith('{ext}'):
+        # The extension is swapped when the format is only known after encoding
+        raise ValueError("The name template must end with {ext}")
+    if '/' in template or os.sep in template:
+        raise ValueError("The name template names a file, not a path")
+
+
+def render_name(template, input_path, output_format, settings):
+    """Output file name for input_path from the naming template"""
+    path = Path(input_path)
+    return template.format(
+        stem=path.stem,
+        ext=FORMAT_EXTENSIONS.get(output_format, '.jpg'),
+        format=output_format.lower(),
+        parent=path.parent.name,
+        quality=settings['quality']
+    )
+
+
+class OutputPlanner:
+    """Assigns every input of a batch its output path before it is compressed.
+
+    Paths are reserved in the order inputs are planned, so two inputs never
+    get the same output unless the collision policy is 'overwrite' (callers
+    must then not write both at once). With the 'mirror' layout an input
+    below one of roots is written to the same relative folder under
+    output_dir; other inputs go to output_dir itself. With create_folders
+    off the planned paths are only names (e.g. of archive members) and no
+    folders are made for them.
+    """
+
+    def __init__(self, output_dir, settings, roots=None, create_folders=True):
+        check_template(settings['name_template'])
+        check_variants(settings)
+        if settings['output_layout'] not in OUTPUT_LAYOUTS:
+            raise ValueError(f"Unknown output layout {settings['output_layout']!r}")
+        if settings['collision'] not in COLLISION_POLICIES:
+            raise ValueError(f"Unknown collision policy {settings['collision']!r}")
+        self.output_dir = output_dir
+        self.settings = settings
+        self.policy = settings['collision']
+        # Longest first, so nested roots win over their parents
+        self.roots = sorted((os.path.abspath(root) for root in roots or []), key=len, reverse=True)
+        self.reserved = {}
+        self.create_folders = create_folders
+        self.created = set()
+
+    def output_folder(self, input_path):
+        if self.settings['output_layout'] == 'mirror':
+            folder = os.path.dirname(os.path.abspath(input_path))
+            for root in self.roots:
+                if folder == root or folder.startswith(root.rstrip(os.sep) + os.sep):
+                    relative = os.path.relpath(folder, root)
+                    return self.output_dir if relative == os.curdir else os.path.join(self.output_dir, relative)
+        return self.output_dir
+
+    def candidate_path(self, input_path):
+        """Output path from the layout and template, before collisions are resolved"""
+        output_format = determine_output_format(input_path, self.settings['format'])
+        name = render_name(self.settings['name_template'], input_path, output_format, self.settings)
+        return os.path.join(self.output_folder(input_path), name)
+
+    def _keys(self, output_path):
+        plan = variant_plan(output_path, self.settings)
+        if plan:
+            # Only the variant files are written, never output_path itself
+            paths = [variant_path(output_path, width, fmt) for width in plan[0] for fmt in plan[1]]
+        elif self.settings['format'] == 'smallest':
+            # 'smallest' picks the extension after encoding, so it claims all of them
+            paths = [with_format_extension(output_path, fmt) for fmt in SMALLEST_CANDIDATES]
+        else:
+            paths = [output_path]
+        return [os.path.normcase(os.path.abspath(path)) for path in paths]
+
+    def _holder(self, output_path):
+        for key in self._keys(output_path):
+            if key in self.reserved:
+                return self.reserved[key]
+        return None
+
+    def reserve(self, input_path):
+        """Reserve and return the output path for input_path.
+
+        Raises NameCollision when another input already holds the name and
+        the policy is 'skip' or 'fail'.
+        """
+        output_path = self.candidate_path(input_path)
+        holder = self._holder(output_path)
+        if holder is not None and self.policy == 'suffix':
+            base, extension = os.path.splitext(output_path)
+            number = 1
+            while holder is not None:
+                output_path = f"{base}_{number}{extension}"
+                holder = self._holder(output_path)
+                number += 1
+        elif holder is not None and self.policy != 'overwrite':
+            raise NameCollision(f"Output name {os.path.basename(output_path)} is already used by "
+                                f"{holder}", output_path)
+        for key in self._keys(output_path):
+            self.reserved[key] = input_path
+
+        folder = os.path.dirname(output_path)
+        if self.create_folders and folder not in self.created:
+            os.makedirs(folder, exist_ok=True)
+            self.created.add(folder)
+        return output_path
+
+    def hold(self, input_path, output_path):
+        """Mark output_path as taken by input_path, e.g. when it was planned by an earlier run"""
+        for key in self._keys(output_path):
+            self.reserved[key] = input_path
+
+    def claims(self, planned_path, output_path):
+        """True if output_path is (one of) the file(s) reserved as planned_path"""
+        return os.path.normcase(os.path.abspath(output_path)) in self._keys(planned_path)
+
+    def check_existing(self, output_path):
+        """Raise NameCollision if the policy keeps existing files and output_path exists"""
+        if self.policy not in ('skip', 'fail'):
+            return
+        for key in self._keys(output_path):
+            if os.path.exists(key):
+                raise NameCollision(f"{os.path.basename(key)} already exists", output_path)
@@ -0,0 +1,82 @@
+import io
+import math
+
+from PIL import Image, ImageChops
+
+try:
+    import numpy as np
+except ImportError:  # optional: only the perceptual quality mode needs it
+    np = None
+
+# The metric is computed on luma downsampled to at most this many pixels
+# on the long side; SSIM is stable well below display resolution
+METRIC_SIZE = 512
+
+# Side of the square SSIM window (same as scikit-image's default)
+WINDOW = 7
+
+# Stabilizing constants for 8-bit data (Wang et al. 2004)
+C1 = (0.01 * 255) ** 2
+C2 = (0.03 * 255) ** 2
+
+
+def available():
+    return np is not None
+
+
+def luma_plane(img, size=METRIC_SIZE):
+    """Luma of img, downsampled to fit size, as a float64 array"""
+    gray = img.convert('L')
+    if max(gray.size) > size:
+        ratio = size / max(gray.size)
+        gray = gray.resize((max(1, round(gray.width * ratio)), max(1, round(gray.height * ratio))),
+                           Image.Resampling.BOX)
+    return np.asarray(gray, dtype=np.float64)
+
+
+def psnr(reference, img):
+    """PSNR in dB of img against reference (same size; img is converted to reference's mode)"""
+    histogram = ImageChops.difference(reference, img.convert(reference.mode)).histogram()
+    # The histogram has 256 entries per band; only the difference matters
+    squared_error = sum(count * (position % 256) ** 2 for position, count in enumerate(histogram))
+    mse = squared_error / (reference.width * reference.height * len(reference.getbands()))
+    return float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def _window_mean(plane, window):
+    """Mean over every window x window block (valid region) via a summed-area table"""
+    table = np.zeros((plane.shape[0] + 1, plane.shape[1] + 1))
+    table[1:, 1:] = plane.cumsum(axis=0).cumsum(axis=1)
+    total = (table[window:, window:] - table[:-window, window:]
+             - table[window:, :-window] + table[:-window, :-window])
+    return total / (window * window)
+
+
+class SSIMScorer:
+    """SSIM of encoded candidates against one reference image.
+
+    The reference luma and its local statistics are computed once, so
+    scoring a quality probe costs one decode plus a few array passes.
+    """
+
+    def __init__(self, reference, size=METRIC_SIZE):
+        if np is None:
+            raise RuntimeError("The perceptual quality mode needs NumPy (pip install numpy)")
+        self.size = size
+        self.reference = luma_plane(reference, size)
+        self.window = max(1, min(WINDOW, *self.reference.shape))
+        self.mean = _window_mean(self.reference, self.window)
+        self.variance = _window_mean(self.reference ** 2, self.window) - self.mean ** 2
+
+    def score(self, data):
+        """Mean SSIM of the encoded bytes against the reference (1.0 = identical)"""
+        with Image.open(io.BytesIO(data)) as decoded:
+            plane = luma_plane(decoded, self.size)
+        if plane.shape != self.reference.shape:
+            raise ValueError("Decoded candidate does not match the reference size")
+        mean = _window_mean(plane, self.window)
+        variance = _window_mean(plane ** 2, self.window) - mean ** 2
+        covariance = _window_mean(plane * self.reference, self.window) - mean * self.mean
+        ssim_map = (((2 * mean * self.mean + C1) * (2 * covariance + C2))
+                    / ((mean ** 2 + self.mean ** 2 + C1) * (variance + self.variance + C2)))
+        return float(ssim_map.mean())
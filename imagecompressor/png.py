@@ -0,0 +1,164 @@
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageChops
+
+from .perceptual import psnr
+
+# zlib strategies, as Pillow's PNG encoder takes them in compress_type
+ZLIB_STRATEGIES = {0: 'default', 1: 'filtered', 2: 'huffman', 3: 'rle', 4: 'fixed'}
+
+# Encoder settings are (optimize, compress_level, strategy). Pillow's
+# optimize flag forces level 9 and changes how the row filters are picked;
+# PNG has no per-row filter option beyond that, so the search is over these.
+# Every candidate image is encoded at BASELINE first, which is what a plain
+# optimize=True save writes.
+BASELINE = (True, 9, 1)
+
+# Further trials for the best candidate, one parallel wave at a time
+SEARCH_WAVES = [
+    [(True, 9, 0), (False, 6, 0), (True, 9, 3)],
+    [(False, 9, 0), (False, 9, 1), (True, 9, 2)],
+]
+
+# The search stops once a wave shrinks the best result by less than this fraction
+MIN_GAIN = 0.005
+
+# Palette sizes tried, largest first, for lossy quantization
+LOSSY_PALETTE_SIZES = [256, 128, 64, 32, 16]
+
+# Grayscale images only gain from a palette when it allows 1, 2 or 4 bit pixels
+GRAY_PALETTE_COLORS = 16
+
+
+def _identical(a, b):
+    extrema = ImageChops.difference(a, b).getextrema()
+    if not isinstance(extrema[0], tuple):
+        extrema = [extrema]
+    return all(high == 0 for _, high in extrema)
+
+
+def _is_gray(img):
+    red, green, blue = img.split()[:3]
+    return _identical(red, green) and _identical(red, blue)
+
+
+def exact_palette(img):
+    """img as a 'P' image with exactly the same pixels, or None if it has over 256 colors.
+
+    The palette is sorted by frequency and only as long as needed, so
+    images with up to 16 colors are written with 1, 2 or 4 bit pixels.
+    RGBA colors keep their alpha in the palette.
+    """
+    if img.mode not in ('RGB', 'RGBA', 'L'):
+        return None
+    colors = img.getcolors(256)
+    if not colors:
+        return None
+    ordered = [color for _, color in sorted(colors, key=lambda entry: entry[0], reverse=True)]
+    if img.mode == 'L':
+        ordered = [(color,) * 3 for color in ordered]
+    if img.mode != 'RGBA':
+        palette = Image.new('P', (1, 1))
+        palette.putpalette([value for color in ordered for value in color])
+        candidate = img.quantize(palette=palette, dither=Image.Dither.NONE)
+        if _identical(candidate.convert(img.mode), img):
+            return candidate
+    # Pillow only maps RGB and L images onto a palette, and gives close
+    # colors one shared entry, so each pixel is looked up by its RGBA value
+    index = {int.from_bytes(bytes(color + (255,) * (4 - len(color))), sys.byteorder): position
+             for position, color in enumerate(ordered)}
+    pixels = memoryview(img.convert('RGBA').tobytes()).cast('I')
+    candidate = Image.frombytes('P', img.size, bytes(map(index.__getitem__, pixels)))
+    candidate.putpalette([value for color in ordered for value in color], 'RGBA' if img.mode == 'RGBA' else 'RGB')
+    return candidate
+
+
+def lossy_palette(img, min_psnr):
+    """(palette image, PSNR) with the fewest colors that keeps PSNR >= min_psnr, or None"""
+    if img.mode not in ('RGB', 'RGBA'):
+        return None
+    method = Image.Quantize.FASTOCTREE if img.mode == 'RGBA' else Image.Quantize.MEDIANCUT
+    best = None
+    for size in LOSSY_PALETTE_SIZES:
+        candidate = img.quantize(size, method=method)
+        score = psnr(img, candidate)
+        if score < min_psnr:
+            break
+        best = (candidate, score)
+    return best
+
+
+def reduce_image(img, gray=True, min_psnr=0):
+    """Candidate images for img in smaller pixel formats: [(image, info), ...].
+
+    The first is img itself with an opaque alpha channel dropped and, if
+    gray is allowed (no color profile to keep), a gray RGB image stored as
+    L. A palette version follows when the pixels fit in 256 colors, or with
+    min_psnr > 0, a quantized palette that stays above that PSNR. Apart
+    from the quantized one, every candidate decodes to exactly img's pixels.
+    info holds 'mode' and, for palettes, 'colors' (and 'psnr' if lossy).
+    """
+    if 'transparency' in img.info or img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        # Leave palette, 16-bit and tRNS images as they are
+        return [(img, {'mode': img.mode})]
+    if img.mode in ('RGBA', 'LA') and img.getchannel('A').getextrema()[0] == 255:
+        img = img.convert(img.mode[:-1])
+    if gray and img.mode in ('RGB', 'RGBA') and _is_gray(img):
+        img = img.convert('L' if img.mode == 'RGB' else 'LA')
+    candidates = [(img, {'mode': img.mode})]
+
+    palette = exact_palette(img)
+    if palette is not None and (img.mode != 'L' or len(palette.getpalette()) // 3 <= GRAY_PALETTE_COLORS):
+        candidates.append((palette, {'mode': 'P', 'colors': len(palette.getpalette()) // 3}))
+    elif palette is None and min_psnr:
+        quantized = lossy_palette(img, min_psnr)
+        if quantized:
+            candidates.append((quantized[0], {'mode': 'P', 'colors': len(quantized[0].getpalette()) // 3,
+                                              'psnr': quantized[1]}))
+    return candidates
+
+
+def encode_trial(img, save_kwargs, optimize, level, strategy):
+    """PNG bytes of img with one set of encoder settings"""
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', **dict(save_kwargs, optimize=optimize, compress_level=level,
+                                          compress_type=strategy))
+    return buffer.getvalue()
+
+
+def optimize_png(img, save_kwargs, gray=True, min_psnr=0):
+    """Smallest PNG encoding of img found by trying pixel formats and zlib settings.
+
+    The candidates of reduce_image() are encoded in parallel at BASELINE;
+    the smallest then goes through SEARCH_WAVES until a wave gains less
+    than MIN_GAIN. All trials share the one decoded image. save_kwargs
+    (metadata and the like) is passed to every encode. Returns (data,
+    details) where details holds the winning 'mode', 'colors' / 'psnr' for
+    palettes, 'optimize', 'level', 'strategy' and the number of 'trials'.
+    """
+    data, _, _, details = search_png(img, save_kwargs, gray, min_psnr)
+    return data, details
+
+
+def search_png(img, save_kwargs, gray=True, min_psnr=0):
+    """optimize_png(), also returning the winner: (data, reduced image, encoder settings, details)"""
+    candidates = reduce_image(img, gray, min_psnr)
+    trials = 0
+    with ThreadPoolExecutor(max_workers=min(len(SEARCH_WAVES[0]), os.cpu_count() or 1)) as pool:
+        encoded = list(pool.map(lambda candidate: encode_trial(candidate[0], save_kwargs, *BASELINE), candidates))
+        trials += len(encoded)
+        data, (best, info) = min(zip(encoded, candidates), key=lambda outcome: len(outcome[0]))
+        setting = BASELINE
+        for wave in SEARCH_WAVES:
+            before = len(data)
+            for trial, result in zip(wave, pool.map(lambda trial: encode_trial(best, save_kwargs, *trial), wave)):
+                if len(result) < len(data):
+                    data, setting = result, trial
+            trials += len(wave)
+            if before - len(data) < before * MIN_GAIN:
+                break
+    return data, best, setting, dict(info, optimize=setting[0], level=setting[1],
+                                     strategy=ZLIB_STRATEGIES[setting[2]], trials=trials)
@@ -0,0 +1,382 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image, PngImagePlugin
+
+from .core import (QUALITY_FORMATS, STRIP_BUDGET_FRACTION, apply_draft, atomic_output,
+                   determine_output_format, encode_image, encode_png, encode_smallest, get_save_kwargs, has_alpha,
+                   memory_budget_bytes, open_image, prepare_for_format, resize_image, resize_in_strips,
+                   search_quality_for_size, search_quality_for_ssim, use_strips)
+from .estimate import estimate_compressed_size
+from .metadata import apply_orientation, oriented_settings, read_metadata
+
+# Size of the preview canvas in the GUI
+PREVIEW_SIZE = (300, 180)
+
+# In-memory thumbnails are evicted (least recently used first) above this
+PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+# The on-disk cache is trimmed (oldest first) to this size when it is opened
+DISK_CACHE_BYTES = 256 * 1024 * 1024
+
+# List entries on each side of the selection that are decoded ahead of time
+PREFETCH_NEIGHBOURS = 2
+
+# Decoded output-size proxies kept for the before/after view
+PROXY_CACHE_COUNT = 4
+
+# Settings that change the proxy itself; the others only change the encode
+PROXY_KEYS = ['max_width', 'max_height', 'resample_method', 'fast_decode', 'auto_orient', 'keep_exif',
+              'strip_exif_extras', 'keep_icc', 'max_image_pixels', 'memory_budget_mb']
+
+# Zoom factors of the before/after view; 0 fits the whole image
+ZOOM_LEVELS = [0, 1, 2, 4]
+
+# Header fields kept with every thumbnail (and in its PNG text chunks on disk)
+INFO_FIELDS = ['width', 'height', 'format', 'mode']
+
+
+def default_disk_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'imagecompressor', 'thumbnails')
+
+
+def file_key(path, size=PREVIEW_SIZE):
+    """Identity of a file's thumbnail; changes whenever the file is modified"""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, size)
+
+
+def make_thumbnail(path, size=PREVIEW_SIZE):
+    """Thumbnail (RGB or RGBA) and header info of an image file.
+
+    thumbnail() on the not yet loaded image uses JPEG draft decoding and
+    reduce(), so the full-resolution raster is never materialized.
+    """
+    with Image.open(path) as img:
+        info = {'width': img.width, 'height': img.height, 'format': img.format, 'mode': img.mode}
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        if img.mode not in ('RGB', 'RGBA'):
+            thumbnail = img.convert('RGBA' if has_alpha(img) else 'RGB')
+        else:
+            thumbnail = img.copy()
+    return thumbnail, info
+
+
+class PreviewEntry:
+    """A cached thumbnail plus the header info shown next to it"""
+
+    def __init__(self, thumbnail, info, original_size):
+        self.thumbnail = thumbnail
+        self.info = info
+        self.original_size = original_size
+        self.nbytes = thumbnail.width * thumbnail.height * len(thumbnail.getbands())
+
+
+class PreviewCache:
+    """Byte-capped LRU of preview thumbnails with background prefetching.
+
+    Thumbnails are made on a small thread pool; request() returns a Future
+    so the GUI can poll it from the Tk main loop instead of blocking. A
+    file requested twice while it is being decoded shares one decode. With
+    disk_dir, thumbnails are also stored as PNGs keyed by path, mtime and
+    size, so reopening a folder doesn't decode the originals again.
+    """
+
+    def __init__(self, max_bytes=PREVIEW_CACHE_BYTES, disk_dir=None, workers=2):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.used = 0
+        self.loading = {}
+        # Prefetches nobody has asked for yet; dropped when the selection moves on
+        self.speculative = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+        self.use_disk(disk_dir)
+
+    def use_disk(self, disk_dir):
+        """Turn the on-disk cache on (trimming it in the background) or off (None)"""
+        self.disk_dir = disk_dir
+        if disk_dir:
+            self.executor.submit(prune_disk_cache, disk_dir, DISK_CACHE_BYTES)
+
+    def request(self, path, prefetch=False):
+        """Future resolving to the PreviewEntry of path (already done when cached)"""
+        try:
+            key = file_key(path)
+        except OSError as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                future = Future()
+                future.set_result(self.entries[key])
+                return future
+            if key in self.loading:
+                if not prefetch:
+                    self.speculative.pop(key, None)
+                return self.loading[key]
+            future = self.executor.submit(self._load, path, key)
+            self.loading[key] = future
+            if prefetch:
+                self.speculative[key] = future
+        return future
+
+    def prefetch(self, paths):
+        """Start loading thumbnails that are likely to be shown next.
+
+        Earlier prefetches that haven't started are cancelled, so scrolling
+        quickly through the list doesn't queue work ahead of the selection.
+        """
+        with self.lock:
+            for key, future in list(self.speculative.items()):
+                if future.cancel():
+                    self.loading.pop(key, None)
+            self.speculative.clear()
+        for path in paths:
+            self.request(path, prefetch=True)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, path, key):
+        try:
+            entry = self._read_disk(key) if self.disk_dir else None
+            if entry is None:
+                thumbnail, info = make_thumbnail(path)
+                entry = PreviewEntry(thumbnail, info, key[2])
+                if self.disk_dir:
+                    self._write_disk(key, entry)
+            self._store(key, entry)
+            return entry
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+                self.speculative.pop(key, None)
+
+    def _store(self, key, entry):
+        with self.lock:
+            if key in self.entries:
+                self.used -= self.entries.pop(key).nbytes
+            self.entries[key] = entry
+            self.used += entry.nbytes
+            while self.used > self.max_bytes and len(self.entries) > 1:
+                self.used -= self.entries.popitem(last=False)[1].nbytes
+
+    def _disk_path(self, key):
+        digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.disk_dir, digest[:2], digest + '.png')
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            with Image.open(path) as img:
+                img.load()
+                info = {field: img.text[field] for field in INFO_FIELDS}
+                thumbnail = img.copy()
+            os.utime(path)  # keeps recently used thumbnails when the cache is trimmed
+        except Exception:
+            # Missing, truncated or written by another version: decode again
+            return None
+        info['width'] = int(info['width'])
+        info['height'] = int(info['height'])
+        return PreviewEntry(thumbnail, info, key[2])
+
+    def _write_disk(self, key, entry):
+        path = self._disk_path(key)
+        text = PngImagePlugin.PngInfo()
+        for field in INFO_FIELDS:
+            text.add_text(field, str(entry.info[field]))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_output(path) as temp_path:
+                entry.thumbnail.save(temp_path, format='PNG', pnginfo=text)
+        except Exception:
+            # The disk cache is only an optimization
+            pass
+
+
+def prune_disk_cache(directory, max_bytes):
+    """Delete the least recently used thumbnails until directory fits max_bytes"""
+    files = []
+    for folder, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def make_proxy(path, settings):
+    """Decoded, resized and oriented image of path as compress() would encode it, plus its metadata"""
+    with open_image(path, settings) as img:
+        metadata = read_metadata(img, settings)
+        sizing = oriented_settings(settings, metadata['orientation'])
+        if use_strips(img, sizing):
+            band_bytes = int(memory_budget_bytes(settings) * STRIP_BUDGET_FRACTION)
+            proxy = resize_in_strips(path, img, sizing, band_bytes)
+        else:
+            original_size = apply_draft(img, sizing)
+            img.load()
+            proxy = resize_image(img, sizing, original_size)
+        proxy = apply_orientation(proxy, metadata['orientation'])
+        if proxy is img:
+            proxy = img.copy()
+    return proxy, metadata
+
+
+def encode_proxy(proxy, output_format, settings, metadata):
+    """Encode a proxy the way compress() encodes the output: (format, data, details)"""
+    if output_format == 'smallest':
+        return encode_smallest(proxy, settings, metadata)
+    target_size_kb = settings.get('target_size_kb') or 0
+    if target_size_kb > 0 and output_format in QUALITY_FORMATS:
+        data, quality, probes, fits = search_quality_for_size(
+            proxy, output_format, settings, int(target_size_kb * 1024), metadata=metadata)
+        return output_format, data, {'quality': quality, 'probes': probes, 'target_met': fits}
+    if settings.get('min_ssim') and output_format in QUALITY_FORMATS:
+        data, quality, probes, score = search_quality_for_ssim(
+            proxy, output_format, settings, settings['min_ssim'], metadata=metadata)
+        return output_format, data, {'quality': quality, 'probes': probes, 'ssim': score}
+    if output_format == 'PNG':
+        data, details = encode_png(proxy, settings, metadata)
+        return output_format, data, {'png': details} if details else {}
+    source = prepare_for_format(proxy, output_format)
+    data = encode_image(source, output_format, get_save_kwargs(output_format, settings, metadata, source.mode))
+    return output_format, data, {}
+
+
+class LiveResult:
+    """A proxy ('before'), its decoded encode ('after') and the encoded size"""
+
+    def __init__(self, path, before, after, output_format, size, details, elapsed):
+        self.path = path
+        self.before = before
+        self.after = after
+        self.format = output_format
+        self.size = size
+        self.details = details
+        self.elapsed = elapsed
+
+
+class LivePreview:
+    """Re-encodes a cached output-size proxy of a file on a background thread.
+
+    The proxy (decoded, resized and oriented like compress() does) is made
+    once per file and size settings, so a quality change only costs one
+    encode and decode of the output-size image. There is a single worker:
+    each request() cancels the previous one if it hasn't started, and a job
+    that was overtaken while its proxy was being made skips the encode, so
+    fast slider moves only ever encode the latest settings.
+    """
+
+    def __init__(self, max_proxies=PROXY_CACHE_COUNT):
+        self.max_proxies = max_proxies
+        self.proxies = OrderedDict()
+        self.pending = None
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='live-preview')
+
+    def request(self, path, settings):
+        """Future resolving to a LiveResult for path encoded with settings (None if overtaken)"""
+        with self.lock:
+            self.generation += 1
+            if self.pending is not None:
+                self.pending.cancel()
+            self.pending = self.executor.submit(self._render, path, dict(settings), self.generation)
+            return self.pending
+
+    def estimate(self, path, settings, use_proxy=True):
+        """Future resolving to estimate_compressed_size() of path.
+
+        Runs on the same worker as request(); with use_proxy the tiles are
+        cut from the (cached) proxy, so the estimate and the before/after
+        view share one decode of the file. Without it the estimator
+        decodes just the sample it needs.
+        """
+        return self.executor.submit(self._estimate, path, dict(settings), use_proxy)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _estimate(self, path, settings, use_proxy):
+        proxy = self._proxy(path, settings)[0] if use_proxy else None
+        return estimate_compressed_size(path, settings, proxy=proxy)
+
+    def _proxy(self, path, settings):
+        key = (file_key(path), tuple(repr(settings.get(name)) for name in PROXY_KEYS))
+        if key in self.proxies:
+            self.proxies.move_to_end(key)
+            return self.proxies[key]
+        entry = make_proxy(path, settings)
+        self.proxies[key] = entry
+        while len(self.proxies) > self.max_proxies:
+            self.proxies.popitem(last=False)
+        return entry
+
+    def _render(self, path, settings, generation):
+        proxy, metadata = self._proxy(path, settings)
+        if generation != self.generation:
+            return None
+        started = time.perf_counter()
+        output_format = determine_output_format(path, settings['format'])
+        output_format, data, details = encode_proxy(proxy, output_format, settings, metadata)
+        after = Image.open(io.BytesIO(data))
+        after.load()
+        return LiveResult(path, proxy, after, output_format, len(data), details, time.perf_counter() - started)
+
+
+def split_view(before, after, size, zoom=0, focus=(0.5, 0.5)):
+    """Image of size showing before on the left half and after on the right half.
+
+    Both halves show the same region: the whole image scaled to fit with
+    zoom 0, otherwise a window around focus (fractions of the width and
+    height) magnified zoom times with nearest-neighbour scaling, so
+    compression artifacts stay visible as they are.
+    """
+    width, height = size
+    if zoom:
+        region_w = min(before.width, max(1, width // zoom))
+        region_h = min(before.height, max(1, height // zoom))
+        left = min(max(0, int(focus[0] * before.width - region_w / 2)), before.width - region_w)
+        top = min(max(0, int(focus[1] * before.height - region_h / 2)), before.height - region_h)
+        box = (left, top, left + region_w, top + region_h)
+        scaled = (region_w * zoom, region_h * zoom)
+        resample = Image.Resampling.NEAREST
+    else:
+        box = (0, 0, before.width, before.height)
+        ratio = min(width / before.width, height / before.height)
+        scaled = (max(1, int(before.width * ratio)), max(1, int(before.height * ratio)))
+        resample = Image.Resampling.LANCZOS
+
+    mode = 'RGBA' if has_alpha(before) or has_alpha(after) else 'RGB'
+    halves = [image.crop(box).convert(mode).resize(scaled, resample) for image in (before, after)]
+    view = Image.new(mode, size, 'white')
+    offset = ((width - scaled[0]) // 2, (height - scaled[1]) // 2)
+    view.paste(halves[0], offset)
+    # The right half of the canvas comes from the encoded image
+    middle = width // 2 - offset[0]
+    if middle < scaled[0]:
+        right = halves[1].crop((max(0, middle), 0, scaled[0], scaled[1]))
+        view.paste(right, (offset[0] + max(0, middle), offset[1]))
+    return view
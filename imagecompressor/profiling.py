@@ -0,0 +1,147 @@
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager, nullcontext
+
+# Pipeline stages timed by compress() when settings['profile'] is on.
+# 'encode' includes writing the temporary file; 'stat' is the size lookups.
+STAGES = ['decode', 'resize', 'encode', 'stat']
+
+
+class StageTimer:
+    """Accumulates wall and CPU seconds per pipeline stage for one file.
+
+    CPU time is the whole process's, so the encoder thread pools
+    ('smallest', variants, the PNG search) are counted. compress() runs
+    in batch, archive and benchmark worker processes that handle one
+    file at a time, so nothing else is charged to the file.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+            entry['wall'] += time.perf_counter() - wall
+            entry['cpu'] += time.process_time() - cpu
+
+    def timings(self):
+        """Per-stage totals plus 'total' for the whole file"""
+        timings = {name: dict(entry) for name, entry in self.stages.items()}
+        timings['total'] = {'wall': time.perf_counter() - self.started,
+                            'cpu': time.process_time() - self.cpu_started}
+        return timings
+
+
+class NullTimer:
+    """Stand-in used when profiling is off; records nothing"""
+
+    def stage(self, name):
+        return nullcontext()
+
+
+NULL_TIMER = NullTimer()
+
+
+class ProfileReport:
+    """Collects the timings of profiled results and summarizes them.
+
+    Cached, resumed and failed results carry no timings and are skipped.
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, result):
+        timings = result.get('timings')
+        if result.get('error') or not timings or result.get('cached') or result.get('resumed'):
+            return
+        row = {
+            'input_path': result['input_path'],
+            'format': result['format'],
+            'pixels': result.get('pixels', 0),
+            'original_size': result['original_size'],
+            'compressed_size': result['compressed_size']
+        }
+        for stage in STAGES + ['total']:
+            entry = timings.get(stage, {'wall': 0.0, 'cpu': 0.0})
+            row[f'{stage}_wall'] = entry['wall']
+            row[f'{stage}_cpu'] = entry['cpu']
+        self.rows.append(row)
+
+    def extend(self, results):
+        for result in results:
+            self.add(result)
+        return self
+
+    def summary_lines(self, slowest=5):
+        """Stage shares, per-format throughput and the slowest files as text lines"""
+        if not self.rows:
+            return ["Profile: no files were compressed"]
+        total_wall = sum(row['total_wall'] for row in self.rows)
+        total_cpu = sum(row['total_cpu'] for row in self.rows)
+        lines = [f"Profile: {len(self.rows)} file(s), {total_wall:.2f} s wall / {total_cpu:.2f} s CPU "
+                 f"in the pipeline (summed over workers)",
+                 f"  {'stage':<8} {'wall s':>9} {'share':>7} {'cpu s':>9}"]
+
+        accounted = 0.0
+        for stage in STAGES:
+            wall = sum(row[f'{stage}_wall'] for row in self.rows)
+            cpu = sum(row[f'{stage}_cpu'] for row in self.rows)
+            accounted += wall
+            lines.append(f"  {stage:<8} {wall:>9.3f} {_share(wall, total_wall):>7} {cpu:>9.3f}")
+        other = max(0.0, total_wall - accounted)
+        lines.append(f"  {'other':<8} {other:>9.3f} {_share(other, total_wall):>7}")
+
+        lines.append(f"  {'format':<8} {'files':>6} {'MP':>9} {'MP/s':>8} {'files/s':>8}")
+        for fmt in sorted({row['format'] for row in self.rows}):
+            rows = [row for row in self.rows if row['format'] == fmt]
+            wall = sum(row['total_wall'] for row in rows)
+            megapixels = sum(row['pixels'] for row in rows) / 1e6
+            lines.append(f"  {fmt:<8} {len(rows):>6} {megapixels:>9.1f} "
+                         f"{megapixels / wall if wall else 0:>8.1f} {len(rows) / wall if wall else 0:>8.2f}")
+
+        lines.append("  slowest files:")
+        for row in sorted(self.rows, key=lambda row: row['total_wall'], reverse=True)[:slowest]:
+            stages = ", ".join(f"{stage} {_share(row[f'{stage}_wall'], row['total_wall'])}" for stage in STAGES)
+            lines.append(f"  {row['total_wall']:>8.3f} s  {os.path.basename(row['input_path'])} "
+                         f"({row['pixels'] / 1e6:.1f} MP, {row['format']}): {stages}")
+        return lines
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'stages': STAGES, 'files': self.rows}, f, indent=2, ensure_ascii=False)
+
+    def write_csv(self, path):
+        fields = ['input_path', 'format', 'pixels', 'original_size', 'compressed_size']
+        fields += [f'{stage}_{kind}' for stage in STAGES + ['total'] for kind in ('wall', 'cpu')]
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+
+def _share(part, whole):
+    return f"{part / whole * 100:.1f}%" if whole else "-"
+
+
+def run_cprofile(stats_path, func, *args, **kwargs):
+    """Call func under cProfile, dump the stats to stats_path; returns (result, top functions text)"""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    profiler.dump_stats(stats_path)
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(20)
+    return result, text.getvalue()
@@ -0,0 +1,183 @@
+import os
+import queue
+import threading
+import time
+from fnmatch import fnmatch
+
+from .core import IMAGE_EXTENSIONS
+
+
+def _matches(rel_path, patterns):
+    """True if the relative path or its base name matches any glob pattern"""
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch(rel_path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+
+def iter_images(root, include=None, exclude=None, extensions=IMAGE_EXTENSIONS, stop_event=None):
+    """Yield image paths under root, depth first, in sorted order per directory.
+
+    Uses os.scandir so file type checks come from the directory listing.
+    Symlinked directories are followed, but each real directory is visited
+    only once, which also breaks symlink loops. include/exclude are glob
+    patterns matched against the path relative to root (with '/'
+    separators) or the base name; exclude also prunes directories.
+    """
+    include = list(include or [])
+    exclude = list(exclude or [])
+    visited = set()
+    stack = [root]
+
+    while stack:
+        if stop_event is not None and stop_event.is_set():
+            return
+        directory = stack.pop()
+        try:
+            stat = os.stat(directory)
+            key = (stat.st_dev, stat.st_ino)
+            if key in visited:
+                continue
+            visited.add(key)
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            rel_path = os.path.relpath(entry.path, root).replace(os.sep, '/')
+            try:
+                if entry.is_dir():
+                    if not _matches(rel_path, exclude):
+                        subdirs.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            if os.path.splitext(entry.name)[1].lower() not in extensions:
+                continue
+            if include and not _matches(rel_path, include):
+                continue
+            if exclude and _matches(rel_path, exclude):
+                continue
+            yield entry.path
+
+        # Reversed so the stack pops subdirectories in name order
+        stack.extend(reversed(subdirs))
+
+
+class FolderScanner(threading.Thread):
+    """Background folder scan that hands out discovered paths in batches.
+
+    Batches (lists of paths) are put on self.batches; None marks the end of
+    the scan. A batch is flushed when it reaches batch_size or when
+    flush_interval seconds have passed, so consumers see files early.
+    """
+
+    def __init__(self, root, include=None, exclude=None, batch_size=500, flush_interval=0.2):
+        super().__init__(daemon=True)
+        self.root = root
+        self.include = include
+        self.exclude = exclude
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batches = queue.Queue()
+        self.stop_event = threading.Event()
+        self.found = 0
+
+    def run(self):
+        batch = []
+        last_flush = time.monotonic()
+        try:
+            for path in iter_images(self.root, self.include, self.exclude, stop_event=self.stop_event):
+                batch.append(path)
+                self.found += 1
+                if len(batch) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                    self.batches.put(batch)
+                    batch = []
+                    last_flush = time.monotonic()
+            if batch:
+                self.batches.put(batch)
+        finally:
+            self.batches.put(None)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class FileList:
+    """Ordered, de-duplicated list of input files that can grow while it is read.
+
+    Membership checks use a set, so adding n files is O(n). iter_growing()
+    keeps yielding newly added files while any scan started with
+    begin_scan() has not yet called end_scan(), which lets compression
+    start while a scan is still running.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self.index = set()
+        self.open_scans = 0
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, position):
+        return self.paths[position]
+
+    def __iter__(self):
+        return iter(list(self.paths))
+
+    def extend(self, paths):
+        """Add new paths; returns the ones that were not already present"""
+        added = []
+        with self.condition:
+            for path in paths:
+                if path not in self.index:
+                    self.index.add(path)
+                    self.paths.append(path)
+                    added.append(path)
+            self.condition.notify_all()
+        return added
+
+    def clear(self):
+        with self.condition:
+            self.paths = []
+            self.index = set()
+            self.condition.notify_all()
+
+    def begin_scan(self):
+        with self.condition:
+            self.open_scans += 1
+
+    def end_scan(self):
+        with self.condition:
+            self.open_scans = max(0, self.open_scans - 1)
+            self.condition.notify_all()
+
+    @property
+    def scanning(self):
+        return self.open_scans > 0
+
+    def iter_growing(self, idle_interval=0.25):
+        """Yield every path, waiting for more while a scan is in progress.
+
+        While waiting, None is yielded every idle_interval seconds so the
+        consumer can do other work (BatchCompressor collects results).
+        """
+        position = 0
+        while True:
+            with self.condition:
+                if position >= len(self.paths) and self.open_scans > 0:
+                    self.condition.wait(idle_interval)
+                if position < len(self.paths):
+                    path = self.paths[position]
+                elif self.open_scans > 0:
+                    path = None
+                else:
+                    return
+            if path is not None:
+                position += 1
+            yield path
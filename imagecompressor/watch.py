@@ -0,0 +1,408 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .batch import _compress_task, _init_worker, default_worker_count
+from .core import IMAGE_EXTENSIONS, atomic_output, resolve_settings
+from .events import STARTED, FILE_DONE, FILE_FAILED, FILE_SKIPPED, FINISHED, LOG
+from .manifest import Manifest
+from .naming import NameCollision, OutputPlanner
+from .scan import _matches, iter_images
+
+try:
+    from watchdog.observers import Observer
+except ImportError:  # optional: inotify / FSEvents change notifications instead of polling
+    Observer = None
+
+# Seconds between directory scans (polling) or debounce checks (watchdog)
+POLL_INTERVAL = 1.0
+
+# A file is compressed once its size and mtime have not changed for this long
+SETTLE_SECONDS = 2.0
+
+# Files waiting for a worker; when it is full, ready files wait in the debounce list
+QUEUE_SIZE = 64
+
+# With change notifications the folders are still rescanned this often, for missed events
+RESCAN_INTERVAL = 300.0
+
+# Throughput in the status is averaged over this many seconds
+RATE_WINDOW = 60.0
+
+STATUS_INTERVAL = 1.0
+
+
+class _ChangeHandler:
+    """watchdog event handler passing the paths of created, modified and moved files on"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def dispatch(self, event):
+        if event.is_directory:
+            return
+        path = getattr(event, 'dest_path', None) or event.src_path
+        self.callback(os.fsdecode(path))
+
+
+class WatchService:
+    """Compresses images as they appear or change in watched folders.
+
+    Folders are watched with watchdog when it is installed (and use_polling
+    is off), otherwise rescanned every poll_interval seconds. A file is only
+    handed out once its size and mtime have been stable for settle seconds,
+    so files still being copied in are not compressed half-written. Ready
+    files go through a bounded queue to a process pool of workers; when the
+    queue is full they stay in the debounce list until there is room.
+
+    Output paths come from the naming settings like a batch, with the
+    watched folders as the 'mirror' roots, and are reserved in the order
+    files settle: a name already given to another file follows the
+    collision policy. A file keeps its name, so a changed file replaces its
+    earlier output (existing files are never a collision here). A Manifest
+    in output_dir makes restarts skip files that were already compressed
+    with the same settings, and keeps their names reserved.
+
+    run() blocks until stop() is called (from a signal handler or another
+    thread). Files already handed to a worker are finished and recorded;
+    queued ones are left for the next start. status() returns queue depth,
+    throughput and totals; with status_file it is also written there as
+    JSON every second.
+    """
+
+    def __init__(self, roots, output_dir, settings, workers=None, events=None, include=None, exclude=None,
+                 poll_interval=POLL_INTERVAL, settle=SETTLE_SECONDS, queue_size=QUEUE_SIZE,
+                 status_file=None, use_polling=False):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.output_dir = os.path.abspath(output_dir)
+        self.settings = resolve_settings(settings)
+        self.planner = OutputPlanner(self.output_dir, self.settings, self.roots)
+        self.workers = max(1, int(workers or self.settings.get('workers') or default_worker_count()))
+        self.events = events
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.queue_size = queue_size
+        self.status_file = status_file
+        self.use_polling = use_polling or Observer is None
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.completed = queue.Queue()
+        self.slots = threading.BoundedSemaphore(self.workers)
+        self.stop_event = threading.Event()
+        # path -> (size, mtime_ns) when it was last handed out or found unchanged
+        self.known = {}
+        # path -> ((size, mtime_ns), time it was last seen changing)
+        self.settling = {}
+        # path -> the output path reserved for it
+        self.outputs = {}
+        self.changed = set()
+        self.changed_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.sequence = 0
+        self.finish_times = deque()
+        self.started = time.monotonic()
+        self.state = 'starting'
+        self.stats = {'processed': 0, 'failed': 0, 'cached': 0, 'skipped': 0, 'deferred': 0,
+                      'original_bytes': 0, 'compressed_bytes': 0, 'last_error': None}
+        self.snapshot = {}
+
+    def stop(self):
+        self.stop_event.set()
+
+    def status(self):
+        """Latest status snapshot (safe to call from any thread)"""
+        with self.lock:
+            return dict(self.snapshot)
+
+    def run(self):
+        """Watch and compress until stop(); returns the final status"""
+        manifest = Manifest(self.output_dir, self.settings, use_hash=self.settings['content_hash'])
+        for path, output_path in manifest.outputs():
+            if self._wanted(path):
+                self.planner.hold(path, output_path)
+                self.outputs[path] = output_path
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        dispatcher = threading.Thread(target=self._dispatch, args=(executor,), name='watch-dispatch',
+                                      daemon=True)
+        dispatcher.start()
+        observer = self._start_observer()
+        self._emit(STARTED, total=None, workers=self.workers)
+        self._emit(LOG, message=f"Watching {len(self.roots)} folder(s) "
+                                f"({'polling' if observer is None else 'change notifications'})")
+        self.state = 'running'
+        last_scan = last_status = None
+        try:
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                if last_scan is None or observer is None or now - last_scan >= RESCAN_INTERVAL:
+                    self._scan()
+                    last_scan = now
+                self._drain_changes()
+                self._settle(now, manifest)
+                self._collect(manifest)
+                if last_status is None or now - last_status >= STATUS_INTERVAL:
+                    self._publish()
+                    last_status = now
+                self.stop_event.wait(self.poll_interval)
+        finally:
+            self.state = 'stopping'
+            self._publish()
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            # Queued files were not started; they are picked up again on the next start
+            try:
+                while True:
+                    self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.queue.put(None)
+            dispatcher.join()
+            executor.shutdown(wait=True)
+            self._collect(manifest)
+            manifest.close()
+            self.state = 'stopped'
+            self._publish()
+            final = self.status()
+            self._emit(FINISHED, **{key: value for key, value in final.items()
+                                    if key not in ('state', 'watching')},
+                       elapsed=final['uptime'], cancelled=False)
+        return final
+
+    def _emit(self, kind, **data):
+        if self.events:
+            self.events.emit(kind, **data)
+
+    def _start_observer(self):
+        if self.use_polling:
+            return None
+        observer = Observer()
+        handler = _ChangeHandler(self._on_change)
+        for root in self.roots:
+            observer.schedule(handler, root, recursive=True)
+        observer.start()
+        return observer
+
+    def _on_change(self, path):
+        # Called on the observer thread
+        with self.changed_lock:
+            self.changed.add(path)
+
+    def _wanted(self, path):
+        if os.path.splitext(path)[1].lower() not in IMAGE_EXTENSIONS:
+            return False
+        if path == self.output_dir or path.startswith(self.output_dir + os.sep):
+            # Outputs written into a watched folder must not be compressed again
+            return False
+        for root in self.roots:
+            if path.startswith(root.rstrip(os.sep) + os.sep):
+                rel_path = os.path.relpath(path, root).replace(os.sep, '/')
+                if self.include and not _matches(rel_path, self.include):
+                    return False
+                return not (self.exclude and _matches(rel_path, self.exclude))
+        return False
+
+    def _scan(self):
+        seen = set()
+        for root in self.roots:
+            for path in iter_images(root, self.include, self.exclude, stop_event=self.stop_event):
+                if self._wanted(path):
+                    seen.add(path)
+                    self._notice(path)
+        if self.stop_event.is_set():
+            return
+        # Forget deleted files, so they are compressed again if they come back
+        for path in list(self.known):
+            if path not in seen:
+                del self.known[path]
+
+    def _drain_changes(self):
+        with self.changed_lock:
+            changed, self.changed = self.changed, set()
+        for path in changed:
+            path = os.path.abspath(path)
+            if self._wanted(path):
+                self._notice(path)
+
+    def _notice(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.settling.pop(path, None)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if self.known.get(path) == signature:
+            return
+        if path not in self.settling or self.settling[path][0] != signature:
+            self.settling[path] = (signature, time.monotonic())
+
+    def _settle(self, now, manifest):
+        """Hand out files whose size and mtime have stopped changing"""
+        deferred = 0
+        for path, (signature, since) in list(self.settling.items()):
+            if now - since < self.settle:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.settling[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != signature:
+                self.settling[path] = (current, now)
+                continue
+            if deferred or self.queue.full():
+                # Backpressure: wait for the workers instead of growing the queue
+                deferred += 1
+                continue
+
+            cached = manifest.lookup(path)
+            if cached:
+                del self.settling[path]
+                self.known[path] = signature
+                cached['index'] = self._next_index()
+                self._finish(cached)
+                continue
+            del self.settling[path]
+            self.known[path] = signature
+            output_path = self._reserve(path)
+            if output_path:
+                self.queue.put_nowait((self._next_index(), path, output_path))
+        self.stats['deferred'] = deferred
+
+    def _reserve(self, path):
+        """Output path of path, reserved on first use; None if the collision policy settles it"""
+        output_path = self.outputs.get(path)
+        if output_path:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            return output_path
+        try:
+            output_path = self.planner.reserve(path)
+        except NameCollision as e:
+            result = {'index': self._next_index(), 'input_path': path, 'error': str(e)}
+            if self.planner.policy == 'skip':
+                result.update(error=None, skipped=str(e), output_path=e.output_path)
+            self._finish(result)
+            return None
+        self.outputs[path] = output_path
+        return output_path
+
+    def _next_index(self):
+        self.sequence += 1
+        return self.sequence - 1
+
+    def _dispatch(self, executor):
+        """Dispatcher thread: moves queued files to the pool, at most one per worker"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self.slots.acquire()
+            if self.stop_event.is_set():
+                self.slots.release()
+                continue
+            with self.lock:
+                self.in_flight += 1
+            future = executor.submit(_compress_task, *item, self.settings)
+            future.add_done_callback(lambda future, item=item: self._on_done(future, item))
+
+    def _on_done(self, future, item):
+        try:
+            result = future.result()
+        except Exception as e:
+            # The pool itself broke (e.g. a worker was killed)
+            result = {'index': item[0], 'input_path': item[1], 'error': str(e)}
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+        self.completed.put(result)
+
+    def _collect(self, manifest):
+        try:
+            while True:
+                result = self.completed.get_nowait()
+                if not result['error']:
+                    try:
+                        manifest.record(result)
+                    except Exception:
+                        # The output is fine; it just gets recompressed after a restart
+                        pass
+                self._finish(result)
+        except queue.Empty:
+            pass
+
+    def _finish(self, result):
+        stats = self.stats
+        stats['processed'] += 1
+        self.finish_times.append(time.monotonic())
+        if result['error']:
+            stats['failed'] += 1
+            stats['last_error'] = f"{result['input_path']}: {result['error']}"
+            self._emit(FILE_FAILED, index=result['index'], processed=stats['processed'], total=None,
+                       input_path=result['input_path'], error=result['error'])
+            return
+        if result.get('skipped'):
+            stats['skipped'] += 1
+            self._emit(FILE_SKIPPED, index=result['index'], processed=stats['processed'], total=None,
+                       input_path=result['input_path'], reason=result['skipped'])
+            return
+        stats['cached'] += 1 if result.get('cached') else 0
+        stats['original_bytes'] += result['original_size']
+        stats['compressed_bytes'] += result['compressed_size']
+        self._emit(FILE_DONE, index=result['index'], processed=stats['processed'], total=None, result=result)
+
+    def _publish(self):
+        """Refresh the status snapshot and write the status file"""
+        now = time.monotonic()
+        while self.finish_times and now - self.finish_times[0] > RATE_WINDOW:
+            self.finish_times.popleft()
+        window = min(RATE_WINDOW, max(now - self.started, 1e-9))
+        with self.lock:
+            self.snapshot = dict(self.stats, **{
+                'state': self.state,
+                'watching': self.roots,
+                'uptime': now - self.started,
+                'workers': self.workers,
+                'in_flight': self.in_flight,
+                'queued': self.queue.qsize(),
+                'queue_size': self.queue_size,
+                'settling': len(self.settling),
+                'files_per_minute': len(self.finish_times) * 60.0 / window
+            })
+            snapshot = dict(self.snapshot)
+        if self.status_file:
+            try:
+                with atomic_output(self.status_file) as temp_path:
+                    with open(temp_path, 'w') as f:
+                        json.dump(snapshot, f, indent=2)
+            except Exception:
+                # Monitoring must not stop the service
+                pass
+
+
+def serve_status(service, port, host='127.0.0.1'):
+    """Serve service.status() as JSON over HTTP on a background thread; returns the server"""
+
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(service.status()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), StatusHandler)
+    threading.Thread(target=server.serve_forever, name='watch-status', daemon=True).start()
+    return server
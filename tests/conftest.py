@@ -0,0 +1,16 @@
+import os
+
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def make_image(tmp_path):
+    """Write a small noisy image under tmp_path and return its path"""
+    def make(name, size=(64, 48), fmt=None, seed=0):
+        path = tmp_path / name
+        os.makedirs(path.parent, exist_ok=True)
+        img = Image.effect_noise(size, 40 + seed).convert('RGB')
+        img.save(path, format=fmt)
+        return str(path)
+    return make
@@ -0,0 +1,90 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+from PIL import Image
+
+from imagecompressor.archive import ArchiveCompressor, iter_members, member_path
+
+SETTINGS = {'quality': 70, 'max_width': 32, 'max_height': 32, 'output_layout': 'mirror'}
+
+
+def members(make_image):
+    """(name, data) pairs as an archive might hold them, including unsafe names"""
+    entries = []
+    for index, name in enumerate(['photos/a.png', '../escape.png', '/abs/b.jpg']):
+        path = make_image(f"src/{index}{os.path.splitext(name)[1]}", seed=index)
+        with open(path, 'rb') as f:
+            entries.append((name, f.read()))
+    return entries + [('notes.txt', b'not an image')]
+
+
+def make_zip(path, entries):
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('photos/', b'')
+        for name, data in entries:
+            archive.writestr(zipfile.ZipInfo(name), data)
+    return str(path)
+
+
+def make_tar(path, entries):
+    with tarfile.open(path, 'w:gz') as archive:
+        for name, data in entries:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def opens(data):
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        return max(img.size) <= 32
+
+
+@pytest.mark.parametrize('name, safe', [
+    ('photos/a.png', 'photos/a.png'),
+    ('../../etc/a.png', 'etc/a.png'),
+    ('/abs/./b.png', 'abs/b.png'),
+    ('C:\\Users\\me\\c.png', 'Users/me/c.png'),
+    ('a/../../b.png', 'a/b.png')
+])
+def test_member_path_stays_relative(name, safe):
+    assert member_path(name) == safe
+
+
+def test_iter_members_yields_safe_image_names(make_image, tmp_path):
+    entries = members(make_image)
+    for path in (make_zip(tmp_path / 'in.zip', entries), make_tar(tmp_path / 'in.tar.gz', entries)):
+        found = list(iter_members(path))
+        assert [name for name, _ in found] == ['photos/a.png', 'escape.png', 'abs/b.jpg']
+        assert [data for _, data in found] == [data for _, data in entries[:3]]
+        assert [name for name, _ in iter_members(path, exclude=['photos/*'])] == ['escape.png', 'abs/b.jpg']
+
+
+def test_zip_to_zip(make_image, tmp_path):
+    source = make_zip(tmp_path / 'in.zip', members(make_image))
+    output = str(tmp_path / 'out.zip')
+    results = ArchiveCompressor(output, dict(SETTINGS, workers=1)).run(iter_members(source))
+    assert all(result['error'] is None for result in results)
+    expected = ['photos/a_compressed.png', 'escape_compressed.png', 'abs/b_compressed.jpg']
+    assert [result['output_path'] for result in results] == expected
+    with zipfile.ZipFile(output) as archive:
+        assert archive.namelist() == expected
+        assert all(opens(archive.read(name)) for name in expected)
+    assert sorted(os.listdir(tmp_path)) == ['in.zip', 'out.zip', 'src']
+
+
+def test_tar_to_folder(make_image, tmp_path):
+    source = make_tar(tmp_path / 'in.tar.gz', members(make_image))
+    output = tmp_path / 'out'
+    results = ArchiveCompressor(str(output), dict(SETTINGS, workers=2)).run(iter_members(source))
+    assert [result['output_path'] for result in results] == [
+        str(output / 'photos' / 'a_compressed.png'), str(output / 'escape_compressed.png'),
+        str(output / 'abs' / 'b_compressed.jpg')]
+    for result in results:
+        with open(result['output_path'], 'rb') as f:
+            assert opens(f.read())
+    assert sorted(os.listdir(tmp_path)) == ['in.tar.gz', 'out', 'src']
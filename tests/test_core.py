@@ -0,0 +1,100 @@
+import io
+import threading
+
+import pytest
+from PIL import Image
+
+from imagecompressor.core import (compress, encode_image, encode_smallest, get_save_kwargs, open_image, quality_probes,
+                                  resolve_settings, search_quality_for_size)
+
+
+@pytest.fixture
+def pillow_limit(monkeypatch):
+    """Shrink Pillow's own pixel limit so small test images count as very large"""
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    return 1000
+
+
+def test_setting_replaces_pillows_pixel_limit(make_image, pillow_limit):
+    path = make_image('big.png', size=(64, 48))
+    with pytest.raises(ValueError, match='max_image_pixels'):
+        open_image(path, {'max_image_pixels': 1500})
+    with open_image(path, {'max_image_pixels': 0}) as img:
+        assert img.size == (64, 48)
+    with open_image(path, {'max_image_pixels': 64 * 48}) as img:
+        img.load()
+    assert Image.MAX_IMAGE_PIXELS == pillow_limit
+
+
+def test_setting_also_refuses_images_within_pillows_limit(make_image):
+    path = make_image('photo.png', size=(64, 48))
+    with pytest.raises(ValueError, match='max_image_pixels'):
+        open_image(path, {'max_image_pixels': 64 * 48 - 1})
+    with pytest.raises(ValueError, match='max_image_pixels'):
+        compress(path, path + '.out.png', {'max_image_pixels': 100})
+
+
+def test_overlapping_opens_restore_pillows_limit(make_image, pillow_limit):
+    path = make_image('big.png', size=(64, 48))
+    errors = []
+
+    def open_many():
+        try:
+            for _ in range(50):
+                open_image(path, {'max_image_pixels': 0}).close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert Image.MAX_IMAGE_PIXELS == pillow_limit
+
+
+def jpeg_size(img, quality):
+    return len(encode_image(img, 'JPEG', get_save_kwargs('JPEG', resolve_settings({'quality': quality}), None,
+                                                         img.mode)))
+
+
+def test_quality_search_finds_the_highest_fitting_quality(make_image):
+    settings = resolve_settings({'quality': 90})
+    with Image.open(make_image('photo.png', size=(256, 192))) as img:
+        img.load()
+    target = (jpeg_size(img, 60) + jpeg_size(img, 61)) // 2
+    data, quality, probes, fits = search_quality_for_size(img, 'JPEG', settings, target)
+    assert fits and len(data) <= target
+    assert quality == 60
+    assert probes <= quality_probes(90)
+
+
+def test_quality_search_returns_the_lowest_quality_when_nothing_fits(make_image):
+    settings = resolve_settings({'quality': 90})
+    with Image.open(make_image('photo.png', size=(256, 192))) as img:
+        img.load()
+    data, quality, probes, fits = search_quality_for_size(img, 'JPEG', settings, 100)
+    assert not fits
+    assert len(data) == jpeg_size(img, 1) > 100
+    # The lowest qualities can encode to the same size; the higher of them is kept
+    assert jpeg_size(img, quality) == jpeg_size(img, 1)
+
+
+def test_smallest_keeps_the_smallest_candidate(make_image):
+    with Image.open(make_image('photo.png')) as img:
+        img.load()
+    output_format, data, details = encode_smallest(img, resolve_settings({'format': 'smallest'}))
+    assert set(details['candidates']) == {'JPEG', 'WEBP', 'PNG'}
+    assert len(data) == min(details['candidates'].values()) == details['candidates'][output_format]
+
+
+def test_smallest_never_picks_jpeg_for_transparent_images(make_image):
+    with Image.open(make_image('photo.png')) as img:
+        img = img.convert('RGBA')
+    img.putalpha(128)
+    output_format, data, details = encode_smallest(img, resolve_settings({'format': 'smallest', 'quality': 5}))
+    assert 'JPEG' not in details['candidates']
+    assert output_format in ('WEBP', 'PNG')
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert decoded.convert('RGBA').getextrema()[3] != (255, 255)
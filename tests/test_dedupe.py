@@ -0,0 +1,92 @@
+import os
+import random
+import shutil
+
+from PIL import Image
+
+from imagecompressor import dedupe
+from imagecompressor.dedupe import difference_hash, find_duplicates, link_output
+
+
+def blocks(tmp_path, name, seed, size=(180, 160), **save_kwargs):
+    """An image of 9x8 flat blocks, resized to size; same seed, same picture"""
+    rng = random.Random(seed)
+    img = Image.new('L', (9, 8))
+    img.putdata([rng.randrange(256) for _ in range(72)])
+    path = tmp_path / name
+    img.convert('RGB').resize((180, 160), Image.Resampling.NEAREST).resize(size).save(path, **save_kwargs)
+    return str(path)
+
+
+def copy(path, name):
+    target = os.path.join(os.path.dirname(path), name)
+    shutil.copyfile(path, target)
+    return target
+
+
+def test_exact_copies_map_to_the_first(tmp_path):
+    original = blocks(tmp_path, 'a.png', 0)
+    first_copy = copy(original, 'b.png')
+    second_copy = copy(original, 'c.png')
+    other = blocks(tmp_path, 'd.png', 1)
+    paths = [original, first_copy, other, second_copy]
+    assert find_duplicates(paths) == {first_copy: original, second_copy: original}
+    assert find_duplicates(paths, mode='off') == {}
+
+
+def test_same_size_files_need_the_same_contents(tmp_path):
+    first = tmp_path / 'a.bin'
+    second = tmp_path / 'b.bin'
+    first.write_bytes(b'x' * 100)
+    second.write_bytes(b'y' * 100)
+    assert find_duplicates([str(first), str(second)]) == {}
+
+
+def test_near_duplicates_follow_the_largest_image(tmp_path):
+    large = blocks(tmp_path, 'large.png', 0)
+    small = blocks(tmp_path, 'small.jpg', 0, size=(90, 80), quality=70)
+    small_copy = copy(small, 'small_copy.jpg')
+    other = blocks(tmp_path, 'other.png', 1)
+    paths = [small, other, large, small_copy]
+    assert find_duplicates(paths, mode='exact') == {small_copy: small}
+    assert find_duplicates(paths, mode='near') == {small: large, small_copy: large}
+
+
+def test_hash_distance_separates_different_images(tmp_path):
+    def hashed(path):
+        with Image.open(path) as img:
+            return difference_hash(img)
+    large = hashed(blocks(tmp_path, 'large.png', 0))
+    small = hashed(blocks(tmp_path, 'small.jpg', 0, size=(90, 80), quality=70))
+    other = hashed(blocks(tmp_path, 'other.png', 1))
+    assert bin(large ^ small).count('1') <= 4 < bin(large ^ other).count('1')
+
+
+def test_near_search_without_numpy(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedupe, 'np', None)
+    large = blocks(tmp_path, 'large.png', 0)
+    small = blocks(tmp_path, 'small.jpg', 0, size=(90, 80), quality=70)
+    assert find_duplicates([small, large], mode='near') == {small: large}
+
+
+def test_link_output_shares_the_file(tmp_path):
+    source = tmp_path / 'photo_compressed.jpg'
+    source.write_bytes(b'compressed')
+    output = str(tmp_path / 'copy_compressed.jpg')
+    assert link_output(str(source), output) == 'hardlink'
+    assert os.path.samefile(str(source), output)
+    assert link_output(str(source), output) == 'same'
+    assert sorted(os.listdir(tmp_path)) == ['copy_compressed.jpg', 'photo_compressed.jpg']
+
+
+def test_link_output_copies_when_links_fail(tmp_path, monkeypatch):
+    def no_links(source, target):
+        raise OSError(18, 'Invalid cross-device link')
+    monkeypatch.setattr(os, 'link', no_links)
+    source = tmp_path / 'photo_compressed.jpg'
+    source.write_bytes(b'compressed')
+    output = tmp_path / 'copy_compressed.jpg'
+    output.write_bytes(b'stale')
+    assert link_output(str(source), str(output)) == 'copy'
+    assert output.read_bytes() == b'compressed'
+    assert not os.path.samefile(str(source), str(output))
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from imagecompressor.core import compress, resolve_settings
+from imagecompressor.estimate import estimate_compressed_size
+from imagecompressor.preview import make_proxy
+
+SETTINGS = {'max_width': 480, 'max_height': 480, 'quality': 80}
+
+
+def actual_size(path, settings):
+    output = path + '.out'
+    result = compress(path, output, settings)
+    assert result['compressed_size'] == os.path.getsize(result['output_path'])
+    return result
+
+
+@pytest.mark.parametrize('fmt', ['JPEG', 'WEBP', 'PNG'])
+def test_estimate_is_within_its_error_bound(make_image, fmt):
+    path = make_image(f"photo_{fmt}.png", size=(960, 720))
+    settings = dict(SETTINGS, format=fmt)
+    estimate = estimate_compressed_size(path, settings)
+    result = actual_size(path, settings)
+    assert (estimate['width'], estimate['height'], estimate['format']) == (result['width'], result['height'], fmt)
+    assert abs(estimate['size'] - result['compressed_size']) <= estimate['error'] * result['compressed_size']
+
+
+def test_estimate_from_the_preview_proxy(make_image):
+    path = make_image('photo.jpg', size=(960, 720))
+    settings = resolve_settings(dict(SETTINGS, format='JPEG'))
+    proxy, _ = make_proxy(path, settings)
+    estimate = estimate_compressed_size(path, settings, proxy=proxy)
+    result = actual_size(path, settings)
+    assert (estimate['width'], estimate['height']) == proxy.size == (result['width'], result['height'])
+    assert abs(estimate['size'] - result['compressed_size']) <= estimate['error'] * result['compressed_size']
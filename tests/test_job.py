@@ -0,0 +1,138 @@
+import json
+import os
+
+from imagecompressor.batch import BatchCompressor
+from imagecompressor.events import LOG, EventBus, EventQueue
+from imagecompressor.job import JOURNAL_NAME, JobControl, Journal
+
+SETTINGS = {'quality': 70, 'max_width': 32, 'max_height': 32, 'workers': 1}
+
+
+def finished(make_image, tmp_path, name):
+    """Result of a file the interrupted run got through, with its output on disk"""
+    source = make_image(f"in/{name}")
+    output = tmp_path / 'out' / name
+    os.makedirs(output.parent, exist_ok=True)
+    output.write_bytes(b'compressed')
+    return {'input_path': source, 'output_path': str(output), 'original_size': os.path.getsize(source),
+            'compressed_size': len(b'compressed'), 'error': None}
+
+
+def interrupted(tmp_path, results, settings=SETTINGS):
+    """Leave a journal behind the way a cancelled or crashed run does"""
+    journal = Journal(str(tmp_path / 'out'), settings)
+    journal.open()
+    for result in results:
+        journal.record(result)
+    journal.close()
+    return journal.path
+
+
+def test_same_settings_resume(make_image, tmp_path):
+    done = finished(make_image, tmp_path, 'a.png')
+    interrupted(tmp_path, [done])
+    journal = Journal(str(tmp_path / 'out'), dict(SETTINGS, workers=4))
+    assert journal.open() == 1
+    resumed = journal.lookup(done['input_path'])
+    assert resumed['resumed'] and resumed['error'] is None
+    assert resumed['output_path'] == done['output_path']
+    assert journal.lookup(str(tmp_path / 'in' / 'b.png')) is None
+    journal.close()
+
+
+def test_other_settings_start_fresh(make_image, tmp_path):
+    done = finished(make_image, tmp_path, 'a.png')
+    path = interrupted(tmp_path, [done])
+    journal = Journal(str(tmp_path / 'out'), dict(SETTINGS, quality=71))
+    assert journal.open() == 0
+    assert journal.lookup(done['input_path']) is None
+    journal.close()
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])['fingerprint'] == journal.fingerprint
+
+
+def test_resume_off_starts_fresh(make_image, tmp_path):
+    interrupted(tmp_path, [finished(make_image, tmp_path, 'a.png')])
+    journal = Journal(str(tmp_path / 'out'), SETTINGS)
+    assert journal.open(resume=False) == 0
+    journal.close()
+
+
+def test_missing_output_is_not_resumed(make_image, tmp_path):
+    done = finished(make_image, tmp_path, 'a.png')
+    interrupted(tmp_path, [done])
+    os.remove(done['output_path'])
+    journal = Journal(str(tmp_path / 'out'), SETTINGS)
+    assert journal.open() == 1
+    assert journal.lookup(done['input_path']) is None
+    journal.close()
+
+
+def test_torn_last_line_is_tolerated(make_image, tmp_path):
+    first = finished(make_image, tmp_path, 'a.png')
+    path = interrupted(tmp_path, [first])
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"input_path": "/in/b.p')
+
+    second = finished(make_image, tmp_path, 'c.png')
+    journal = Journal(str(tmp_path / 'out'), SETTINGS)
+    assert journal.open() == 1
+    journal.record(second)
+    journal.close()
+
+    journal = Journal(str(tmp_path / 'out'), SETTINGS)
+    assert journal.open() == 2
+    assert journal.lookup(first['input_path']) and journal.lookup(second['input_path'])
+    journal.close()
+
+
+def test_finish_removes_the_journal(tmp_path):
+    journal = Journal(str(tmp_path / 'out'), SETTINGS)
+    journal.open()
+    journal.finish()
+    assert not os.path.exists(os.path.join(str(tmp_path / 'out'), JOURNAL_NAME))
+
+
+def test_cancelled_batch_resumes_where_it_stopped(make_image, tmp_path):
+    paths = [make_image(f"in/img{index}.png", seed=index) for index in range(4)]
+    output_dir = str(tmp_path / 'out')
+    control = JobControl()
+
+    def cancel_after_first(processed, total, result):
+        control.cancel()
+
+    journal = Journal(output_dir, SETTINGS)
+    journal.open()
+    first = BatchCompressor(output_dir, SETTINGS, journal=journal, control=control).run(
+        paths, progress_callback=cancel_after_first)
+    journal.close()
+    done = [result['input_path'] for result in first if result and not result.get('error')]
+    assert 0 < len(done) < len(paths)
+    assert os.path.exists(journal.path)
+
+    journal = Journal(output_dir, SETTINGS)
+    assert journal.open() == len(done)
+    second = BatchCompressor(output_dir, SETTINGS, journal=journal).run(paths)
+    assert [result['input_path'] for result in second if result.get('resumed')] == done
+    assert all(result['error'] is None and os.path.exists(result['output_path']) for result in second)
+    assert not os.path.exists(journal.path)
+
+
+def test_journal_write_errors_do_not_stop_the_batch(make_image, tmp_path):
+    paths = [make_image(f"in/img{index}.png", seed=index) for index in range(3)]
+    output_dir = str(tmp_path / 'out')
+    journal = Journal(output_dir, SETTINGS)
+    journal.open()
+
+    def fail(result):
+        raise OSError(28, 'No space left on device')
+    journal.record = fail
+    events = EventBus()
+    received = events.subscribe(EventQueue())
+    results = BatchCompressor(output_dir, SETTINGS, journal=journal, events=events).run(paths)
+    assert all(result['error'] is None and os.path.exists(result['output_path']) for result in results)
+    logged = [event for event in received.drain() if event['event'] == LOG]
+    assert len(logged) == len(paths)
+    assert 'No space left on device' in logged[0]['message']
@@ -0,0 +1,163 @@
+import multiprocessing
+import time
+
+import pytest
+
+from imagecompressor import jobqueue
+from imagecompressor.core import settings_fingerprint
+
+SETTINGS = {'quality': 70, 'max_width': 32, 'max_height': 32}
+
+
+@pytest.fixture(params=['directory', 'sqlite'])
+def queue_path(request, tmp_path):
+    name = 'queue' if request.param == 'directory' else 'queue.sqlite'
+    return str(tmp_path / name)
+
+
+def submit_images(queue_path, make_image, tmp_path, count, batch_size=2, lease_ttl=60.0):
+    paths = [make_image(f"in/img{index}.png", seed=index) for index in range(count)]
+    queue = jobqueue.open_queue(queue_path)
+    added, settled = jobqueue.submit(queue, paths, str(tmp_path / 'out'), SETTINGS, batch_size=batch_size,
+                                     lease_ttl=lease_ttl)
+    assert (added, settled) == (count, [])
+    return queue, paths
+
+
+def run_worker(queue_path):
+    jobqueue.QueueWorker(jobqueue.open_queue(queue_path), poll_interval=0.05).run()
+
+
+def test_open_queue_picks_backend_by_suffix():
+    assert isinstance(jobqueue.open_queue('jobs.sqlite'), jobqueue.SQLiteQueue)
+    assert isinstance(jobqueue.open_queue('jobs.db'), jobqueue.SQLiteQueue)
+    assert isinstance(jobqueue.open_queue('jobs'), jobqueue.DirectoryQueue)
+
+
+def test_submit_stores_settings_and_plans_outputs(queue_path, make_image, tmp_path):
+    queue, paths = submit_images(queue_path, make_image, tmp_path, 3)
+    meta = queue.meta()
+    assert meta['fingerprint'] == settings_fingerprint(SETTINGS)
+    assert meta['batch_size'] == 2
+    planned = dict(queue.planned())
+    assert sorted(planned) == sorted(paths)
+    assert planned[paths[0]] == str(tmp_path / 'out' / 'img0_compressed.png')
+    assert queue.counts() == {'queued': 3, 'leased': 0, 'done': 0, 'failed': 0}
+
+
+def test_resubmit_adds_only_new_inputs(queue_path, make_image, tmp_path):
+    queue, paths = submit_images(queue_path, make_image, tmp_path, 2)
+    extra = make_image('in/extra.png', seed=9)
+    added, _ = jobqueue.submit(queue, paths + [extra], str(tmp_path / 'out'), SETTINGS)
+    assert added == 1
+    assert queue.counts()['queued'] == 3
+
+
+def test_resubmit_with_other_settings_is_refused(queue_path, make_image, tmp_path):
+    queue, paths = submit_images(queue_path, make_image, tmp_path, 1)
+    with pytest.raises(ValueError):
+        jobqueue.submit(queue, paths, str(tmp_path / 'out'), dict(SETTINGS, quality=50))
+
+
+def test_same_names_follow_the_collision_policy(queue_path, make_image, tmp_path):
+    first = make_image('a/photo.png')
+    second = make_image('b/photo.png', seed=1)
+    queue = jobqueue.open_queue(queue_path)
+    added, settled = jobqueue.submit(queue, [first, second], str(tmp_path / 'out'),
+                                     dict(SETTINGS, collision='skip'))
+    assert added == 1
+    assert settled[0]['input_path'] == second
+    assert settled[0]['skipped']
+
+
+def test_leases_hand_out_disjoint_batches(queue_path, make_image, tmp_path):
+    queue, paths = submit_images(queue_path, make_image, tmp_path, 5)
+    leases = [queue.lease(f"w{number}", 'node1', 2, 60) for number in range(3)]
+    assert sorted(len(tasks) for _, tasks in leases) == [1, 2, 2]
+    assert len({lease for lease, _ in leases}) == 3
+    leased = [task['input_path'] for _, tasks in leases for task in tasks]
+    assert sorted(leased) == sorted(paths)
+    assert queue.lease('w3', 'node1', 2, 60) is None
+    assert queue.counts() == {'queued': 0, 'leased': 5, 'done': 0, 'failed': 0}
+
+
+def test_heartbeat_keeps_the_lease(queue_path, make_image, tmp_path):
+    queue, _ = submit_images(queue_path, make_image, tmp_path, 2)
+    lease, tasks = queue.lease('w1', 'node1', 2, 0.3)
+    for _ in range(4):
+        time.sleep(0.1)
+        assert queue.heartbeat(lease, 0.3)
+    assert queue.lease('w2', 'node1', 2, 0.3) is None
+    assert queue.counts()['leased'] == 2
+
+
+def test_expired_lease_is_requeued(queue_path, make_image, tmp_path):
+    queue, _ = submit_images(queue_path, make_image, tmp_path, 2)
+    stale, tasks = queue.lease('w1', 'node1', 2, 0.05)
+    time.sleep(0.1)
+    lease, retried = queue.lease('w2', 'node2', 2, 60)
+    assert sorted(task['input_path'] for task in retried) == sorted(task['input_path'] for task in tasks)
+    # The first worker lost its lease and can no longer record results
+    assert not queue.heartbeat(stale, 60)
+    assert not queue.complete(stale, [])
+    records = [dict(task, error=None, original_size=10, compressed_size=5, worker='w2', node='node2',
+                    started_at=time.time(), finished_at=time.time(), seconds=0.01) for task in retried]
+    assert queue.complete(lease, records)
+    assert queue.counts() == {'queued': 0, 'leased': 0, 'done': 2, 'failed': 0}
+
+
+def test_files_fail_after_max_attempts(queue_path, make_image, tmp_path):
+    queue, _ = submit_images(queue_path, make_image, tmp_path, 2)
+    for _ in range(jobqueue.MAX_ATTEMPTS):
+        assert queue.lease('w1', 'node1', 2, 0.05) is not None
+        time.sleep(0.1)
+    assert queue.lease('w1', 'node1', 2, 0.05) is None
+    assert queue.counts() == {'queued': 0, 'leased': 0, 'done': 0, 'failed': 2}
+    errors = {record['error'] for record in queue.records()}
+    assert errors == {jobqueue.expired_error(jobqueue.MAX_ATTEMPTS)}
+
+
+def test_worker_checks_the_settings_fingerprint(queue_path, make_image, tmp_path):
+    queue, _ = submit_images(queue_path, make_image, tmp_path, 1)
+    meta = dict(queue.meta(), fingerprint='0' * 16)
+    with pytest.raises(ValueError):
+        jobqueue.check_meta(meta)
+
+
+def test_local_workers_drain_the_queue(queue_path, make_image, tmp_path):
+    queue, paths = submit_images(queue_path, make_image, tmp_path, 6)
+    bad = tmp_path / 'in' / 'bad.png'
+    bad.write_bytes(b'not an image')
+    jobqueue.submit(queue, [str(bad)], str(tmp_path / 'out'), SETTINGS)
+
+    workers = [multiprocessing.Process(target=run_worker, args=(queue_path,)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    assert queue.counts() == {'queued': 0, 'leased': 0, 'done': 6, 'failed': 1}
+    for _, output_path in queue.planned():
+        if 'bad' not in output_path:
+            assert (tmp_path / 'out' / output_path).exists()
+
+
+def test_status_reports_totals_and_nodes(queue_path, make_image, tmp_path):
+    queue, paths = submit_images(queue_path, make_image, tmp_path, 4)
+    processed = []
+    worker = jobqueue.QueueWorker(queue, progress_callback=processed.append)
+    stats = worker.run()
+    assert stats['processed'] == 4 and stats['failed'] == 0
+    assert {record['input_path'] for record in processed} == set(paths)
+
+    status = jobqueue.queue_status(queue)
+    assert status['total'] == status['done'] == 4
+    assert status['original_bytes'] > status['compressed_bytes'] > 0
+    assert status['files_per_minute'] > 0
+    assert status['eta_seconds'] == 0
+    node = status['nodes'][worker.node]
+    assert node['files'] == 4
+    assert node['failed'] == 0
+    assert node['workers'] == 1
+    assert node['original_bytes'] == status['original_bytes']
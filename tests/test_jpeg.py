@@ -0,0 +1,86 @@
+import io
+
+from PIL import ExifTags, Image
+
+from imagecompressor.core import compress
+from imagecompressor.jpeg import optimize_losslessly
+from imagecompressor.metadata import orientation_exif
+
+SETTINGS = {'keep_exif': True, 'progressive': False}
+
+
+def jpeg_bytes(size=(64, 48), seed=0, **save_kwargs):
+    buffer = io.BytesIO()
+    Image.effect_noise(size, 40 + seed).convert('RGB').save(buffer, 'JPEG', quality=90, optimize=True,
+                                                             **save_kwargs)
+    return buffer.getvalue()
+
+
+def camera_exif(orientation=1):
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = orientation
+    exif[ExifTags.Base.Make] = 'TestCamera'
+    exif[ExifTags.IFD.GPSInfo] = {ExifTags.GPS.GPSLatitudeRef: 'N', ExifTags.GPS.GPSLatitude: (52.0, 31.0, 12.0)}
+    return exif.tobytes()
+
+
+def pixels(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.convert('RGB').tobytes()
+
+
+def test_stripping_is_kept_even_when_not_smaller():
+    # The comment goes, but the orientation block that replaces it is larger
+    data = jpeg_bytes(comment=b'secret')
+    metadata = {'exif': orientation_exif(6), 'xmp': None, 'icc_profile': None, 'removed': 0}
+    optimized, method = optimize_losslessly(data, metadata, dict(SETTINGS, keep_exif=False))
+    assert len(optimized) >= len(data)
+    assert method != 'copied'
+    assert b'secret' not in optimized
+    assert pixels(optimized) == pixels(data)
+
+
+def test_unchanged_files_are_copied_when_nothing_is_stripped():
+    data = jpeg_bytes()
+    metadata = {'exif': None, 'xmp': None, 'icc_profile': None, 'removed': 0}
+    optimized, method = optimize_losslessly(data, metadata, SETTINGS)
+    assert (optimized, method) == (data, 'copied')
+
+
+def test_lossless_mode_keeps_the_decoded_pixels(tmp_path):
+    source = tmp_path / 'photo.jpg'
+    source.write_bytes(jpeg_bytes(exif=camera_exif(), comment=b'secret'))
+    output = str(tmp_path / 'photo_compressed.jpg')
+    result = compress(str(source), output, {'jpeg_lossless': True})
+    assert result['lossless']
+    with open(output, 'rb') as f:
+        data = f.read()
+    assert pixels(data) == pixels(source.read_bytes())
+    with Image.open(output) as img:
+        assert img.getexif()[ExifTags.Base.Make] == 'TestCamera'
+
+
+def test_lossless_mode_really_strips_metadata(tmp_path):
+    source = tmp_path / 'photo.jpg'
+    source.write_bytes(jpeg_bytes(exif=camera_exif(), comment=b'secret'))
+    output = str(tmp_path / 'photo_compressed.jpg')
+    result = compress(str(source), output, {'jpeg_lossless': True, 'keep_exif': False})
+    assert result['lossless']
+    with open(output, 'rb') as f:
+        data = f.read()
+    assert pixels(data) == pixels(source.read_bytes())
+    assert b'TestCamera' not in data and b'secret' not in data
+    with Image.open(output) as img:
+        exif = img.getexif()
+        assert ExifTags.Base.Make not in exif
+        assert not exif.get_ifd(ExifTags.IFD.GPSInfo)
+
+
+def test_lossless_mode_keeps_the_orientation_of_stripped_files(tmp_path):
+    source = tmp_path / 'photo.jpg'
+    source.write_bytes(jpeg_bytes(exif=camera_exif(orientation=6)))
+    output = str(tmp_path / 'photo_compressed.jpg')
+    compress(str(source), output, {'jpeg_lossless': True, 'keep_exif': False})
+    with Image.open(output) as img:
+        assert img.size == (64, 48)
+        assert dict(img.getexif()) == {ExifTags.Base.Orientation: 6}
@@ -0,0 +1,179 @@
+import os
+import sqlite3
+
+from imagecompressor.manifest import MANIFEST_NAME, Manifest
+
+SETTINGS = {'quality': 70}
+
+
+def compressed(make_image, tmp_path, name='photo.png'):
+    """A source image, a stand-in output and the result that produced it"""
+    source = make_image(f"in/{name}")
+    output = tmp_path / 'out' / f"{os.path.splitext(name)[0]}_compressed.png"
+    os.makedirs(output.parent, exist_ok=True)
+    output.write_bytes(b'compressed')
+    return source, str(output), {'input_path': source, 'output_path': str(output), 'format': 'PNG',
+                                 'width': 64, 'height': 48}
+
+
+def reopen(tmp_path, settings=SETTINGS, use_hash=False):
+    return Manifest(str(tmp_path / 'out'), settings, use_hash=use_hash)
+
+
+def record(tmp_path, result, use_hash=False):
+    manifest = reopen(tmp_path, use_hash=use_hash)
+    manifest.record(result)
+    manifest.close()
+
+
+def touch(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 5 * 10**9))
+
+
+def test_unchanged_source_is_answered_from_the_manifest(make_image, tmp_path):
+    source, output, result = compressed(make_image, tmp_path)
+    manifest = reopen(tmp_path)
+    assert manifest.lookup(source) is None
+    manifest.record(result)
+    manifest.close()
+
+    cached = reopen(tmp_path).lookup(source)
+    assert cached['cached'] and cached['error'] is None
+    assert cached['output_path'] == output
+    assert cached['compressed_size'] == len(b'compressed')
+    assert cached['original_size'] == os.path.getsize(source)
+
+
+def test_runtime_settings_keep_the_fingerprint(make_image, tmp_path):
+    source, _, result = compressed(make_image, tmp_path)
+    record(tmp_path, result)
+    assert reopen(tmp_path, dict(SETTINGS, workers=1, incremental=True)).lookup(source) is not None
+
+
+def test_other_settings_miss(make_image, tmp_path):
+    source, _, result = compressed(make_image, tmp_path)
+    record(tmp_path, result)
+    assert reopen(tmp_path, dict(SETTINGS, quality=71)).lookup(source) is None
+
+
+def test_changed_source_misses(make_image, tmp_path):
+    source, _, result = compressed(make_image, tmp_path)
+    manifest = reopen(tmp_path)
+    manifest.record(result)
+    make_image('in/photo.png', size=(80, 60), seed=1)
+    assert manifest.lookup(source) is None
+
+
+def test_missing_or_changed_output_misses(make_image, tmp_path):
+    source, output, result = compressed(make_image, tmp_path)
+    manifest = reopen(tmp_path)
+    manifest.record(result)
+    with open(output, 'ab') as f:
+        f.write(b'!')
+    assert manifest.lookup(source) is None
+    os.remove(output)
+    assert manifest.lookup(source) is None
+
+
+def test_touched_source_needs_the_content_hash(make_image, tmp_path):
+    source, _, result = compressed(make_image, tmp_path)
+    record(tmp_path, result)
+    touch(source)
+    assert reopen(tmp_path).lookup(source) is None
+
+    record(tmp_path, result, use_hash=True)
+    touch(source)
+    manifest = reopen(tmp_path, use_hash=True)
+    assert manifest.lookup(source) is not None
+    # The new mtime was stored, so the next lookup needs no hashing
+    manifest.close()
+    assert reopen(tmp_path).lookup(source) is not None
+
+
+def test_hash_is_backfilled_for_entries_recorded_without_it(make_image, tmp_path):
+    source, _, result = compressed(make_image, tmp_path)
+    record(tmp_path, result)
+    manifest = reopen(tmp_path, use_hash=True)
+    assert manifest.lookup(source) is not None
+    manifest.close()
+    touch(source)
+    assert reopen(tmp_path, use_hash=True).lookup(source) is not None
+
+
+def test_superseded_output_is_removed(make_image, tmp_path):
+    source, output, result = compressed(make_image, tmp_path)
+    manifest = reopen(tmp_path)
+    manifest.record(result)
+    renamed = tmp_path / 'out' / 'photo_compressed.jpg'
+    renamed.write_bytes(b'jpeg')
+    manifest.record(dict(result, output_path=str(renamed), format='JPEG'))
+    assert not os.path.exists(output)
+    assert manifest.outputs() == [(source, str(renamed))]
+
+
+def test_prune_removes_outputs_of_deleted_sources(make_image, tmp_path):
+    source, output, result = compressed(make_image, tmp_path)
+    kept_source, kept_output, kept = compressed(make_image, tmp_path, 'other.png')
+    manifest = reopen(tmp_path)
+    manifest.record(result)
+    manifest.record(kept)
+    os.remove(source)
+    assert manifest.prune(dry_run=True) == [output]
+    assert os.path.exists(output)
+    assert manifest.prune() == [output]
+    assert not os.path.exists(output)
+    assert manifest.outputs() == [(kept_source, kept_output)]
+
+
+def variants_result(make_image, tmp_path):
+    source = make_image('in/photo.png')
+    variants = []
+    for width, data in ((640, b'large variant'), (320, b'small')):
+        path = tmp_path / 'out' / f"photo_compressed-{width}w.jpg"
+        os.makedirs(path.parent, exist_ok=True)
+        path.write_bytes(data)
+        variants.append({'output_path': str(path), 'target_width': width, 'width': width, 'height': width // 2,
+                         'format': 'JPEG', 'compressed_size': len(data)})
+    return source, {'input_path': source, 'output_path': variants[0]['output_path'], 'format': 'JPEG',
+                    'width': 640, 'height': 320, 'variants': variants,
+                    'compressed_size': sum(variant['compressed_size'] for variant in variants)}
+
+
+def test_variants_report_their_total_size(make_image, tmp_path):
+    source, result = variants_result(make_image, tmp_path)
+    record(tmp_path, result)
+    cached = reopen(tmp_path).lookup(source)
+    assert cached['compressed_size'] == result['compressed_size']
+    assert cached['variants'] == result['variants']
+
+
+def test_every_variant_must_still_exist(make_image, tmp_path):
+    source, result = variants_result(make_image, tmp_path)
+    record(tmp_path, result)
+    os.remove(result['variants'][-1]['output_path'])
+    assert reopen(tmp_path).lookup(source) is None
+
+
+def test_prune_removes_every_variant(make_image, tmp_path):
+    source, result = variants_result(make_image, tmp_path)
+    manifest = reopen(tmp_path)
+    manifest.record(result)
+    os.remove(source)
+    paths = [variant['output_path'] for variant in result['variants']]
+    assert manifest.prune() == paths
+    assert not any(os.path.exists(path) for path in paths)
+
+
+def test_manifests_without_variants_column_are_upgraded(make_image, tmp_path):
+    source, _, result = compressed(make_image, tmp_path)
+    os.makedirs(tmp_path / 'out', exist_ok=True)
+    conn = sqlite3.connect(str(tmp_path / 'out' / MANIFEST_NAME))
+    conn.execute("CREATE TABLE entries (source_path TEXT PRIMARY KEY, source_size INTEGER NOT NULL, "
+                 "source_mtime_ns INTEGER NOT NULL, content_hash TEXT, fingerprint TEXT NOT NULL, "
+                 "output_path TEXT NOT NULL, output_size INTEGER NOT NULL, format TEXT, width INTEGER, "
+                 "height INTEGER, updated_at REAL NOT NULL)")
+    conn.commit()
+    conn.close()
+    record(tmp_path, result)
+    assert reopen(tmp_path).lookup(source) is not None
@@ -0,0 +1,48 @@
+import io
+
+from PIL import ExifTags, Image
+
+from imagecompressor.core import compress
+from imagecompressor.metadata import read_metadata
+
+
+def photo(tmp_path):
+    """A JPEG with a camera model, a GPS position and a comment"""
+    exif = Image.Exif()
+    exif[ExifTags.Base.Make] = 'TestCamera'
+    exif[ExifTags.IFD.GPSInfo] = {ExifTags.GPS.GPSLatitudeRef: 'N', ExifTags.GPS.GPSLatitude: (52.0, 31.0, 12.0)}
+    path = tmp_path / 'photo.jpg'
+    Image.effect_noise((64, 48), 40).convert('RGB').save(path, quality=90, exif=exif.tobytes(), comment=b'secret')
+    return str(path)
+
+
+def written(tmp_path, settings):
+    output = str(tmp_path / 'photo_compressed.jpg')
+    compress(photo(tmp_path), output, settings)
+    with open(output, 'rb') as f:
+        data = f.read()
+    with Image.open(io.BytesIO(data)) as img:
+        return data, img.getexif()
+
+
+def test_keep_exif_off_removes_exif_gps_and_comment(tmp_path):
+    data, exif = written(tmp_path, {'keep_exif': False})
+    assert b'TestCamera' not in data and b'secret' not in data
+    assert ExifTags.Base.Make not in exif
+    assert not exif.get_ifd(ExifTags.IFD.GPSInfo)
+
+
+def test_keep_exif_keeps_exif_gps_and_comment(tmp_path):
+    data, exif = written(tmp_path, {'keep_exif': True})
+    assert exif[ExifTags.Base.Make] == 'TestCamera'
+    assert exif.get_ifd(ExifTags.IFD.GPSInfo)[ExifTags.GPS.GPSLatitudeRef] == 'N'
+    assert b'secret' in data
+
+
+def test_removed_bytes_count_the_comment(tmp_path):
+    with Image.open(photo(tmp_path)) as img:
+        kept = read_metadata(img, {'keep_exif': True})
+        stripped = read_metadata(img, {'keep_exif': False})
+    assert kept['comment'] == b'secret'
+    assert stripped['comment'] is None
+    assert stripped['removed'] == len(kept['exif']) + len(b'secret')
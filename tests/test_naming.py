@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from imagecompressor.core import resolve_settings
+from imagecompressor.naming import NameCollision, OutputPlanner, check_template
+
+
+def planner(tmp_path, roots=None, **settings):
+    return OutputPlanner(str(tmp_path / 'out'), resolve_settings(settings), roots=roots)
+
+
+def test_suffix_numbers_later_inputs_in_order(tmp_path):
+    plan = planner(tmp_path)
+    paths = [plan.reserve(os.path.join(str(tmp_path), folder, 'photo.jpg')) for folder in ('a', 'b', 'c')]
+    out = str(tmp_path / 'out')
+    assert paths == [os.path.join(out, 'photo_compressed.jpg'), os.path.join(out, 'photo_compressed_1.jpg'),
+                     os.path.join(out, 'photo_compressed_2.jpg')]
+
+
+def test_overwrite_gives_both_inputs_the_same_path(tmp_path):
+    plan = planner(tmp_path, collision='overwrite')
+    first = plan.reserve(str(tmp_path / 'a' / 'photo.jpg'))
+    assert plan.reserve(str(tmp_path / 'b' / 'photo.jpg')) == first
+
+
+@pytest.mark.parametrize('policy', ['skip', 'fail'])
+def test_skip_and_fail_refuse_a_taken_name(tmp_path, policy):
+    plan = planner(tmp_path, collision=policy)
+    first = plan.reserve(str(tmp_path / 'a' / 'photo.jpg'))
+    with pytest.raises(NameCollision) as caught:
+        plan.reserve(str(tmp_path / 'b' / 'photo.jpg'))
+    assert caught.value.output_path == first
+    assert str(tmp_path / 'a' / 'photo.jpg') in str(caught.value)
+
+
+def test_formats_are_part_of_the_name(tmp_path):
+    # photo.jpg and photo.png only collide once both are written as JPEG
+    plan = planner(tmp_path)
+    assert plan.reserve(str(tmp_path / 'photo.jpg')).endswith('photo_compressed.jpg')
+    assert plan.reserve(str(tmp_path / 'photo.png')).endswith('photo_compressed.png')
+    plan = planner(tmp_path, format='JPEG')
+    assert plan.reserve(str(tmp_path / 'photo.jpg')).endswith('photo_compressed.jpg')
+    assert plan.reserve(str(tmp_path / 'photo.png')).endswith('photo_compressed_1.jpg')
+
+
+def test_smallest_claims_every_candidate_extension(tmp_path):
+    plan = planner(tmp_path, format='smallest', collision='skip')
+    plan.reserve(str(tmp_path / 'a' / 'photo.jpg'))
+    with pytest.raises(NameCollision):
+        plan.reserve(str(tmp_path / 'b' / 'photo.png'))
+
+
+def test_variants_reserve_their_own_files(tmp_path):
+    plan = planner(tmp_path, variant_widths=[320, 640], variant_formats=['JPEG', 'WEBP'])
+    output_path = plan.reserve(str(tmp_path / 'photo.jpg'))
+    out = str(tmp_path / 'out')
+    for name in ('photo_compressed-320w.jpg', 'photo_compressed-640w.webp'):
+        assert plan.claims(output_path, os.path.join(out, name))
+    assert not plan.claims(output_path, os.path.join(out, 'photo_compressed-1024w.jpg'))
+
+
+def test_check_existing_only_for_skip_and_fail(tmp_path):
+    existing = tmp_path / 'out' / 'photo_compressed.jpg'
+    os.makedirs(existing.parent)
+    existing.write_bytes(b'old')
+    planner(tmp_path).check_existing(str(existing))
+    planner(tmp_path, collision='overwrite').check_existing(str(existing))
+    for policy in ('skip', 'fail'):
+        with pytest.raises(NameCollision):
+            planner(tmp_path, collision=policy).check_existing(str(existing))
+    planner(tmp_path, collision='skip').check_existing(str(tmp_path / 'out' / 'other_compressed.jpg'))
+
+
+def test_hold_blocks_names_from_an_earlier_run(tmp_path):
+    plan = planner(tmp_path)
+    earlier = str(tmp_path / 'a' / 'photo.jpg')
+    plan.hold(earlier, plan.candidate_path(earlier))
+    assert plan.reserve(str(tmp_path / 'b' / 'photo.jpg')).endswith('photo_compressed_1.jpg')
+
+
+def test_mirror_layout_keeps_folders_below_the_roots(tmp_path):
+    root = tmp_path / 'photos'
+    plan = planner(tmp_path, roots=[str(root), str(root / 'trips')], output_layout='mirror')
+    out = tmp_path / 'out'
+    assert plan.reserve(str(root / 'photo.jpg')) == str(out / 'photo_compressed.jpg')
+    # The nested root wins over its parent
+    assert plan.reserve(str(root / 'trips' / 'rome' / 'photo.jpg')) == str(out / 'rome' / 'photo_compressed.jpg')
+    assert plan.reserve(str(tmp_path / 'elsewhere' / 'photo.jpg')) == str(out / 'photo_compressed_1.jpg')
+    assert os.path.isdir(out / 'rome')
+
+
+def test_template_fields(tmp_path):
+    plan = planner(tmp_path, name_template='{parent}-{stem}-q{quality}.{format}{ext}', quality=70)
+    assert plan.reserve(str(tmp_path / 'trip' / 'photo.png')) == str(tmp_path / 'out' / 'trip-photo-q70.png.png')
+
+
+@pytest.mark.parametrize('template', ['{stem}', '{name}{ext}', 'out/{stem}{ext}', '{stem{ext}'])
+def test_bad_templates_are_rejected(template):
+    with pytest.raises(ValueError):
+        check_template(template)
+
+
+def test_unknown_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        planner(tmp_path, collision='rename')
@@ -0,0 +1,49 @@
+import pytest
+from PIL import Image
+
+from imagecompressor.core import encode_image, get_save_kwargs, resolve_settings, search_quality_for_ssim
+from imagecompressor.perceptual import SSIMScorer, psnr
+
+pytest.importorskip('numpy')
+
+SETTINGS = resolve_settings({'quality': 90})
+
+
+def opened(path):
+    with Image.open(path) as img:
+        img.load()
+    return img
+
+
+def encoded(img, fmt='JPEG', **settings):
+    return encode_image(img, fmt, get_save_kwargs(fmt, dict(SETTINGS, **settings), None, img.mode))
+
+
+def test_identical_images_score_one(make_image):
+    img = opened(make_image('photo.png', size=(128, 96)))
+    assert SSIMScorer(img).score(encoded(img, 'PNG')) == pytest.approx(1.0)
+    assert psnr(img, img) == float('inf')
+
+
+def test_lower_quality_scores_lower(make_image):
+    img = opened(make_image('photo.png', size=(128, 96)))
+    scorer = SSIMScorer(img)
+    assert scorer.score(encoded(img, quality=20)) < scorer.score(encoded(img, quality=80)) < 1.0
+
+
+def test_quality_search_meets_the_ssim_target(make_image):
+    img = opened(make_image('photo.png', size=(128, 96)))
+    scorer = SSIMScorer(img)
+    min_ssim = scorer.score(encoded(img, quality=50, optimize=False, progressive=False))
+    data, quality, probes, score = search_quality_for_ssim(img, 'JPEG', SETTINGS, min_ssim)
+    assert score >= min_ssim and scorer.score(data) == pytest.approx(score)
+    assert quality < SETTINGS['quality']
+    # Output is written with the real settings, not the probe shortcuts
+    assert data == encoded(img, quality=quality)
+
+
+def test_unreachable_target_keeps_the_highest_quality(make_image):
+    img = opened(make_image('photo.png', size=(128, 96)))
+    data, quality, probes, score = search_quality_for_ssim(img, 'JPEG', SETTINGS, 0.9999)
+    assert (quality, probes) == (SETTINGS['quality'], 1)
+    assert score < 0.9999
@@ -0,0 +1,51 @@
+import io
+import random
+
+from PIL import Image
+
+from imagecompressor.png import BASELINE, encode_trial, exact_palette, reduce_image, search_png
+
+
+def few_colors(size=(64, 48), seed=0):
+    """An RGBA image of 12 colors, most of them semi-transparent"""
+    rng = random.Random(seed)
+    colors = [(rng.randrange(256), rng.randrange(256), rng.randrange(256), alpha)
+              for alpha in (0, 64, 128, 255) for _ in range(3)]
+    img = Image.new('RGBA', size)
+    img.putdata([rng.choice(colors) for _ in range(size[0] * size[1])])
+    return img
+
+
+def decoded(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.convert('RGBA')
+
+
+def test_palette_keeps_semi_transparent_pixels():
+    img = few_colors()
+    data, best, setting, details = search_png(img, {})
+    assert details['mode'] == 'P' and details['colors'] == 12
+    assert decoded(data).tobytes() == img.tobytes()
+    assert len(data) <= len(encode_trial(img, {}, *BASELINE))
+
+
+def test_search_is_never_larger_than_a_plain_optimized_save():
+    img = Image.merge('RGB', [Image.effect_noise((64, 48), 40 + band) for band in range(3)])
+    data, best, setting, details = search_png(img, {})
+    assert details['mode'] == 'RGB'
+    assert decoded(data).tobytes() == img.convert('RGBA').tobytes()
+    assert len(data) <= len(encode_trial(img, {}, *BASELINE))
+
+
+def test_opaque_alpha_and_gray_are_dropped():
+    gray = Image.effect_noise((64, 48), 40).convert('RGBA')
+    assert [info['mode'] for _, info in reduce_image(gray)] == ['L']
+    assert [info['mode'] for _, info in reduce_image(gray, gray=False)] == ['RGB', 'P']
+
+
+def test_close_colors_get_their_own_palette_entries():
+    img = Image.new('RGB', (200, 4))
+    img.putdata([(value, value + 1, value) for value in range(200)] * 4)
+    palette = exact_palette(img)
+    assert len(palette.getpalette()) // 3 == 200
+    assert palette.convert('RGB').tobytes() == img.tobytes()
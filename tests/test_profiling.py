@@ -0,0 +1,97 @@
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from imagecompressor.profiling import STAGES, ProfileReport, StageTimer
+
+
+def busy(seconds):
+    """Spend seconds of CPU time on the calling thread"""
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+def profiled(name, fmt, pixels, total, **stages):
+    """A result the way compress() returns it with profiling on"""
+    timings = {stage: {'wall': wall, 'cpu': wall / 2} for stage, wall in stages.items()}
+    timings['total'] = {'wall': total, 'cpu': total / 2}
+    return {'input_path': f"/in/{name}", 'format': fmt, 'pixels': pixels, 'original_size': 1000,
+            'compressed_size': 400, 'error': None, 'timings': timings}
+
+
+def test_stages_accumulate_within_the_total():
+    timer = StageTimer()
+    with timer.stage('decode'):
+        busy(0.02)
+    with timer.stage('decode'):
+        busy(0.02)
+    with timer.stage('encode'):
+        busy(0.01)
+    timings = timer.timings()
+    assert set(timings) == {'decode', 'encode', 'total'}
+    assert timings['decode']['wall'] >= 0.04
+    assert timings['total']['wall'] >= timings['decode']['wall'] + timings['encode']['wall']
+
+
+def test_cpu_time_includes_encoder_threads():
+    timer = StageTimer()
+    with timer.stage('encode'):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(busy, [0.05, 0.05]))
+    assert timer.timings()['encode']['cpu'] >= 0.1
+
+
+def test_untimed_cached_and_failed_results_are_skipped():
+    report = ProfileReport().extend([
+        profiled('a.jpg', 'JPEG', 10**6, 1.0, decode=0.5),
+        dict(profiled('b.jpg', 'JPEG', 10**6, 1.0), cached=True),
+        dict(profiled('c.jpg', 'JPEG', 10**6, 1.0), resumed=True),
+        dict(profiled('d.jpg', 'JPEG', 10**6, 1.0), error='broken'),
+        {'input_path': '/in/e.jpg', 'error': None}
+    ])
+    assert [row['input_path'] for row in report.rows] == ['/in/a.jpg']
+    assert report.rows[0]['resize_wall'] == 0.0
+
+
+def test_summary_lines():
+    report = ProfileReport().extend([
+        profiled('fast.jpg', 'JPEG', 2 * 10**6, 1.0, decode=0.5, encode=0.25),
+        profiled('slow.jpg', 'JPEG', 2 * 10**6, 3.0, decode=1.5, encode=0.75),
+        profiled('icon.png', 'PNG', 10**6, 2.0, encode=2.0)
+    ])
+    lines = report.summary_lines(slowest=2)
+    assert lines[0].startswith("Profile: 3 file(s), 6.00 s wall / 3.00 s CPU")
+    stage_rows = {line.split()[0]: line.split() for line in lines[2:3 + len(STAGES)]}
+    # decode 2.0 and encode 3.0 of 6.0 s, the remaining 1.0 s is 'other'
+    assert stage_rows['decode'][2] == '33.3%'
+    assert stage_rows['encode'][2] == '50.0%'
+    assert stage_rows['other'][1:3] == ['1.000', '16.7%']
+    format_rows = {line.split()[0]: line.split()[1:] for line in lines if line.split()[0] in ('JPEG', 'PNG')}
+    assert format_rows['JPEG'] == ['2', '4.0', '1.0', '0.50']
+    assert format_rows['PNG'] == ['1', '1.0', '0.5', '0.50']
+    slowest = lines[lines.index("  slowest files:") + 1:]
+    assert len(slowest) == 2
+    assert 'slow.jpg' in slowest[0] and 'icon.png' in slowest[1]
+    assert 'decode 50.0%' in slowest[0]
+
+
+def test_empty_report():
+    assert ProfileReport().summary_lines() == ["Profile: no files were compressed"]
+
+
+def test_json_and_csv_round_trip(tmp_path):
+    report = ProfileReport().extend([profiled('a.jpg', 'JPEG', 10**6, 1.0, decode=0.5, encode=0.25),
+                                     profiled('b.png', 'PNG', 2 * 10**6, 2.0, encode=1.5)])
+    report.write_json(str(tmp_path / 'profile.json'))
+    with open(tmp_path / 'profile.json', encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved == {'stages': STAGES, 'files': report.rows}
+
+    report.write_csv(str(tmp_path / 'profile.csv'))
+    with open(tmp_path / 'profile.csv', newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['input_path'] for row in rows] == ['/in/a.jpg', '/in/b.png']
+    for row, expected in zip(rows, report.rows):
+        assert {key: type(expected[key])(value) for key, value in row.items()} == expected
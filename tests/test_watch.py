@@ -0,0 +1,46 @@
+import os
+import threading
+import time
+
+from imagecompressor.events import FILE_DONE, EventBus, EventQueue
+from imagecompressor.manifest import MANIFEST_NAME
+from imagecompressor.watch import WatchService
+
+SETTINGS = {'quality': 70, 'max_width': 32, 'max_height': 32}
+
+
+def wait_for(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_polling_compresses_each_dropped_file_once(make_image, tmp_path):
+    watched = tmp_path / 'in'
+    output_dir = watched / 'out'
+    os.makedirs(watched)
+    events = EventBus()
+    received = events.subscribe(EventQueue())
+    service = WatchService([str(watched)], str(output_dir), SETTINGS, workers=1, events=events,
+                           poll_interval=0.05, settle=0.1, use_polling=True)
+    thread = threading.Thread(target=service.run)
+    thread.start()
+    done = []
+    try:
+        make_image('in/photo.png')
+        wait_for(lambda: done.extend(event for event in received.drain() if event['event'] == FILE_DONE) or done)
+        output = output_dir / 'photo_compressed.png'
+        assert done[0]['result']['input_path'] == str(watched / 'photo.png')
+        assert done[0]['result']['output_path'] == str(output)
+        assert output.exists()
+
+        # Several more scans see the unchanged source and the output inside the watched folder
+        time.sleep(0.5)
+        done.extend(event for event in received.drain() if event['event'] == FILE_DONE)
+        assert len(done) == 1
+    finally:
+        service.stop()
+        thread.join()
+    assert service.status()['processed'] == 1
+    assert sorted(os.listdir(output_dir)) == [MANIFEST_NAME, 'photo_compressed.png']